@@ -9,6 +9,7 @@ from matplotlib import pyplot as plt
 from numpy import array
 
 from helpers.setup_logging import setup_logging
+from helpers.workfiles import get_workfile_name, list_workfiles, open_workfile
 
 def histogram_times(jobtimes: list, outputfile: str, tag: str = ""):
     data = array(jobtimes)
@@ -40,7 +41,7 @@ def histogram_times(jobtimes: list, outputfile: str, tag: str = ""):
 def get_jobtime_seconds(logfile: str) -> int:
     logging.info("Reading %s", logfile)
     seconds = 0
-    with open(logfile, "r") as logreader:
+    with open_workfile(logfile) as logreader:
         for line in logreader:
             if "POWHEG processing finished" in line:
                 index_total = line.index("(")+1
@@ -51,11 +52,10 @@ def get_jobtime_seconds(logfile: str) -> int:
     return seconds
 
 def find_logs(workdir: str, pattern: str) -> list:
+    # Log files can also be packed in logs.zip in the logs directory
     files = []
-    for fl in os.listdir(os.path.join(workdir, "logs")):
-        if not fl.endswith("log"):
-            continue
-        testfile = fl
+    for fl in list_workfiles(os.path.join(workdir, "logs"), "*log"):
+        testfile = get_workfile_name(fl)
         index = testfile.replace(".log", "").replace(pattern, "")
         if not index.isdigit():
             continue
@@ -66,7 +66,7 @@ def filter_times(jobtimes: list) -> list:
     return [x for x in jobtimes if x > 0]
 
 def get_jobtimes(workdir: str, pattern: str) -> list:
-    return [get_jobtime_seconds(os.path.join(workdir,"logs",x)) for x in find_logs(workdir, pattern)]
+    return [get_jobtime_seconds(x) for x in find_logs(workdir, pattern)]
 
 def process(workdir: str, pattern: str, outputfile: str, tag: str):
     histogram_times(filter_times(get_jobtimes(workdir, pattern)), outputfile, tag)
@@ -0,0 +1,63 @@
+#! /usr/bin/env python3
+
+import argparse
+import logging
+import os
+import sys
+import tempfile
+import time
+from zipfile import ZipFile
+
+from helpers.gridarchive import find_gridfiles_in_directory
+from helpers.setup_logging import setup_logging
+from helpers.zipwriter import ParallelZipWriter, get_codecs
+
+def find_benchmark_files(slotdir: str, filetype: str) -> list:
+    allfiles = sorted(os.listdir(slotdir))
+    if filetype == "grids":
+        return find_gridfiles_in_directory(slotdir)
+    if filetype == "logs":
+        return [x for x in allfiles if x.endswith(".log")]
+    return [x for x in allfiles if x.endswith(".input") and not "powheg_base" in x]
+
+def benchmark(slotdir: str, files: list, codec: str, nthreads: int, outputdir: str) -> tuple:
+    # Returns (archive size, time in seconds)
+    archivename = os.path.join(outputdir, f"benchmark_{codec}_{nthreads}.zip")
+    writer = ParallelZipWriter(archivename, "w", codec, nthreads=nthreads)
+    for benchfile in files:
+        writer.write(os.path.join(slotdir, benchfile), benchfile)
+    start = time.perf_counter()
+    writer.close()
+    elapsed = time.perf_counter() - start
+    with ZipFile(archivename, "r") as reader:
+        corrupted = reader.testzip()
+        if corrupted:
+            logging.error("Archive %s corrupted: %s", archivename, corrupted)
+        reader.close()
+    size = os.path.getsize(archivename)
+    os.remove(archivename)
+    return (size, elapsed)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("benchmark_archives.py", description="Compare compression codecs and number of threads for grid and work archives")
+    parser.add_argument("slotdir", metavar="SLOTDIR", type=str, help="Slot directory with unpacked grid, log and input files")
+    parser.add_argument("-f", "--filetype", metavar="FILETYPE", type=str, default="grids", choices=["grids", "logs", "inputs"], help="Files to be archived (grids, logs or inputs, default: grids)")
+    parser.add_argument("-c", "--codecs", metavar="CODECS", type=str, default=",".join(sorted(get_codecs().keys())), help="Comma-separated list of codecs (default: all available)")
+    parser.add_argument("-j", "--threads", metavar="THREADS", type=str, default="1,{}".format(os.cpu_count() or 1), help="Comma-separated list of numbers of threads (default: 1 and number of CPUs)")
+    parser.add_argument("-o", "--outputdir", metavar="OUTPUTDIR", type=str, default=tempfile.gettempdir(), help="Directory for the temporary archives")
+    parser.add_argument("-d", "--debug", action="store_true", help="Debug mode")
+    args = parser.parse_args()
+    setup_logging(args.debug)
+
+    slotdir = os.path.abspath(args.slotdir)
+    files = find_benchmark_files(slotdir, args.filetype)
+    if not len(files):
+        logging.error("No %s files found in %s", args.filetype, slotdir)
+        sys.exit(1)
+    inputsize = sum([os.path.getsize(os.path.join(slotdir, x)) for x in files])
+    logging.info("Benchmarking %d %s files with total size %.1f MB", len(files), args.filetype, inputsize / (1024 * 1024))
+    logging.info("%-8s %8s %12s %8s %10s", "codec", "threads", "size [MB]", "ratio", "MB/s")
+    for codec in args.codecs.split(","):
+        for nthreads in [int(x) for x in args.threads.split(",")]:
+            size, elapsed = benchmark(slotdir, files, codec, nthreads, args.outputdir)
+            logging.info("%-8s %8d %12.1f %8.1f %10.1f", codec, nthreads, size / (1024 * 1024), inputsize / size if size else 0., inputsize / (1024 * 1024) / elapsed if elapsed else 0.)
@@ -0,0 +1,63 @@
+#! /usr/bin/env python3
+
+import argparse
+import importlib.util
+import logging
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+from helpers import pwgeventsparser
+from helpers.setup_logging import setup_logging
+
+def load_revision(repo: str, revision: str, outputdir: str):
+    # pwgeventsparser module of another git revision (i.e. the version before the
+    # __slots__ / dict-lookup change) for comparison with the current version
+    source = subprocess.run(["git", "-C", repo, "show", f"{revision}:helpers/pwgeventsparser.py"], stdout=subprocess.PIPE, check=True).stdout
+    modulefile = os.path.join(outputdir, "pwgeventsparser_baseline.py")
+    with open(modulefile, "wb") as modulewriter:
+        modulewriter.write(source)
+        modulewriter.close()
+    spec = importlib.util.spec_from_file_location("pwgeventsparser_baseline", modulefile)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def benchmark(module, nweights: int, ngroups: int) -> float:
+    # Header decoding pattern: add N weights (non-grouped and in groups), look up every
+    # weight by ID and build the sorted list of all weights. Returns the time in seconds.
+    start = time.perf_counter()
+    infos = module.pwgevents_info()
+    for index in range(nweights):
+        if ngroups > 0 and index % (ngroups + 1):
+            infos.add_weight_in_group(f"group{index % (ngroups + 1)}", f"{index}", f"weight {index}")
+        else:
+            infos.add_weight_non_grouped(f"{index}", f"weight {index}")
+    for index in range(nweights):
+        if not infos.has_weight(f"{index}") or infos.find_weight(f"{index}") is None:
+            logging.error("Weight %d not found", index)
+    infos.get_all_weights()
+    return time.perf_counter() - start
+
+if __name__ == "__main__":
+    repo = os.path.dirname(os.path.abspath(sys.argv[0]))
+    parser = argparse.ArgumentParser("benchmark_weights.py", description="Time adding and looking up weights in the pwgevents weight model")
+    parser.add_argument("-n", "--nweights", metavar="NWEIGHTS", type=str, default="1000,4000", help="Comma-separated list of numbers of weights (default: 1000,4000)")
+    parser.add_argument("-g", "--groups", metavar="GROUPS", type=int, default=0, help="Number of weight groups (default: 0, all weights non-grouped)")
+    parser.add_argument("-r", "--repeat", metavar="REPEAT", type=int, default=3, help="Number of repetitions, the fastest is reported (default: 3)")
+    parser.add_argument("-b", "--baseline", metavar="REVISION", type=str, default="", help="Git revision to compare with (i.e. d3521af^ for the version before __slots__ and dict lookups)")
+    parser.add_argument("-d", "--debug", action="store_true", help="Debug mode")
+    args = parser.parse_args()
+    setup_logging(args.debug)
+
+    modules = [("current", pwgeventsparser)]
+    with tempfile.TemporaryDirectory() as tmpdir:
+        if len(args.baseline):
+            modules.insert(0, (args.baseline, load_revision(repo, args.baseline, tmpdir)))
+        logging.info("%-12s %10s %12s", "version", "weights", "time [s]")
+        for nweights in [int(x) for x in args.nweights.split(",")]:
+            for name, module in modules:
+                elapsed = min([benchmark(module, nweights, args.groups) for _ in range(args.repeat)])
+                logging.info("%-12s %10d %12.4f", name, nweights, elapsed)
@@ -5,14 +5,17 @@ import os
 
 from helpers.setup_logging import setup_logging
 from helpers.workarchive import pack_workarchives
+from helpers.zipwriter import DEFAULT_CODEC, get_codecs
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser("build_workarchives.py")
     parser.add_argument("workdir", metavar="WORKDIR", type=str, help="Working directory") 
+    parser.add_argument("--codec", metavar="CODEC", type=str, default=DEFAULT_CODEC, choices=sorted(get_codecs().keys()), help=f"Compression codec (default: {DEFAULT_CODEC})")
+    parser.add_argument("--threads", metavar="THREADS", type=int, default=0, help="Number of compression threads (default: 0:=available CPUs up to 4)")
     parser.add_argument("-c", "--clean", action="store_true", help="Clean workdir")
     parser.add_argument("-d", "--debug", action="store_true", help="Debug mode")
     args = parser.parse_args()
     setup_logging(args.debug)
 
     workdir = os.path.abspath(args.workdir)
-    pack_workarchives(workdir, args.clean)
\ No newline at end of file
+    pack_workarchives(workdir, args.clean, args.codec, args.threads)
\ No newline at end of file
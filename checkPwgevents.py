@@ -2,37 +2,99 @@
 import argparse
 import logging
 import os
+import sys
+from concurrent.futures import ProcessPoolExecutor, as_completed
 
+from helpers.checkdb import CheckDatabase, get_filestat, get_slotdir_workdir, make_checkrecord, write_checksummary
+from helpers.lhecompression import find_lhe
+from helpers.processpool import get_number_of_cpus
 from helpers.pwgeventsparser import pwgeventsparser
 
-def analyse_pwgevents(pwgevents: str, summaryfile: str):
-    parser = pwgeventsparser(pwgevents)
-    parser.parse()
+try:
+    from helpers.lheweights import is_weightcheck_ok, validate_weights
+except ImportError:
+    # weight validation requires numpy
+    validate_weights = None
+
+def analyse_pwgevents(pwgevents: str, summaryfile: str, fastscan: bool = True, quick: bool = False, usedb: bool = True, checkweights: bool = False, maxratio: float = 100.) -> dict:
+    # Slots of jobs with compressed output only keep pwgevents.lhe.gz / .zst
+    pwgevents = find_lhe(pwgevents) or pwgevents
+    # File state before the check, a modification during the check invalidates the record
+    filestat = get_filestat(pwgevents)
+    parser = pwgeventsparser(pwgevents, fastscan)
+    if quick:
+        parser.quickcheck()
+    else:
+        parser.parse()
     decoded = parser.get_eventinfos()
+    weightids = decoded.get_all_weights()
+    weightcheck = None
+    if checkweights and decoded.is_file_nonempty():
+        # Weights of all events: present, finite and not too far from the central weight
+        if validate_weights is None:
+            raise ImportError("Weight validation requires numpy")
+        weightcheck = validate_weights(pwgevents, list(dict.fromkeys([x.id for x in weightids])), maxratio)
+        weightcheck["ok"] = is_weightcheck_ok(weightcheck)
 
     basedir = os.path.dirname(os.path.abspath(pwgevents))
     summaryfilename = os.path.join(basedir, summaryfile)
-    with open(summaryfilename, "w") as summarywriter:
-        summarywriter.write("exists: {}\n".format("yes" if decoded.is_file_existing() else "no"))
-        summarywriter.write("nonempty: {}\n".format("yes" if decoded.is_file_nonempty() else "no"))
-        summarywriter.write("events: {}\n".format(decoded.get_nevents()))
-        summarywriter.write("complete: {}\n".format("yes" if decoded.closingmarker else "no"))
-        weightids = decoded.get_all_weights()
-        weightstring = "weights:"
-        first = True
-        for weight in weightids:
-            if not first:
-                weightstring += ","
-            else:
-                first = False
-            weightstring += " {}".format(weight.id)
-        summarywriter.write("{}\n".format(weightstring))
-        summarywriter.close()
+    write_checksummary(summaryfilename, decoded, weightcheck)
+
+    # Record for the check database of the working directory (only for files in slot directories)
+    workdir, slot = get_slotdir_workdir(basedir)
+    if not len(slot):
+        return None
+    record = make_checkrecord(slot, os.path.abspath(pwgevents), decoded.is_file_existing(), decoded.is_file_nonempty(),
+                              decoded.get_nevents() if decoded.is_nevents_evaluated() else None, decoded.closingmarker,
+                              [x.id for x in weightids], filestat, weightcheck)
+    if usedb:
+        CheckDatabase(workdir).add_record(record)
+    return record
+
+def find_slot_eventfiles(workdir: str, eventfile: str = "pwgevents.lhe") -> list:
+    # compressed event files are used if no plain event file exists
+    slotdirs = [x for x in os.listdir(workdir) if x.isdigit() and os.path.isdir(os.path.join(workdir, x))]
+    return [find_lhe(os.path.join(workdir, x, eventfile)) or os.path.join(workdir, x, eventfile) for x in sorted(slotdirs)]
+
+def analyse_workdir(workdir: str, summaryfile: str, njobs: int = 0, fastscan: bool = True, quick: bool = False, checkweights: bool = False, maxratio: float = 100.) -> int:
+    # Check the pwgevents.lhe files of all slots in the working directory in a process pool,
+    # the check files are written to the slot directories as in the single-file mode
+    return analyse_eventfiles(workdir, find_slot_eventfiles(os.path.abspath(workdir)), summaryfile, njobs, fastscan, quick, checkweights, maxratio)
+
+def analyse_eventfiles(workdir: str, eventfiles: list, summaryfile: str, njobs: int = 0, fastscan: bool = True, quick: bool = False, checkweights: bool = False, maxratio: float = 100.) -> int:
+    if njobs <= 0:
+        njobs = get_number_of_cpus()
+    logging.info("Checking %d slots in %s using %d processes", len(eventfiles), workdir, njobs)
+    nfailed = 0
+    records = []
+    with ProcessPoolExecutor(max_workers=njobs) as executor:
+        futures = {executor.submit(analyse_pwgevents, eventfile, summaryfile, fastscan, quick, False, checkweights, maxratio): eventfile for eventfile in eventfiles}
+        ndone = 0
+        for future in as_completed(futures):
+            ndone += 1
+            try:
+                record = future.result()
+                if record:
+                    records.append(record)
+                logging.info("[%d/%d] Checked %s", ndone, len(eventfiles), futures[future])
+            except Exception as e:
+                nfailed += 1
+                logging.error("[%d/%d] Failed checking %s: %s", ndone, len(eventfiles), futures[future], e)
+    # Records from all workers are appended to the check database in one go
+    CheckDatabase(os.path.abspath(workdir)).add_records(sorted(records, key=lambda x: x["slot"]))
+    return nfailed
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser("checkPwgevents")
-    parser.add_argument("-i", "--inputfile", metavar="INPUTFILE", required=True, type=str, help="pwgevents.lhe file to be checked")
+    inputgroup = parser.add_mutually_exclusive_group(required=True)
+    inputgroup.add_argument("-i", "--inputfile", metavar="INPUTFILE", type=str, help="pwgevents.lhe file to be checked")
+    inputgroup.add_argument("-w", "--workdir", metavar="WORKDIR", type=str, help="Check pwgevents.lhe files in all slot directories of the working directory")
+    parser.add_argument("-j", "--jobs", metavar="JOBS", type=int, default=0, help="Number of parallel processes in workdir mode (default: 0:=all available CPUs)")
     parser.add_argument("-o", "--outputfile", metavar="OUTPUTFILE", type=str, default="check_pwgevents.txt", help="File with summary information")
+    parser.add_argument("-l", "--linemode", action="store_true", help="Use line-by-line parser instead of byte-level block scan")
+    parser.add_argument("-q", "--quick", action="store_true", help="Quick check of header and file tail only (no event count)")
+    parser.add_argument("-c", "--checkweights", action="store_true", help="Validate the weights of all events (complete, finite, ratio to central weight), requires numpy")
+    parser.add_argument("-r", "--maxratio", metavar="MAXRATIO", type=float, default=100., help="Maximum ratio of a weight to the central weight in the weight validation (default: 100)")
     parser.add_argument("-d", "--debug", action="store_true", help="Debug mode")
     args = parser.parse_args()
 
@@ -41,4 +103,11 @@ if __name__ == "__main__":
         loglevel = logging.DEBUG
     logging.basicConfig(format="[%(levelname)s] %(message)s", level=loglevel)
     
-    analyse_pwgevents(args.inputfile, args.outputfile)
\ No newline at end of file
+    if args.checkweights and validate_weights is None:
+        logging.error("Weight validation requires numpy")
+        sys.exit(1)
+    if args.workdir:
+        if analyse_workdir(args.workdir, args.outputfile, args.jobs, not args.linemode, args.quick, args.checkweights, args.maxratio):
+            sys.exit(1)
+    else:
+        analyse_pwgevents(args.inputfile, args.outputfile, not args.linemode, args.quick, checkweights=args.checkweights, maxratio=args.maxratio)
\ No newline at end of file
@@ -6,8 +6,12 @@ import os
 import shutil
 
 from helpers import setup_logging
+from helpers.checkdb import CheckDatabase
+from helpers.resubmithandler import get_failed_slots_db
 
 def read_failed_chunks(workdir: str) -> list:
+    if CheckDatabase(workdir).exists():
+        return sorted([x.get_slotID() for x in get_failed_slots_db(workdir).get_corruptedfiles()])
     failed = []
     with open(os.path.join(workdir, "checksummary_pwgevents.log"), "r") as checkreader:
         start_missing_weight = False
@@ -0,0 +1,47 @@
+#! /usr/bin/env python3
+
+import argparse
+import logging
+import os
+import sys
+
+from helpers.lhecompression import DEFAULT_LHE_CODEC, compress_lhe, get_lhe_codecs
+from helpers.processpool import process_slotdirs
+from helpers.pwgeventsparser import pwgeventsparser
+from helpers.pwsemaphore import has_semaphore
+from helpers.setup_logging import setup_logging
+
+def compress_slot(slotdir: str, codec: str, level: int = None) -> bool:
+    # Only complete event files of slots not running POWHEG are compressed,
+    # other slots are skipped
+    pwgevents = os.path.join(slotdir, "pwgevents.lhe")
+    if not os.path.exists(pwgevents):
+        logging.debug("No plain pwgevents.lhe in %s", slotdir)
+        return True
+    if has_semaphore(slotdir):
+        logging.warning("POWHEG running or failed in %s, not compressing", slotdir)
+        return True
+    decoder = pwgeventsparser(pwgevents)
+    decoder.quickcheck()
+    if not decoder.get_eventinfos().has_closingmarker():
+        logging.warning("pwgevents.lhe in %s incomplete, not compressing", slotdir)
+        return True
+    compress_lhe(pwgevents, codec, level)
+    return True
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("compress_pwgevents.py", description="Compress complete pwgevents.lhe files in all slot directories in place")
+    parser.add_argument("workdir", metavar="WORKDIR", type=str, help="Working directory (POWHEG_<version>)")
+    parser.add_argument("-c", "--codec", metavar="CODEC", type=str, default=DEFAULT_LHE_CODEC, choices=get_lhe_codecs(), help=f"Compression codec (default: {DEFAULT_LHE_CODEC})")
+    parser.add_argument("-l", "--level", metavar="LEVEL", type=int, default=None, help="Compression level (default: codec default)")
+    parser.add_argument("-j", "--jobs", metavar="JOBS", type=int, default=1, help="Number of slot directories compressed in parallel (default: 1, 0:=number of CPUs)")
+    parser.add_argument("-d", "--debug", action="store_true", help="Debug mode")
+    args = parser.parse_args()
+    setup_logging(args.debug)
+
+    workdir = os.path.abspath(args.workdir)
+    slotdirs = [os.path.join(workdir, x) for x in sorted(os.listdir(workdir)) if x.isdigit() and os.path.isdir(os.path.join(workdir, x))]
+    nfailed = process_slotdirs(compress_slot, slotdirs, args.jobs, (args.codec, args.level), "Compressed events in")
+    if nfailed:
+        logging.error("Compression failed for %d slot directories", nfailed)
+        sys.exit(1)
\ No newline at end of file
@@ -5,14 +5,17 @@ import logging
 
 from helpers.gridarchive import build_archive
 from helpers.setup_logging import setup_logging
+from helpers.zipwriter import DEFAULT_CODEC, get_codecs
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser("create_gridarchive.py")
     parser.add_argument("griddir", metavar="GRIDDIR", type=str, help="Directory with gridfiles")
     parser.add_argument("-f", "--force", action="store_true", help="Force overwrite")
     parser.add_argument("-c", "--clean", action="store_true", help="Clean grid files after archive creation")
+    parser.add_argument("--codec", metavar="CODEC", type=str, default=DEFAULT_CODEC, choices=sorted(get_codecs().keys()), help=f"Compression codec (default: {DEFAULT_CODEC})")
+    parser.add_argument("--threads", metavar="THREADS", type=int, default=0, help="Number of compression threads (default: 0:=available CPUs up to 4)")
     parser.add_argument("-d", "--debug", action="store_true", help="Debug mode")
     args = parser.parse_args()
     setup_logging(args.debug)
     logging.info("Creating grid archive in directory: %s", args.griddir)
-    build_archive(args.griddir, args.force, args.clean)
+    build_archive(args.griddir, args.force, args.clean, args.codec, args.threads)
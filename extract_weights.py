@@ -0,0 +1,31 @@
+#! /usr/bin/env python3
+
+import argparse
+import logging
+import os
+import sys
+
+from helpers.lhecompression import find_lhe
+from helpers.lheweights import extract_weights
+from helpers.setup_logging import setup_logging
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("extract_weights.py", description="Extract the event weights of all slot directories into a NumPy weight table (events x weights)")
+    parser.add_argument("workdir", metavar="WORKDIR", type=str, help="Working directory (POWHEG_<version>)")
+    parser.add_argument("-o", "--output", metavar="OUTPUT", type=str, default="", help="Output prefix, writes OUTPUT.npy and OUTPUT_index.npz (default: WORKDIR/pwgweights)")
+    parser.add_argument("-j", "--jobs", metavar="JOBS", type=int, default=1, help="Number of event files processed in parallel (default: 1, 0:=number of CPUs)")
+    parser.add_argument("-d", "--debug", action="store_true", help="Debug mode")
+    args = parser.parse_args()
+    setup_logging(args.debug)
+
+    workdir = os.path.abspath(args.workdir)
+    slotdirs = [os.path.join(workdir, x) for x in sorted(os.listdir(workdir)) if x.isdigit() and os.path.isdir(os.path.join(workdir, x))]
+    eventfiles = []
+    for slotdir in slotdirs:
+        eventfile = find_lhe(os.path.join(slotdir, "pwgevents.lhe"))
+        if len(eventfile):
+            eventfiles.append(eventfile)
+        else:
+            logging.warning("No pwgevents.lhe in %s", slotdir)
+    if not extract_weights(eventfiles, args.output if len(args.output) else os.path.join(workdir, "pwgweights"), args.jobs):
+        sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,186 @@
+#! /usr/bin/env python3
+
+import fcntl
+import json
+import logging
+import os
+import time
+
+def get_checkdb_name(workdir: str) -> str:
+    return os.path.join(workdir, "checkresults_pwgevents.jsonl")
+
+def get_slotdir_workdir(slotdir: str) -> tuple:
+    # Returns (workdir, slot) for a slot directory, slot is empty if the directory is not a slot directory
+    slotdir = os.path.abspath(slotdir)
+    slot = os.path.basename(slotdir)
+    if not slot.isdigit():
+        return (os.path.dirname(slotdir), "")
+    return (os.path.dirname(slotdir), slot)
+
+def get_filestat(eventfile: str) -> dict:
+    # Key identifying the state of the event file at the time of the check
+    if not os.path.exists(eventfile):
+        return None
+    stat = os.stat(eventfile)
+    return {"size": stat.st_size, "mtime": stat.st_mtime_ns, "inode": stat.st_ino}
+
+def format_weightcounts(counts: dict) -> str:
+    return ", ".join(["{}={}".format(weight, count) for weight, count in counts.items()])
+
+def write_checksummary(summaryfilename: str, decoded, weightcheck: dict = None, salvaged: int = None):
+    # Human-readable check results (check_pwgevents.txt) from the event infos of the parser
+    with open(summaryfilename, "w") as summarywriter:
+        summarywriter.write("exists: {}\n".format("yes" if decoded.is_file_existing() else "no"))
+        summarywriter.write("nonempty: {}\n".format("yes" if decoded.is_file_nonempty() else "no"))
+        if decoded.is_nevents_evaluated():
+            summarywriter.write("events: {}\n".format(decoded.get_nevents()))
+        summarywriter.write("complete: {}\n".format("yes" if decoded.closingmarker else "no"))
+        weightstring = "weights:"
+        first = True
+        for weight in decoded.get_all_weights():
+            if not first:
+                weightstring += ","
+            else:
+                first = False
+            weightstring += " {}".format(weight.id)
+        summarywriter.write("{}\n".format(weightstring))
+        if weightcheck:
+            summarywriter.write("weightcheck: {}\n".format("ok" if weightcheck["ok"] else "failed"))
+            summarywriter.write("missingweights: {}\n".format(format_weightcounts(weightcheck["missing"])))
+            summarywriter.write("nonfiniteweights: {}\n".format(format_weightcounts(weightcheck["nonfinite"])))
+            summarywriter.write("extremeweights: {}\n".format(format_weightcounts(weightcheck["extreme"])))
+            summarywriter.write("badcentralweights: {}\n".format(weightcheck["badcentral"]))
+        if salvaged is not None:
+            summarywriter.write("salvaged: {}\n".format(salvaged))
+        summarywriter.close()
+
+def parse_weightcounts(value: str) -> dict:
+    # Inverse of format_weightcounts
+    counts = {}
+    for entry in value.split(","):
+        weight, _, count = entry.strip().rpartition("=")
+        if len(weight):
+            counts[weight] = int(count)
+    return counts
+
+def read_weightcheck(summaryfilename: str, events: int = None) -> dict:
+    # Weight validation result from a check summary written by write_checksummary,
+    # None if the weights were not validated
+    values = {}
+    with open(summaryfilename, "r") as summaryreader:
+        for line in summaryreader:
+            key, _, value = line.rstrip("\n").partition(":")
+            values[key.strip()] = value.strip()
+        summaryreader.close()
+    if not "weightcheck" in values:
+        return None
+    return {
+        "events": events,
+        "badcentral": int(values.get("badcentralweights") or 0),
+        "maxratio": None,
+        "missing": parse_weightcounts(values.get("missingweights", "")),
+        "nonfinite": parse_weightcounts(values.get("nonfiniteweights", "")),
+        "extreme": parse_weightcounts(values.get("extremeweights", "")),
+        "ok": values["weightcheck"] == "ok"
+    }
+
+def make_checkrecord(slot: str, eventfile: str, exists: bool, nonempty: bool, events: int, complete: bool, weights: list, filestat: dict = None, weightcheck: dict = None, salvaged: int = None) -> dict:
+    # events can be None in case the event count was not evaluated, weightcheck is None
+    # if the weights of the events were not validated, salvaged is the number of events
+    # kept when truncating an incomplete file
+    return {
+        "slot": slot,
+        "eventfile": eventfile,
+        "exists": exists,
+        "nonempty": nonempty,
+        "events": events,
+        "complete": complete,
+        "weights": weights,
+        "filestat": filestat,
+        "weightcheck": weightcheck,
+        "salvaged": salvaged,
+        "checked": int(time.time())
+    }
+
+class CheckDatabase(object):
+    # Append-only store of the check results of all slots in a working directory,
+    # one JSON record per line. Records are never modified, a new check of a slot
+    # appends a new record which supersedes the previous ones.
+
+    def __init__(self, workdir: str):
+        self.__workdir = workdir
+        self.__filename = get_checkdb_name(workdir)
+
+    def get_filename(self) -> str:
+        return self.__filename
+
+    def exists(self) -> bool:
+        return os.path.exists(self.__filename)
+
+    def add_record(self, record: dict):
+        self.add_records([record])
+
+    def add_records(self, records: list):
+        if not len(records):
+            return
+        payload = "".join(["{}\n".format(json.dumps(record)) for record in records]).encode("utf-8")
+        fd = os.open(self.__filename, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            try:
+                fcntl.flock(fd, fcntl.LOCK_EX)
+            except OSError:
+                # Not all shared filesystems support flock, rely on O_APPEND in this case
+                logging.debug("Cannot lock %s, appending without lock", self.__filename)
+            os.write(fd, payload)
+        finally:
+            os.close(fd)
+
+    def get_records(self) -> dict:
+        # Latest record for each slot
+        records = {}
+        if not self.exists():
+            return records
+        with open(self.__filename, "r") as dbreader:
+            for line in dbreader:
+                line = line.rstrip("\n")
+                if not len(line):
+                    continue
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Incomplete record from an interrupted writer
+                    logging.warning("Skipping corrupted record in %s", self.__filename)
+                    continue
+                records[record["slot"]] = record
+            dbreader.close()
+        return records
+
+    def get_records_sorted(self) -> list:
+        records = self.get_records()
+        return [records[x] for x in sorted(records.keys())]
+
+def is_record_uptodate(record: dict, eventfile: str) -> bool:
+    # Records without file state (imported from check files) or without
+    # event count (quick check) are considered outdated
+    filestat = record.get("filestat")
+    if record["exists"] and (filestat is None or record["events"] is None):
+        return False
+    return filestat == get_filestat(eventfile)
+
+def get_expected_weights(records: list) -> list:
+    weights = []
+    for record in records:
+        for weight in record["weights"]:
+            if not weight in weights:
+                weights.append(weight)
+    return weights
+
+def get_missing_weights(record: dict, expectweights: list) -> list:
+    return sorted([x for x in expectweights if not x in record["weights"]])
+
+def is_weightcheck_failed(record: dict) -> bool:
+    weightcheck = record.get("weightcheck")
+    return weightcheck is not None and not weightcheck["ok"]
+
+def is_incomplete(record: dict) -> bool:
+    return record["exists"] and record["nonempty"] and not record["complete"]
@@ -3,7 +3,7 @@
 import os
 import logging
 from helpers.cluster import get_default_partition
-from helpers.slurm import submit 
+from helpers.slurm import submit, ARRAYOFFSET_TAG, SlurmArrayCollector
 from helpers.workdir import range_jobdirs
 
 def submit_check_job(cluster: str, repo: str, workdir: str, partition: str,  mem: int = 2, hours: int = 4, dependency: list = []) -> int:
@@ -24,6 +24,16 @@ def submit_multi_checkjob(cluster: str, repo: str, workdir: str, partition: str,
     jobname = "check_pwgevents"
     return submit(runcmd, cluster, jobname, logfile, get_default_partition(cluster) if partition == "default" else partition, njobs, f"{hours}:00:00", f"{mem}G", dependency)
 
+def submit_pool_checkjob(cluster: str, repo: str, workdir: str, partition: str, ncores: int, mem: int = 4, hours: int = 4, dependency: list = []) -> int:
+    # All slots checked by a process pool in a single multi-core job
+    runcmd = f"{repo}/run_check_pwgevents_pool.sh {repo} {workdir} {ncores}"
+    logdir = os.path.join(workdir, "logs")
+    if not os.path.exists(logdir):
+        os.makedirs(logdir, 0o755)
+    logfile = os.path.join(logdir, "joboutput_check_pool.log")
+    jobname = "check_pwgevents_pool"
+    return submit(runcmd, cluster, jobname, logfile, get_default_partition(cluster) if partition == "default" else partition, 0, f"{hours}:00:00", f"{mem}G", dependency, cpus=ncores)
+
 def submit_check_jobs(cluster: str, repo: str, workdir: str, partition: str, mem: int = 2, hours: int =1, dependency: list = []) -> int:
     indexmin, indexmax = range_jobdirs(workdir)
     logging.debug(f"Min. index: {indexmin}, max index: {indexmax}")
@@ -44,8 +54,20 @@ def submit_check_job_slot(cluster: str, repo: str, workdir: str, slotID: int, pa
     jobname = f"check_pwgevents_{slotID}"
     return submit(runcmd, cluster, jobname, logfile, get_default_partition(cluster) if partition == "default" else partition, 0, f"{hours}:00:00", f"{mem}G", dependency)
 
-def submit_check_summary(cluster: str, repo: str, workdir: str, partition: str,  mem: int = 2, hours: int = 4, dependency: list = []) -> int:
+def collect_check_job_slot(cluster: str, repo: str, workdir: str, slotID: int, partition: str, collector: SlurmArrayCollector, mem: int = 2, hours: int = 4, dependency: list = []):
+    # Slot is the array task ID plus the slot offset set by the collector
+    runcmd = f"{repo}/run_check_pwgevents.sh {repo} {workdir} {ARRAYOFFSET_TAG}"
+    logdir = os.path.join(workdir, "logs")
+    if not os.path.exists(logdir):
+        os.makedirs(logdir, 0o755)
+    logfile = os.path.join(logdir, "joboutput_check_%a.log")
+    jobname = "check_pwgevents"
+    collector.add(slotID, runcmd, cluster, jobname, logfile, get_default_partition(cluster) if partition == "default" else partition, f"{hours}:00:00", f"{mem}G", dependency)
+
+def submit_check_summary(cluster: str, repo: str, workdir: str, partition: str,  mem: int = 2, hours: int = 4, dependency: list = [], incremental: bool = False) -> int:
     runcmd = f"{repo}/run_checksummay_pwgevents.sh {repo} {workdir}"
+    if incremental:
+        runcmd += " incremental"
     logdir = os.path.join(workdir, "logs")
     if not os.path.exists(logdir):
         os.makedirs(logdir, 0o755)
@@ -53,12 +75,14 @@ def submit_check_summary(cluster: str, repo: str, workdir: str, partition: str,
     jobname = "checksummary_pwgevents"
     return submit(runcmd, cluster, jobname, logfile, get_default_partition(cluster) if partition == "default" else partition, 0, f"{hours}:00:00", f"{mem}G", dependency)
 
-def submit_checks(cluster: str, repo: str, workdir: str, partition: str, pwhgjob: list, multi: bool = False, summaryOnly: bool = False) -> dict:
+def submit_checks(cluster: str, repo: str, workdir: str, partition: str, pwhgjob: list, multi: bool = False, summaryOnly: bool = False, poolcores: int = 0) -> dict:
     jobids = {}
     checkjob = []
     if not summaryOnly:
-        logging.info("Launching checking chain for workdir %s (%s-job mode)", workdir, "multi" if multi else "single")
-        if multi:
+        logging.info("Launching checking chain for workdir %s (%s-job mode)", workdir, "pool" if poolcores > 0 else "multi" if multi else "single")
+        if poolcores > 0:
+            checkjob.append(submit_pool_checkjob(cluster, repo, workdir, partition, poolcores, 4, 4, pwhgjob))
+        elif multi:
             checkjob.append(submit_check_jobs(cluster, repo, workdir, partition, 2, 4, pwhgjob))
         else:
             checkjob.append(submit_check_job(cluster, repo, workdir, partition, 2, 4, pwhgjob))
@@ -72,7 +96,8 @@ def submit_checks(cluster: str, repo: str, workdir: str, partition: str, pwhgjob
     else:
         logging.info("launching only final summary job")
         checkjob = pwhgjob
-    checksummaryjob = submit_check_summary(cluster, repo, workdir, partition, 2, 1, checkjob)
+    # After resubmissions only slots with modified pwgevents.lhe need to be checked again
+    checksummaryjob = submit_check_summary(cluster, repo, workdir, partition, 2, 1, checkjob, summaryOnly)
     logging.info("Job ID for analysing checking results: %d", checksummaryjob)
     jobids["final"] = [checksummaryjob]
     return jobids
@@ -81,4 +106,11 @@ def submit_check_slot(cluster: str, repo: str, workdir: str, slot: int, partitio
     slotworkdir = os.path.join(workdir, "%04d" %slot)
     logging.info("Submitting single check job for workdir: %s", slotworkdir)
     checkjob = submit_check_job_slot(cluster, repo, workdir, slot, partition, 2, 4, [pwhgjob])
-    return checkjob
\ No newline at end of file
+    return checkjob
+
+def collect_check_slot(cluster: str, repo: str, workdir: str, slot: int, partition: str, collector: SlurmArrayCollector, pwhgjob: int):
+    # For collectors with aftercorr dependency the check of a slot only waits for the
+    # simulation task with the same array index
+    slotworkdir = os.path.join(workdir, "%04d" %slot)
+    logging.info("Adding check job for workdir: %s", slotworkdir)
+    collect_check_job_slot(cluster, repo, workdir, slot, partition, collector, 2, 4, [pwhgjob])
\ No newline at end of file
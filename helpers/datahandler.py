@@ -1,10 +1,14 @@
 #! /usr/bin/env python3
 import os
 
+from helpers.lhecompression import get_lhe_candidates
+
 def find_pwgevents(inputdir: str, eventfile: str = "pwgevents.lhe"):
+	# Plain or compressed event files
+	candidates = get_lhe_candidates(eventfile)
 	result = []
 	for root, dirs, files in os.walk(inputdir):
 		for fl in files:
-			if eventfile in fl:
+			if fl in candidates:
 				result.append(os.path.join(os.path.abspath(root), fl))
 	return sorted(result)
\ No newline at end of file
@@ -1,6 +1,7 @@
 #! /usr/bin/env python3
 
 from helpers.powhegconfig import replace_value
+from helpers.workfiles import open_workfile
 
 def create_config_nevens(inputfile: str, outputfile: str, nevents: int):
     print("Parameters for reweighted POWHEG input:")
@@ -19,4 +20,13 @@ def create_config_nevens(inputfile: str, outputfile: str, nevents: int):
                 else:
                     writer.write("{}\n".format(line.rstrip("\n")))
             writer.close()
-        reader.close()
\ No newline at end of file
+        reader.close()
+
+def get_config_nevents(configfile: str) -> int:
+    # Number of events requested in the POWHEG input (plain or archived work file), 0 if not set
+    with open_workfile(configfile) as reader:
+        for line in reader:
+            tokens = line.split()
+            if len(tokens) > 1 and tokens[0] == "numevts":
+                return int(float(tokens[1].replace("d", "e").replace("D", "e")))
+    return 0
\ No newline at end of file
@@ -3,12 +3,30 @@
 import logging
 import os
 import shutil
+import stat
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
 from zipfile import ZipFile
 
+from helpers.gridstore import GridManifest, MANIFEST_NAME, build_manifest, find_manifest, load_manifest
+from helpers.zipwriter import DEFAULT_CODEC, ParallelZipWriter
+
 class gridarchive(object):
 
     def __init__(self):
         self.__gridfiles = []
+        self.__manifest: GridManifest = None
+
+    def set_manifest(self, manifest: GridManifest):
+        # Grid files resolved from the grid store
+        self.__manifest = manifest
+        for f in manifest.get_files():
+            if not f in self.__gridfiles:
+                self.__gridfiles.append(f)
+
+    def get_manifest(self) -> GridManifest:
+        return self.__manifest
 
     def add_file(self, filename: str):
         self.__gridfiles.append(filename)
@@ -38,9 +56,18 @@ class gridarchive(object):
         nxginfo = self.number_xginfos()
         if ngrids == 0 or nubounds == 0 or nxginfo == 0:
             return False
+        if self.__manifest:
+            store = self.__manifest.get_store()
+            missing = [x for x in self.__manifest.get_files() if not store.has_object(self.__manifest.get_entry(x)["sha256"])]
+            if len(missing):
+                logging.error("Grid files missing in grid store %s: %s", store.get_storedir(), ", ".join(missing))
+                return False
         return ngrids == nubounds and ngrids == nxginfo and nubounds == nxginfo
     
-    def build(self, filename: str, force_overwrite: bool = False) -> bool:
+    def build(self, filename: str, force_overwrite: bool = False, codec: str = DEFAULT_CODEC, nthreads: int = 0, basedir: str = "") -> bool:
+        # Grid files and relative archive names are resolved with respect to basedir
+        # (default: current directory)
+        filename = os.path.join(basedir, filename)
         if os.path.exists(filename):
             if force_overwrite:
                 logging.warning("Overwriting existing grid archive %s", filename)
@@ -48,31 +75,56 @@ class gridarchive(object):
             else:
                 logging.warning("Grid archive %s already existing, not overwriting", filename)
                 return False
-        compressor = ZipFile(filename, "w")
+        compressor = ParallelZipWriter(filename, "w", codec, nthreads=nthreads)
         for fl in sorted(self.__gridfiles):
-            compressor.write(fl)
+            compressor.write(os.path.join(basedir, fl), fl)
         compressor.close()
         return True
 
-    def extract(self, filename: str) -> bool:
+    def extract(self, filename: str, outputdir: str = "", members: list = None, nthreads: int = 0) -> bool:
+        # Extract grid files into outputdir (default: current directory), members
+        # can restrict the extraction to a subset of files (names or patterns)
         if not os.path.exists(filename):
             logging.error("Grid archive %s not existing, cannot extract", filename)
             return False
-        extractor = ZipFile(filename, "r")
-        for f in extractor.filelist:
+        if not len(outputdir):
+            outputdir = os.getcwd()
+        if filename.endswith(".json"):
+            # manifest: grid files linked or copied from the grid store
+            manifest = load_manifest(filename)
+            self.set_manifest(manifest)
+            self.__manifest.materialize(outputdir, select_members(manifest.get_files(), members))
+            return True
+        with ZipFile(filename, "r") as extractor:
+            selected = select_members([x.filename for x in extractor.infolist() if not x.is_dir()], members)
+            extractor.close()
+        for f in selected:
             if not f in self.__gridfiles:
-                self.__gridfiles.append(f.filename)
-        extractor.extractall()
-        extractor.close()
+                self.__gridfiles.append(f)
+        extract_members(filename, selected, outputdir, nthreads)
         return True
 
-    def stage(self, griddir: str, workdir: str):
+    def stage(self, griddir: str, workdir: str, link: bool = False):
+        # link: grid files linked instead of copied, only for jobs reading the grids
+        if self.__manifest:
+            staged = self.__manifest.materialize(workdir)
+            logging.info("Staged %d grid files from grid store, %d already present", len(staged), self.number_allgrids() - len(staged))
+            return
+        if link:
+            link_gridfiles(griddir, [x for x in self.__gridfiles if os.path.exists(os.path.join(griddir, x))], workdir)
+            return
         for x in self.__gridfiles:
             inputfile = os.path.join(griddir, x)
             outputfile = os.path.join(workdir, x)
             if os.path.exists(inputfile):
                 shutil.copyfile(inputfile, outputfile)
 
+    def get_signatures(self, workdir: str) -> dict:
+        return get_gridfile_signatures(workdir, self.__gridfiles)
+
+    def get_gridfiles(self) -> list:
+        return self.__gridfiles
+
     def clean_gridfiles(self, workdir: str):
         for f in self.__gridfiles:
             fullgridfilename = os.path.join(workdir, f)
@@ -126,26 +178,131 @@ def find_gridfiles_in_directory(griddir) -> list:
         gridfiles += selxgfiles
     return gridfiles
 
-def stage_gridfiles(griddir: str, workdir: str):
+def select_members(names: list, members: list = None) -> list:
+    # members: names or shell-style patterns, None selects all
+    if members is None:
+        return names
+    return [x for x in names if any([fnmatch(x, member) for member in members])]
+
+def extract_members(archivefile: str, members: list, outputdir: str, nthreads: int = 0):
+    # Members are decompressed concurrently, each thread reads from its own
+    # handle of the archive as ZipFile objects must not be shared between threads
+    if not len(members):
+        return
+    if nthreads <= 0:
+        nthreads = min(len(members), os.cpu_count() or 1)
+    for subdir in set([os.path.dirname(x) for x in members if len(os.path.dirname(x))]):
+        os.makedirs(os.path.join(outputdir, subdir), exist_ok=True)
+    handles = threading.local()
+    openhandles = []
+    lock = threading.Lock()
+    def extract_member(member: str):
+        if not hasattr(handles, "archive"):
+            handles.archive = ZipFile(archivefile, "r")
+            with lock:
+                openhandles.append(handles.archive)
+        handles.archive.extract(member, outputdir)
+    try:
+        with ThreadPoolExecutor(max_workers=nthreads) as executor:
+            # list() to re-raise exceptions from the workers
+            list(executor.map(extract_member, members))
+    finally:
+        for handle in openhandles:
+            handle.close()
+
+def stage_gridfiles(griddir: str, workdir: str, link: bool = False):
+    if link:
+        link_gridfiles(griddir, find_gridfiles_in_directory(griddir), workdir)
+        return
     for f in find_gridfiles_in_directory(griddir):
         shutil.copyfile(os.path.join(griddir, f), os.path.join(workdir,f))
 
+def is_readonly(filename: str) -> bool:
+    return not os.stat(filename).st_mode & (stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH)
+
+def link_gridfiles(griddir: str, gridfiles: list, workdir: str) -> list:
+    # Symlinks to read-only grid files only: a POWHEG job rewriting a grid in place must
+    # fail instead of modifying the shared repository for all slots (hardlinks would
+    # share the inode with the repository). Raises OSError for writable grid files, in
+    # case of failure links already created are removed again.
+    linked = []
+    try:
+        for gridfile in gridfiles:
+            sourcefile = os.path.abspath(os.path.join(griddir, gridfile))
+            if not is_readonly(sourcefile):
+                raise OSError(f"{sourcefile} writable, grid files are only linked if read-only (chmod a-w)")
+            linkname = os.path.join(workdir, gridfile)
+            if os.path.lexists(linkname):
+                os.remove(linkname)
+            os.symlink(sourcefile, linkname)
+            linked.append(linkname)
+    except OSError:
+        for linkname in linked:
+            os.remove(linkname)
+        raise
+    return gridfiles
+
+def get_gridfile_signatures(workdir: str, gridfiles: list) -> dict:
+    # Inode, size and mtime of the grid files (links resolved), used to detect
+    # whether POWHEG rewrote any of the staged grids
+    signatures = {}
+    for gridfile in gridfiles:
+        filename = os.path.join(workdir, gridfile)
+        if os.path.exists(filename):
+            filestat = os.stat(filename)
+            signatures[gridfile] = (filestat.st_dev, filestat.st_ino, filestat.st_size, filestat.st_mtime_ns)
+    return signatures
+
+def is_archive_uptodate(archivefile: str, griddir: str, gridfiles: list) -> bool:
+    # Whether the archive (i.e. grids.zip built in the grid directory) contains exactly
+    # the grid files of the directory with the same sizes and is not older than any of them
+    if not os.path.exists(archivefile) or not len(gridfiles):
+        return False
+    archivetime = os.path.getmtime(archivefile)
+    with ZipFile(archivefile, "r") as reader:
+        members = {x.filename: x.file_size for x in reader.infolist()}
+    for gridfile in gridfiles:
+        filename = os.path.join(griddir, gridfile)
+        if not os.path.exists(filename) or members.get(gridfile) != os.path.getsize(filename) or os.path.getmtime(filename) > archivetime:
+            return False
+    return len(members) == len(gridfiles)
+
 def init_archive(griddir: str) -> gridarchive:
     archive = gridarchive()
-    archive.add_files(find_gridfiles_in_directory(griddir))
+    manifestfile = find_manifest(griddir)
+    if len(manifestfile):
+        archive.set_manifest(load_manifest(manifestfile))
+    else:
+        archive.add_files(find_gridfiles_in_directory(griddir))
     return archive
 
-def build_archive(griddir: str, force_overwrite: bool = False, clean: bool = False):
+def build_archive(griddir: str, force_overwrite: bool = False, clean: bool = False, codec: str = DEFAULT_CODEC, nthreads: int = 0) -> bool:
     archive = init_archive(griddir)
     if archive.check():
         logging.info("Grid files consistent, building archive ...")
         archive.list()
-        currentdir = os.getcwd()
-        os.chdir(griddir)
-        archive.build("grids.zip", force_overwrite)
+        archive.build("grids.zip", force_overwrite, codec, nthreads, griddir)
         if clean:
             archive.clean_gridfiles(griddir)
-        os.chdir(currentdir)
         logging.info("Grid archive can be found under %s", os.path.join(griddir, "grids.zip"))
-    else:
-        logging.error("Grids inconsistent, cannot create archive")
\ No newline at end of file
+        return True
+    logging.error("Grids inconsistent, cannot create archive")
+    return False
+
+def build_store(griddir: str, storedir: str, clean: bool = False) -> bool:
+    # Same as build_archive, but grid files are added to the content-addressed grid
+    # store, the grid directory only keeps the manifest
+    archive = init_archive(griddir)
+    if archive.get_manifest():
+        logging.warning("Grid directory %s already has a manifest", griddir)
+        return False
+    if not archive.check():
+        logging.error("Grids inconsistent, cannot add to grid store")
+        return False
+    manifestfile = os.path.join(griddir, MANIFEST_NAME)
+    manifest = build_manifest(griddir, find_gridfiles_in_directory(griddir), storedir)
+    manifest.write(manifestfile)
+    if clean:
+        archive.clean_gridfiles(griddir)
+    logging.info("Grid manifest can be found under %s", manifestfile)
+    return True
\ No newline at end of file
@@ -0,0 +1,169 @@
+#! /usr/bin/env python3
+
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import time
+from zipfile import BadZipFile, ZipFile
+
+from helpers.gridarchive import find_gridfiles_in_directory, link_gridfiles
+from helpers.gridstore import find_repository_manifest, load_manifest
+
+def get_gridcache_basedir() -> str:
+    # Node-local location shared between all slots running on the same node. TMPDIR
+    # is not used as default as it is often job-specific on Slurm clusters, /dev/shm
+    # would charge the grids to the memory limit of the job filling the cache.
+    return os.path.join(os.getenv("POWHEGVAR_GRIDCACHE", "/tmp"), f"powhegvar_gridcache_{os.getuid()}")
+
+# Cache entries not used for longer than the max. age are removed, above the max. size the
+# least recently used entries are removed, but only if not used for the min. age (longer than
+# the time limit of the slot jobs, which may still use grids symlinked from the cache).
+GRIDCACHE_MAXAGE_HOURS = 72
+GRIDCACHE_MAXSIZE_GB = 20
+GRIDCACHE_MINAGE_HOURS = 24
+
+def get_gridcache_limits() -> tuple:
+    # (max. age in seconds, max. size in bytes), can be changed in the environment
+    maxage = float(os.getenv("POWHEGVAR_GRIDCACHE_MAXAGE", GRIDCACHE_MAXAGE_HOURS)) * 3600
+    maxsize = float(os.getenv("POWHEGVAR_GRIDCACHE_MAXSIZE", GRIDCACHE_MAXSIZE_GB)) * 1024 * 1024 * 1024
+    return (maxage, maxsize)
+
+def get_directory_size(directory: str) -> int:
+    return sum([os.path.getsize(os.path.join(directory, x)) for x in os.listdir(directory)])
+
+def get_gridrepository_key(gridrepository: str) -> str:
+    # Key on the content of the grid archive, for zip archives the CRCs of all members
+    # are taken from the central directory, which avoids reading the full archive from
+    # the shared filesystem. For grid directories name, size and mtime of the grid files
+    # are used: hashing the content would read all grids from the shared filesystem in
+    # every job, which the cache is meant to avoid (grid directories in the grid store are
+    # keyed on content via their manifest).
+    hasher = hashlib.sha1()
+    manifestfile = find_repository_manifest(gridrepository)
+    if len(manifestfile):
+        # manifests provide the SHA-256 of each grid file
+        manifest = load_manifest(manifestfile)
+        for gridfile in manifest.get_files():
+            hasher.update("{}:{}\n".format(gridfile, manifest.get_entry(gridfile)["sha256"]).encode("utf-8"))
+    elif gridrepository.endswith(".zip"):
+        with ZipFile(gridrepository, "r") as archive:
+            for member in sorted(archive.infolist(), key=lambda x: x.filename):
+                hasher.update("{}:{}:{}\n".format(member.filename, member.CRC, member.file_size).encode("utf-8"))
+    else:
+        for gridfile in sorted(find_gridfiles_in_directory(gridrepository)):
+            stat = os.stat(os.path.join(gridrepository, gridfile))
+            hasher.update("{}:{}:{}\n".format(gridfile, stat.st_size, stat.st_mtime_ns).encode("utf-8"))
+    return hasher.hexdigest()
+
+class GridCache(object):
+    # Grid files fetched once per node and key. The first slot takes the lock
+    # and fetches the grids into the cache, all other slots wait for the lock
+    # and find the cache filled. Cached files are read-only and linked into
+    # the slot working directories. Old entries are evicted on each fetch.
+
+    def __init__(self, basedir: str = ""):
+        self.__basedir = basedir if len(basedir) else get_gridcache_basedir()
+
+    def get_basedir(self) -> str:
+        return self.__basedir
+
+    def fetch(self, gridrepository: str) -> tuple:
+        # Returns (cachedir, gridfiles)
+        key = get_gridrepository_key(gridrepository)
+        cachedir = os.path.join(self.__basedir, key)
+        if not os.path.exists(self.__basedir):
+            os.makedirs(self.__basedir, 0o755, exist_ok=True)
+        with open(os.path.join(self.__basedir, f"{key}.lock"), "w") as lockfile:
+            fcntl.flock(lockfile, fcntl.LOCK_EX)
+            try:
+                if not os.path.isdir(cachedir):
+                    logging.info("Filling grid cache %s from %s", cachedir, gridrepository)
+                    self.__fill(gridrepository, cachedir)
+                else:
+                    logging.info("Using grids from cache %s", cachedir)
+                # mtime of the cache directory marks the last use
+                os.utime(cachedir)
+            finally:
+                fcntl.flock(lockfile, fcntl.LOCK_UN)
+        try:
+            self.evict(key)
+        except OSError as e:
+            logging.warning("Failed cleaning grid cache %s: %s", self.__basedir, e)
+        return (cachedir, sorted(os.listdir(cachedir)))
+
+    def evict(self, keep: str = ""):
+        # Removes entries not used within the max. age, and least recently used entries
+        # (not used within the min. age) as long as the cache is above the max. size.
+        # Each entry is removed under its lock, entries currently locked (i.e. being
+        # filled) are skipped.
+        maxage, maxsize = get_gridcache_limits()
+        now = time.time()
+        entries = []
+        for name in os.listdir(self.__basedir):
+            entrydir = os.path.join(self.__basedir, name)
+            if name.endswith(".lock") or name == keep or not os.path.isdir(entrydir):
+                continue
+            entries.append((os.path.getmtime(entrydir), name, get_directory_size(entrydir)))
+        totalsize = sum([x[2] for x in entries]) + (get_directory_size(os.path.join(self.__basedir, keep)) if len(keep) else 0)
+        for lastused, name, size in sorted(entries):
+            age = now - lastused
+            if age < maxage and (totalsize <= maxsize or age < GRIDCACHE_MINAGE_HOURS * 3600):
+                continue
+            if self.__remove_entry(name):
+                logging.info("Removed grid cache entry %s (last used %.1f hours ago, %.1f MB)", name, age / 3600, size / (1024 * 1024))
+                totalsize -= size
+
+    def __remove_entry(self, name: str) -> bool:
+        # Entries are removed under the lock of their key, temporary directories of
+        # killed fills (<key>.tmp<pid>) under the lock of the corresponding key
+        key = name.split(".tmp")[0]
+        lockname = os.path.join(self.__basedir, f"{key}.lock")
+        with open(lockname, "w") as lockfile:
+            try:
+                fcntl.flock(lockfile, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                return False
+            try:
+                # the (empty) lock file is kept, other slots may already wait on it
+                shutil.rmtree(os.path.join(self.__basedir, name))
+            finally:
+                fcntl.flock(lockfile, fcntl.LOCK_UN)
+        return True
+
+    def stage(self, gridrepository: str, workdir: str) -> list:
+        cachedir, gridfiles = self.fetch(gridrepository)
+        return link_gridfiles(cachedir, gridfiles, workdir)
+
+    def __fill(self, gridrepository: str, cachedir: str):
+        # Fill temporary directory and rename when complete, a directory under the
+        # final name is always complete even if a previous job was killed during filling
+        tmpdir = f"{cachedir}.tmp{os.getpid()}"
+        if os.path.exists(tmpdir):
+            shutil.rmtree(tmpdir)
+        os.makedirs(tmpdir, 0o755)
+        try:
+            manifestfile = find_repository_manifest(gridrepository)
+            if len(manifestfile):
+                load_manifest(manifestfile).materialize(tmpdir)
+            elif gridrepository.endswith(".zip"):
+                with ZipFile(gridrepository, "r") as archive:
+                    archive.extractall(tmpdir)
+            else:
+                for gridfile in find_gridfiles_in_directory(gridrepository):
+                    shutil.copyfile(os.path.join(gridrepository, gridfile), os.path.join(tmpdir, gridfile))
+            for gridfile in os.listdir(tmpdir):
+                os.chmod(os.path.join(tmpdir, gridfile), 0o444)
+            os.rename(tmpdir, cachedir)
+        except:
+            shutil.rmtree(tmpdir, ignore_errors=True)
+            raise
+
+def stage_grids_cached(gridrepository: str, workdir: str) -> list:
+    # Returns the staged grid files, None if the cache cannot be used
+    try:
+        return GridCache().stage(gridrepository, workdir)
+    except (OSError, BadZipFile) as e:
+        logging.warning("Cannot use node-local grid cache, staging grids from %s directly: %s", gridrepository, e)
+        return None
@@ -0,0 +1,173 @@
+#! /usr/bin/env python3
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+
+MANIFEST_NAME = "gridmanifest.json"
+MANIFEST_VERSION = 1
+STORE_NAME = "gridstore"
+HASH_BLOCKSIZE = 4 * 1024 * 1024
+
+def get_xgrid_iteration(gridfile: str):
+    # xgrid iteration from pwggridinfo-btl-xg<N>-... files, None for other grid files
+    for tok in gridfile.split("-"):
+        if tok.startswith("xg") and tok[2:].isdigit():
+            return int(tok[2:])
+    return None
+
+def hash_file(filename: str) -> str:
+    hasher = hashlib.sha256()
+    with open(filename, "rb") as reader:
+        while True:
+            block = reader.read(HASH_BLOCKSIZE)
+            if not block:
+                break
+            hasher.update(block)
+    return hasher.hexdigest()
+
+def link_or_copy(source: str, target: str):
+    if os.path.lexists(target):
+        os.remove(target)
+    try:
+        os.link(source, target)
+    except OSError:
+        # different filesystem
+        shutil.copyfile(source, target)
+
+class GridStore(object):
+    # Content-addressed store of grid files, each file is stored once under
+    # its SHA-256 (objects/<first 2 digits>/<remaining digits>) independent
+    # of the name and the number of slots using it. Objects are read-only.
+
+    def __init__(self, storedir: str):
+        self.__storedir = os.path.abspath(storedir)
+
+    def get_storedir(self) -> str:
+        return self.__storedir
+
+    def get_object(self, sha256: str) -> str:
+        return os.path.join(self.__storedir, "objects", sha256[:2], sha256[2:])
+
+    def has_object(self, sha256: str) -> bool:
+        return os.path.exists(self.get_object(sha256))
+
+    def add_file(self, filename: str) -> tuple:
+        # Returns (sha256, size), the file is only copied if not yet in the store
+        sha256 = hash_file(filename)
+        objectfile = self.get_object(sha256)
+        if not os.path.exists(objectfile):
+            objectdir = os.path.dirname(objectfile)
+            if not os.path.exists(objectdir):
+                os.makedirs(objectdir, 0o755, exist_ok=True)
+            tmpfile = f"{objectfile}.tmp{os.getpid()}"
+            # copied, not hardlinked: making the object read-only must not change the
+            # mode of the source file, and later changes of the source must not reach the store
+            shutil.copyfile(filename, tmpfile)
+            os.chmod(tmpfile, 0o444)
+            os.replace(tmpfile, objectfile)
+        else:
+            logging.debug("%s already in grid store as %s", filename, sha256)
+        return (sha256, os.path.getsize(filename))
+
+    def get_size(self) -> int:
+        size = 0
+        for root, _, files in os.walk(os.path.join(self.__storedir, "objects")):
+            size += sum([os.path.getsize(os.path.join(root, x)) for x in files])
+        return size
+
+class GridManifest(object):
+    # Grid files of a slot or production: name -> (sha256, size, xgrid iteration).
+    # The location of the grid store is stored relative to the manifest.
+
+    def __init__(self, storedir: str = ""):
+        self.__storedir = storedir
+        self.__entries = {}
+
+    def set_storedir(self, storedir: str):
+        self.__storedir = storedir
+
+    def get_storedir(self) -> str:
+        return self.__storedir
+
+    def get_store(self) -> GridStore:
+        return GridStore(self.__storedir)
+
+    def add_entry(self, gridfile: str, sha256: str, size: int):
+        self.__entries[gridfile] = {"sha256": sha256, "size": size, "xgriditer": get_xgrid_iteration(gridfile)}
+
+    def get_entry(self, gridfile: str) -> dict:
+        return self.__entries.get(gridfile)
+
+    def get_files(self) -> list:
+        return sorted(self.__entries.keys())
+
+    def is_file_uptodate(self, gridfile: str, filename: str) -> bool:
+        # Cheap size comparison first, hash only for files with matching size
+        entry = self.__entries[gridfile]
+        if not os.path.exists(filename) or os.path.getsize(filename) != entry["size"]:
+            return False
+        return hash_file(filename) == entry["sha256"]
+
+    def materialize(self, workdir: str, gridfiles: list = None) -> list:
+        # Provides all grid files (or the selected ones) in workdir, files already present
+        # with the expected content are kept. Returns the files which had to be staged.
+        store = self.get_store()
+        staged = []
+        for gridfile in self.get_files() if gridfiles is None else gridfiles:
+            target = os.path.join(workdir, gridfile)
+            if self.is_file_uptodate(gridfile, target):
+                continue
+            objectfile = store.get_object(self.__entries[gridfile]["sha256"])
+            if not os.path.exists(objectfile):
+                raise FileNotFoundError(f"Grid {gridfile} ({self.__entries[gridfile]['sha256']}) not found in grid store {store.get_storedir()}")
+            link_or_copy(objectfile, target)
+            staged.append(gridfile)
+        return staged
+
+    def read(self, filename: str):
+        with open(filename, "r") as manifestreader:
+            content = json.load(manifestreader)
+            manifestreader.close()
+        self.__storedir = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(filename)), content["store"]))
+        self.__entries = content["files"]
+
+    def write(self, filename: str):
+        content = {
+            "version": MANIFEST_VERSION,
+            "store": os.path.relpath(os.path.abspath(self.__storedir), os.path.dirname(os.path.abspath(filename))),
+            "files": self.__entries
+        }
+        tmpfile = f"{filename}.tmp"
+        with open(tmpfile, "w") as manifestwriter:
+            json.dump(content, manifestwriter, indent=1, sort_keys=True)
+            manifestwriter.close()
+        os.replace(tmpfile, filename)
+
+def load_manifest(filename: str) -> GridManifest:
+    manifest = GridManifest()
+    manifest.read(filename)
+    return manifest
+
+def find_manifest(griddir: str) -> str:
+    # Manifest file in the grid directory, empty string if not existing
+    manifestfile = os.path.join(griddir, MANIFEST_NAME)
+    return manifestfile if os.path.exists(manifestfile) else ""
+
+def find_repository_manifest(gridrepository: str) -> str:
+    # Manifest of a grid repository given either as manifest file or as directory
+    if gridrepository.endswith(".json"):
+        return gridrepository if os.path.exists(gridrepository) else ""
+    if os.path.isdir(gridrepository):
+        return find_manifest(gridrepository)
+    return ""
+
+def build_manifest(griddir: str, gridfiles: list, storedir: str) -> GridManifest:
+    store = GridStore(storedir)
+    manifest = GridManifest(store.get_storedir())
+    for gridfile in gridfiles:
+        sha256, size = store.add_file(os.path.join(griddir, gridfile))
+        manifest.add_entry(gridfile, sha256, size)
+    return manifest
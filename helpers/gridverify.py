@@ -0,0 +1,166 @@
+#! /usr/bin/env python3
+
+import json
+import logging
+import os
+import re
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from zipfile import BadZipFile, ZipFile
+
+from helpers.gridarchive import gridarchive
+from helpers.gridstore import MANIFEST_NAME, get_xgrid_iteration, hash_file, load_manifest
+from helpers.processpool import get_number_of_cpus
+
+REPORT_VERSION = 1
+READ_BLOCKSIZE = 4 * 1024 * 1024
+SEEDED_GRIDFILE = re.compile(r"^(pwggrid|pwgubound|pwggridinfo-btl-xg\d+)-(\d+)\.dat$")
+
+def get_seed(gridfile: str):
+    # Seed of grid files from the parallel stages, None for sequential grid files
+    match = SEEDED_GRIDFILE.match(os.path.basename(gridfile))
+    return int(match.group(2)) if match else None
+
+def check_gridfile_consistency(gridfiles: list) -> list:
+    # Returns a list of problems, empty list if the grid files form a complete set
+    errors = []
+    archive = gridarchive()
+    archive.add_files(gridfiles)
+    if not archive.check():
+        errors.append("Inconsistent number of grids ({}), ubounds ({}) and xgrid infos ({})".format(archive.number_grids(), archive.number_ubounds(), archive.number_xginfos()))
+    xginfos = [x for x in gridfiles if "pwggridinfo-btl-xg" in x]
+    iterations = sorted(set([get_xgrid_iteration(os.path.basename(x)) for x in xginfos]))
+    if len(iterations) > 1:
+        errors.append("Mixed xgrid iterations: {}".format(", ".join(["{}".format(x) for x in iterations])))
+    seeds = {}
+    for gridfile in gridfiles:
+        match = SEEDED_GRIDFILE.match(os.path.basename(gridfile))
+        if match:
+            category = "pwggridinfo" if match.group(1).startswith("pwggridinfo") else match.group(1)
+            seeds.setdefault(category, set()).add(int(match.group(2)))
+    if len(seeds):
+        allseeds = set()
+        for seedset in seeds.values():
+            allseeds |= seedset
+        # seeds of the parallel stages are numbered 1 ... number of seeds
+        expected = set(range(1, max(allseeds) + 1))
+        for category in ["pwggrid", "pwgubound", "pwggridinfo"]:
+            missing = sorted(expected - seeds.get(category, set()))
+            if len(missing):
+                errors.append("{} missing for seeds {}".format(category, ", ".join(["%04d" %x for x in missing])))
+    return errors
+
+def verify_zip(filename: str) -> dict:
+    result = {"gridfiles": [], "errors": []}
+    try:
+        with ZipFile(filename, "r") as archive:
+            for member in archive.infolist():
+                if member.is_dir():
+                    continue
+                result["gridfiles"].append(member.filename)
+                if member.file_size == 0:
+                    result["errors"].append(f"Empty member {member.filename}")
+                try:
+                    # reading to the end verifies the CRC of the member
+                    with archive.open(member, "r") as reader:
+                        while reader.read(READ_BLOCKSIZE):
+                            pass
+                except (BadZipFile, zlib.error, EOFError, OSError) as e:
+                    result["errors"].append(f"Corrupted member {member.filename}: {e}")
+            archive.close()
+    except (BadZipFile, OSError) as e:
+        result["errors"].append(f"Cannot read archive: {e}")
+    return result
+
+def verify_manifest(filename: str, deep: bool = False) -> dict:
+    # Objects must exist in the grid store with the expected size,
+    # in deep mode the SHA-256 of all objects is recalculated
+    result = {"gridfiles": [], "errors": []}
+    try:
+        manifest = load_manifest(filename)
+    except (OSError, ValueError, KeyError) as e:
+        result["errors"].append(f"Cannot read manifest: {e}")
+        return result
+    store = manifest.get_store()
+    for gridfile in manifest.get_files():
+        result["gridfiles"].append(gridfile)
+        entry = manifest.get_entry(gridfile)
+        objectfile = store.get_object(entry["sha256"])
+        if not os.path.exists(objectfile):
+            result["errors"].append(f"Object {entry['sha256']} for {gridfile} missing in grid store {store.get_storedir()}")
+        elif os.path.getsize(objectfile) != entry["size"]:
+            result["errors"].append(f"Object {entry['sha256']} for {gridfile} truncated ({os.path.getsize(objectfile)} of {entry['size']} bytes)")
+        elif deep and hash_file(objectfile) != entry["sha256"]:
+            result["errors"].append(f"Object {entry['sha256']} for {gridfile} corrupted")
+    return result
+
+def verify_archive(filename: str, deep: bool = False) -> dict:
+    if filename.endswith(".json"):
+        result = verify_manifest(filename, deep)
+        archivetype = "manifest"
+    else:
+        result = verify_zip(filename)
+        archivetype = "zip"
+    gridfiles = result["gridfiles"]
+    errors = result["errors"]
+    if len(gridfiles):
+        errors += check_gridfile_consistency(gridfiles)
+    elif not len(errors):
+        errors.append("No grid files found")
+    seeds = set([get_seed(x) for x in gridfiles])
+    seeds.discard(None)
+    iterations = set([get_xgrid_iteration(os.path.basename(x)) for x in gridfiles])
+    iterations.discard(None)
+    return {
+        "archive": filename,
+        "type": archivetype,
+        "ok": not len(errors),
+        "nfiles": len(gridfiles),
+        "nseeds": len(seeds),
+        "xgriditer": max(iterations) if len(iterations) else None,
+        "errors": errors
+    }
+
+def find_grid_archives(basedir: str) -> list:
+    # grids.zip and grid manifests in the production tree, the grid store itself is skipped
+    archives = []
+    for root, dirs, files in os.walk(basedir):
+        dirs[:] = sorted([x for x in dirs if x != "gridstore"])
+        for filename in sorted(files):
+            if filename == "grids.zip" or filename == MANIFEST_NAME:
+                archives.append(os.path.join(root, filename))
+    return archives
+
+def verify_archives(archives: list, njobs: int = 0, deep: bool = False) -> list:
+    if njobs <= 0:
+        njobs = get_number_of_cpus()
+    results = []
+    if njobs == 1 or len(archives) < 2:
+        for archive in archives:
+            results.append(verify_archive(archive, deep))
+            log_result(len(results), len(archives), results[-1])
+        return results
+    with ProcessPoolExecutor(max_workers=min(njobs, len(archives))) as executor:
+        for result in executor.map(verify_archive, archives, [deep] * len(archives)):
+            results.append(result)
+            log_result(len(results), len(archives), result)
+    return results
+
+def log_result(index: int, total: int, result: dict):
+    if result["ok"]:
+        logging.info("[%d/%d] %s: OK (%d files)", index, total, result["archive"], result["nfiles"])
+        return
+    logging.error("[%d/%d] %s: FAILED", index, total, result["archive"])
+    for error in result["errors"]:
+        logging.error("    %s", error)
+
+def write_report(results: list, reportfile: str):
+    report = {
+        "version": REPORT_VERSION,
+        "narchives": len(results),
+        "nfailed": len([x for x in results if not x["ok"]]),
+        "archives": results
+    }
+    with open(reportfile, "w") as reportwriter:
+        json.dump(report, reportwriter, indent=1)
+        reportwriter.close()
@@ -0,0 +1,119 @@
+#! /usr/bin/env python3
+
+import gzip
+import logging
+import os
+import shutil
+
+from helpers.pwgeventsindex import get_index_name
+
+try:
+    # zstd in the standard library from python 3.14
+    from compression import zstd
+except ImportError:
+    zstd = None
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+LHE_SUFFIXES = {"gzip": ".gz", "zstd": ".zst"}
+DEFAULT_LHE_CODEC = "gzip"
+COPY_BLOCKSIZE = 16 * 1024 * 1024
+
+def get_lhe_codecs() -> list:
+    codecs = ["gzip"]
+    if zstd is not None or zstandard is not None:
+        codecs.append("zstd")
+    return codecs
+
+def get_lhe_codec(filename: str) -> str:
+    # Compression codec from the file name, empty string for plain LHE files
+    for codec, suffix in LHE_SUFFIXES.items():
+        if filename.endswith(suffix):
+            return codec
+    return ""
+
+def is_compressed_lhe(filename: str) -> bool:
+    return len(get_lhe_codec(filename)) > 0
+
+def get_lhe_candidates(filename: str) -> list:
+    # Plain file first, then the compressed variants
+    return [filename] + [f"{filename}{x}" for x in LHE_SUFFIXES.values()]
+
+def find_lhe(filename: str) -> str:
+    # Existing plain or compressed variant of the LHE file, empty string if none exists
+    for candidate in get_lhe_candidates(filename):
+        if os.path.exists(candidate):
+            return candidate
+    return ""
+
+def check_zstd():
+    if zstd is None and zstandard is None:
+        raise ImportError("zstd compressed LHE files require python >= 3.14 or the zstandard package")
+
+def open_lhe(filename: str):
+    # Binary stream of the decompressed content
+    codec = get_lhe_codec(filename)
+    if codec == "gzip":
+        return gzip.open(filename, "rb")
+    if codec == "zstd":
+        check_zstd()
+        if zstd is not None:
+            return zstd.open(filename, "rb")
+        return zstandard.ZstdDecompressor().stream_reader(open(filename, "rb"), closefd=True)
+    return open(filename, "rb")
+
+def open_lhe_writer(filename: str, codec: str = "", level: int = None):
+    if codec == "gzip":
+        return gzip.open(filename, "wb", compresslevel=level if level is not None else 6)
+    if codec == "zstd":
+        check_zstd()
+        if zstd is not None:
+            return zstd.open(filename, "wb", level=level)
+        return zstandard.ZstdCompressor(level=level if level is not None else 3).stream_writer(open(filename, "wb"), closefd=True)
+    return open(filename, "wb")
+
+def convert_lhe(source: str, target: str, level: int = None):
+    # Codecs from the file names. Written to a temporary file first,
+    # the target only appears when complete.
+    tmpfile = f"{target}.tmp"
+    try:
+        with open_lhe(source) as reader:
+            with open_lhe_writer(tmpfile, get_lhe_codec(target), level) as writer:
+                shutil.copyfileobj(reader, writer, COPY_BLOCKSIZE)
+        os.replace(tmpfile, target)
+    except:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+        raise
+
+def remove_lhe(filename: str):
+    # Removes the LHE file together with its event index
+    os.remove(filename)
+    indexfile = get_index_name(filename)
+    if os.path.exists(indexfile):
+        os.remove(indexfile)
+
+def compress_lhe(filename: str, codec: str = DEFAULT_LHE_CODEC, level: int = None) -> str:
+    # Compresses the plain LHE file in place, returns the name of the compressed file
+    if not codec in LHE_SUFFIXES:
+        raise ValueError(f"LHE compression codec {codec} not supported (available: {', '.join(get_lhe_codecs())})")
+    target = f"{filename}{LHE_SUFFIXES[codec]}"
+    plainsize = os.path.getsize(filename)
+    convert_lhe(filename, target, level)
+    shutil.copystat(filename, target)
+    remove_lhe(filename)
+    logging.info("Compressed %s (%.1f MB -> %.1f MB)", filename, plainsize / (1024 * 1024), os.path.getsize(target) / (1024 * 1024))
+    return target
+
+def decompress_lhe(filename: str) -> str:
+    # Decompresses the compressed LHE file in place, returns the name of the plain file
+    codec = get_lhe_codec(filename)
+    if not len(codec):
+        return filename
+    target = filename[:-len(LHE_SUFFIXES[codec])]
+    convert_lhe(filename, target)
+    remove_lhe(filename)
+    logging.info("Decompressed %s", filename)
+    return target
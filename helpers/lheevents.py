@@ -0,0 +1,174 @@
+#! /usr/bin/env python3
+
+import logging
+import math
+from array import array
+
+from helpers.lhecompression import is_compressed_lhe, open_lhe
+from helpers.pwgeventsindex import load_index
+from helpers.pwgeventsparser import SCAN_BLOCKSIZE, TAG_EVENT_END, TAG_EVENT_START, pwgeventsparser
+
+try:
+    import numpy
+except ImportError:
+    # events are still readable, particles and weights as plain python containers
+    numpy = None
+
+TAG_RWGT_START = "<rwgt>"
+TAG_RWGT_END = "</rwgt>"
+PARTICLE_FIELDS = ["id", "status", "mother1", "mother2", "color1", "color2", "px", "py", "pz", "e", "m", "lifetime", "spin"]
+NPARTICLE_INTFIELDS = 6
+PARTICLE_DTYPE = None
+if numpy is not None:
+    PARTICLE_DTYPE = numpy.dtype([(x, numpy.int32) for x in PARTICLE_FIELDS[:NPARTICLE_INTFIELDS]] + [(x, numpy.float64) for x in PARTICLE_FIELDS[NPARTICLE_INTFIELDS:]])
+
+def get_header_weightids(filename: str) -> list:
+    # Weight IDs in the order of the header (non-grouped weights first, then the weight groups)
+    decoder = pwgeventsparser(filename)
+    decoder.parse_header()
+    infos = decoder.get_eventinfos()
+    weightids = [x.id for x in infos.get_weights_non_grouped()]
+    for group in infos.get_weightgroups():
+        weightids += [x.id for x in group.get_list_of_weights() if not x.id in weightids]
+    return weightids
+
+class lhe_event:
+    # Event record: values of the <event> header line (NUP, IDPRUP, XWGTUP, SCALUP,
+    # AQEDUP, AQCDUP), the particle block as structured array with the fields in
+    # PARTICLE_FIELDS and the weights aligned to the weight IDs of the file header
+    # (NaN for weights missing in the event). Without numpy particles are a list of
+    # tuples and weights an array of doubles.
+
+    __slots__ = ("__index", "__nparticles", "__processid", "__weight", "__scale", "__alphaqed", "__alphaqcd", "__particles", "__weights")
+
+    def __init__(self, index: int, headervalues: list, particles, weights):
+        self.__index = index
+        self.__nparticles = int(headervalues[0])
+        self.__processid = int(headervalues[1])
+        self.__weight = float(headervalues[2])
+        self.__scale = float(headervalues[3])
+        self.__alphaqed = float(headervalues[4])
+        self.__alphaqcd = float(headervalues[5])
+        self.__particles = particles
+        self.__weights = weights
+
+    def get_index(self) -> int:
+        return self.__index
+
+    def get_nparticles(self) -> int:
+        return self.__nparticles
+
+    def get_processid(self) -> int:
+        return self.__processid
+
+    def get_weight(self) -> float:
+        return self.__weight
+
+    def get_scale(self) -> float:
+        return self.__scale
+
+    def get_alphaqed(self) -> float:
+        return self.__alphaqed
+
+    def get_alphaqcd(self) -> float:
+        return self.__alphaqcd
+
+    def get_particles(self):
+        return self.__particles
+
+    def get_weights(self):
+        return self.__weights
+
+    index = property(fget=get_index)
+    nparticles = property(fget=get_nparticles)
+    processid = property(fget=get_processid)
+    weight = property(fget=get_weight)
+    scale = property(fget=get_scale)
+    alphaqed = property(fget=get_alphaqed)
+    alphaqcd = property(fget=get_alphaqcd)
+    particles = property(fget=get_particles)
+    weights = property(fget=get_weights)
+
+def decode_particles(lines: list):
+    values = " ".join(lines).split()
+    if numpy is None:
+        return [tuple([int(float(x)) for x in values[i:i + NPARTICLE_INTFIELDS]] + [float(x) for x in values[i + NPARTICLE_INTFIELDS:i + len(PARTICLE_FIELDS)]]) for i in range(0, len(values), len(PARTICLE_FIELDS))]
+    table = numpy.array(values, dtype=numpy.float64).reshape(len(lines), len(PARTICLE_FIELDS))
+    particles = numpy.empty(len(lines), dtype=PARTICLE_DTYPE)
+    for column, field in enumerate(PARTICLE_FIELDS):
+        particles[field] = table[:, column]
+    return particles
+
+def decode_weights(lines: list, weightindex: dict, missingvalue: float = math.nan):
+    # <wgt id='...'> value </wgt> lines of the <rwgt> block
+    if numpy is None:
+        weights = array("d", [missingvalue] * len(weightindex))
+    else:
+        weights = numpy.full(len(weightindex), missingvalue)
+    for line in lines:
+        if not line.startswith("<wgt"):
+            continue
+        idstart = line.find("id=") + 4
+        idend = line.find(line[idstart - 1], idstart)
+        position = weightindex.get(line[idstart:idend])
+        if position is None:
+            continue
+        try:
+            weights[position] = float(line[line.find(">") + 1:line.find("</wgt>")])
+        except ValueError:
+            # Fortran overflow (*****) or garbage
+            weights[position] = math.nan
+    return weights
+
+def decode_event(index: int, eventdata: bytes, weightindex: dict, withparticles: bool = True, missingvalue: float = math.nan) -> lhe_event:
+    lines = [x.strip() for x in eventdata.decode("utf-8", errors="replace").splitlines()]
+    lines = [x for x in lines if len(x)]
+    # first line is the <event> tag
+    headervalues = lines[1].split()
+    nparticles = int(headervalues[0])
+    particles = decode_particles(lines[2:2 + nparticles]) if withparticles else None
+    weightlines = []
+    if TAG_RWGT_START in lines:
+        start = lines.index(TAG_RWGT_START)
+        end = lines.index(TAG_RWGT_END) if TAG_RWGT_END in lines else len(lines)
+        weightlines = lines[start + 1:end]
+    return lhe_event(index, headervalues, particles, decode_weights(weightlines, weightindex, missingvalue))
+
+def iterate_events(filename: str, first: int = 0, maxevents: int = -1, weightids: list = None, withparticles: bool = True, missingvalue: float = math.nan):
+    # Generator over the events of the file, only one block and the current event are kept
+    # in memory. For plain files with an up-to-date event index the reader starts directly
+    # at event first. Incomplete events at the end of the file are ignored. Without
+    # withparticles the particle block is not decoded (particles None). Weights missing
+    # in an event are set to missingvalue.
+    if weightids is None:
+        weightids = get_header_weightids(filename)
+    weightindex = {weightid: position for position, weightid in enumerate(weightids)}
+    eventindex = first
+    nread = 0
+    with open_lhe(filename) as pwgreader:
+        index = load_index(filename) if first > 0 and not is_compressed_lhe(filename) else None
+        toskip = first
+        if index and first < index.get_nevents():
+            pwgreader.seek(index.get_event_offset(first))
+            toskip = 0
+        elif first > 0:
+            logging.debug("No event index for %s, skipping %d events", filename, first)
+        data = b""
+        while maxevents < 0 or nread < maxevents:
+            start = data.find(TAG_EVENT_START)
+            end = data.find(TAG_EVENT_END, start) if start > -1 else -1
+            if end < 0:
+                block = pwgreader.read(SCAN_BLOCKSIZE)
+                if not block:
+                    break
+                # keep only the (possibly partial) current event
+                data = (data[start:] if start > -1 else data[-len(TAG_EVENT_START):]) + block
+                continue
+            end += len(TAG_EVENT_END)
+            if toskip > 0:
+                toskip -= 1
+            else:
+                yield decode_event(eventindex, data[start:end], weightindex, withparticles, missingvalue)
+                eventindex += 1
+                nread += 1
+            data = data[end:]
@@ -0,0 +1,155 @@
+#! /usr/bin/env python3
+
+import logging
+import os
+
+import numpy
+from numpy.lib.format import open_memmap
+
+from helpers.lheevents import iterate_events
+from helpers.processpool import map_slotdirs
+from helpers.pwgeventsparser import pwgeventsparser
+
+FILL_CHUNKSIZE = 10000
+DEFAULT_MAXRATIO = 100.
+# Marker for weights missing in an event, never written by POWHEG
+MISSING_WEIGHT = numpy.finfo(numpy.float64).max
+
+def get_weight_names(prefix: str) -> tuple:
+    # (weight table, weight index) for the output prefix
+    return (f"{prefix}.npy", f"{prefix}_index.npz")
+
+def inspect_eventfile(eventfile: str) -> tuple:
+    # Number of complete events and weights (group, id, description) of the event file,
+    # weights in the order of pwgevents_info.get_all_weights
+    decoder = pwgeventsparser(eventfile)
+    decoder.parse()
+    infos = decoder.get_eventinfos()
+    groups = {}
+    for group in infos.get_weightgroups():
+        for weight in group.get_list_of_weights():
+            groups.setdefault(weight.id, group.get_name())
+    weights = []
+    for weight in infos.get_all_weights():
+        if not weight.id in [x[1] for x in weights]:
+            weights.append((groups.get(weight.id, ""), weight.id, weight.description))
+    return (infos.get_nevents(), weights)
+
+def merge_weights(weightlists: list) -> list:
+    # Weights of the first file, weights only present in later files are appended
+    merged = []
+    known = set()
+    for weights in weightlists:
+        for weight in weights:
+            if not weight[1] in known:
+                known.add(weight[1])
+                merged.append(weight)
+    return merged
+
+def fill_weights(eventfile: str, tablefile: str, first: int, nevents: int, weightids: list) -> int:
+    # Writes the weights of the events of the file into the rows first ... first + nevents
+    # of the memory-mapped table, returns the number of events written
+    table = open_memmap(tablefile, mode="r+")
+    chunk = []
+    nwritten = 0
+    for event in iterate_events(eventfile, maxevents=nevents, weightids=weightids, withparticles=False):
+        chunk.append(event.weights)
+        if len(chunk) == FILL_CHUNKSIZE:
+            table[first + nwritten:first + nwritten + len(chunk)] = numpy.vstack(chunk)
+            nwritten += len(chunk)
+            chunk = []
+    if len(chunk):
+        table[first + nwritten:first + nwritten + len(chunk)] = numpy.vstack(chunk)
+        nwritten += len(chunk)
+    table.flush()
+    del table
+    return nwritten
+
+def fill_weights_job(job: tuple, tablefile: str, weightids: list) -> int:
+    # Unpacks (eventfile, first row, number of events) for the process pool
+    eventfile, first, nevents = job
+    return fill_weights(eventfile, tablefile, first, nevents, weightids)
+
+def extract_weights(eventfiles: list, prefix: str, njobs: int = 1) -> bool:
+    # Event weights of all files in one table (events x weights) stored as .npy, rows in the order
+    # of the files. Files are processed in parallel, each worker fills its own row range of the
+    # memory-mapped table. The index stores the weight IDs, descriptions and groups together with
+    # the first row and number of events of each file. Weights missing in an event are NaN.
+    tablefile, indexfile = get_weight_names(prefix)
+    inspected = map_slotdirs(inspect_eventfile, eventfiles, njobs)
+    nevents = [x[0] for x in inspected]
+    weights = merge_weights([x[1] for x in inspected])
+    if not sum(nevents):
+        logging.error("No complete events found in %d files", len(eventfiles))
+        return False
+    firstrows = numpy.cumsum([0] + nevents[:-1], dtype=numpy.int64)
+    logging.info("Extracting %d weights for %d events from %d files", len(weights), sum(nevents), len(eventfiles))
+    table = open_memmap(tablefile, mode="w+", dtype=numpy.float64, shape=(sum(nevents), len(weights)))
+    table[:] = numpy.nan
+    table.flush()
+    del table
+    weightids = [x[1] for x in weights]
+    nwritten = map_slotdirs(fill_weights_job, list(zip(eventfiles, firstrows.tolist(), nevents)), njobs, (tablefile, weightids))
+    success = True
+    for eventfile, expected, written in zip(eventfiles, nevents, nwritten):
+        if written != expected:
+            logging.error("Only %d of %d events extracted from %s (file modified?)", written, expected, eventfile)
+            success = False
+    numpy.savez(indexfile,
+                ids=numpy.array(weightids, dtype=str),
+                descriptions=numpy.array([x[2] for x in weights], dtype=str),
+                groups=numpy.array([x[0] for x in weights], dtype=str),
+                files=numpy.array([os.path.abspath(x) for x in eventfiles], dtype=str),
+                firstrows=firstrows,
+                nevents=numpy.array(nevents, dtype=numpy.int64))
+    logging.info("Written weight table %s and index %s", tablefile, indexfile)
+    return success
+
+def check_weight_chunk(weights: numpy.ndarray, centralweights: numpy.ndarray, maxratio: float) -> tuple:
+    # Per weight the number of events in the chunk (events x weights) with missing, non-finite and
+    # extreme weights, plus the number of events with zero or non-finite central weight
+    ismissing = weights == MISSING_WEIGHT
+    isnonfinite = ~numpy.isfinite(weights)
+    goodcentral = numpy.isfinite(centralweights) & (centralweights != 0.)
+    ratios = numpy.divide(weights, centralweights[:, None], out=numpy.zeros_like(weights), where=~(ismissing | isnonfinite) & goodcentral[:, None])
+    return (ismissing.sum(axis=0), isnonfinite.sum(axis=0), (numpy.abs(ratios) > maxratio).sum(axis=0), int((~goodcentral).sum()))
+
+def validate_weights(eventfile: str, weightids: list, maxratio: float = DEFAULT_MAXRATIO, chunksize: int = FILL_CHUNKSIZE) -> dict:
+    # Checks for all events whether every weight of the header is present in the <rwgt> block,
+    # finite and within maxratio of the central weight (XWGTUP). Events are processed in chunks.
+    # Returns the number of events checked and, per weight ID, the number of events with missing,
+    # non-finite or extreme weights (only weight IDs with problems are listed).
+    counts = numpy.zeros((3, len(weightids)), dtype=numpy.int64)
+    nevents = 0
+    nbadcentral = 0
+    chunk = []
+    central = []
+    for event in iterate_events(eventfile, weightids=weightids, withparticles=False, missingvalue=MISSING_WEIGHT):
+        chunk.append(event.weights)
+        central.append(event.weight)
+        if len(chunk) == chunksize:
+            missing, nonfinite, extreme, badcentral = check_weight_chunk(numpy.vstack(chunk), numpy.array(central), maxratio)
+            counts += numpy.vstack([missing, nonfinite, extreme])
+            nbadcentral += badcentral
+            nevents += len(chunk)
+            chunk = []
+            central = []
+    if len(chunk):
+        missing, nonfinite, extreme, badcentral = check_weight_chunk(numpy.vstack(chunk), numpy.array(central), maxratio)
+        counts += numpy.vstack([missing, nonfinite, extreme])
+        nbadcentral += badcentral
+        nevents += len(chunk)
+    result = {"events": nevents, "badcentral": nbadcentral, "maxratio": maxratio}
+    for row, key in enumerate(["missing", "nonfinite", "extreme"]):
+        result[key] = {weightids[i]: int(counts[row][i]) for i in numpy.flatnonzero(counts[row])}
+    return result
+
+def is_weightcheck_ok(result: dict) -> bool:
+    return not (result["badcentral"] or len(result["missing"]) or len(result["nonfinite"]) or len(result["extreme"]))
+
+def load_weights(prefix: str, mmap: bool = True) -> tuple:
+    # Weight table (memory-mapped in read-only mode) and weight index
+    tablefile, indexfile = get_weight_names(prefix)
+    with numpy.load(indexfile) as indexreader:
+        index = {key: indexreader[key] for key in indexreader.files}
+    return (numpy.load(tablefile, mmap_mode="r" if mmap else None), index)
@@ -0,0 +1,54 @@
+#! /usr/bin/env python3
+
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+def get_number_of_cpus() -> int:
+    return len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else os.cpu_count()
+
+def process_slotdirs(function, slotdirs: list, njobs: int = 1, args: tuple = (), action: str = "Processed") -> int:
+    # Runs function(slotdir, *args) for all slot directories, in a process pool
+    # for njobs > 1 (0:=all available CPUs). Directories for which the function raises
+    # or returns False count as failed, returns the number of failed directories.
+    if njobs <= 0:
+        njobs = get_number_of_cpus()
+    nfailed = 0
+    ndone = 0
+    if njobs == 1:
+        for slotdir in slotdirs:
+            ndone += 1
+            start = time.time()
+            try:
+                if function(slotdir, *args) is False:
+                    raise RuntimeError("unsuccessful")
+                logging.info("[%d/%d] %s %s (%.1f s)", ndone, len(slotdirs), action, slotdir, time.time() - start)
+            except Exception as e:
+                nfailed += 1
+                logging.error("[%d/%d] Failed processing %s: %s", ndone, len(slotdirs), slotdir, e)
+        return nfailed
+    logging.info("Processing %d directories using %d processes", len(slotdirs), njobs)
+    with ProcessPoolExecutor(max_workers=njobs) as executor:
+        futures = {executor.submit(function, slotdir, *args): slotdir for slotdir in slotdirs}
+        for future in as_completed(futures):
+            ndone += 1
+            try:
+                if future.result() is False:
+                    raise RuntimeError("unsuccessful")
+                logging.info("[%d/%d] %s %s", ndone, len(slotdirs), action, futures[future])
+            except Exception as e:
+                nfailed += 1
+                logging.error("[%d/%d] Failed processing %s: %s", ndone, len(slotdirs), futures[future], e)
+    return nfailed
+
+def map_slotdirs(function, slotdirs: list, njobs: int = 1, args: tuple = ()) -> list:
+    # Results of function(slotdir, *args) in the order of the slot directories,
+    # exceptions are propagated
+    if njobs <= 0:
+        njobs = get_number_of_cpus()
+    if njobs == 1 or len(slotdirs) < 2:
+        return [function(slotdir, *args) for slotdir in slotdirs]
+    with ProcessPoolExecutor(max_workers=min(njobs, len(slotdirs))) as executor:
+        futures = [executor.submit(function, slotdir, *args) for slotdir in slotdirs]
+        return [future.result() for future in futures]
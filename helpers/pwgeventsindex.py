@@ -0,0 +1,163 @@
+#! /usr/bin/env python3
+
+import json
+import logging
+import os
+import sys
+from array import array
+
+INDEX_VERSION = 1
+
+def get_index_name(pwgfile: str) -> str:
+    return f"{pwgfile}.idx"
+
+class pwgeventsindex(object):
+    # Sidecar index of a pwgevents.lhe file. The index file consists of a
+    # single JSON line with the file summary (size and mtime of the event file,
+    # number of events, closing marker, header weights) followed by the byte
+    # offsets of all <event> tags as little-endian unsigned 64-bit integers.
+
+    def __init__(self, pwgfile: str):
+        self.__pwgfile = pwgfile
+        self.__indexfile = get_index_name(pwgfile)
+        self.__filesize = -1
+        self.__mtime = -1
+        self.__nevents = 0
+        self.__closingmarker = False
+        self.__lasteventend = -1
+        self.__weights = []
+        self.__offsets = None
+        self.__tableoffset = -1
+
+    def set_source_stat(self, stat: os.stat_result):
+        self.__filesize = stat.st_size
+        self.__mtime = stat.st_mtime_ns
+
+    def set_nevents(self, nevents: int):
+        self.__nevents = nevents
+
+    def set_closingmarker(self, doSet: bool):
+        self.__closingmarker = doSet
+
+    def set_lasteventend(self, offset: int):
+        self.__lasteventend = offset
+
+    def set_weights(self, weights: list):
+        # list of (weightgroup, id, description), weightgroup is None for non-grouped weights
+        self.__weights = weights
+
+    def set_offsets(self, offsets: array):
+        self.__offsets = offsets
+
+    def get_indexfile(self) -> str:
+        return self.__indexfile
+
+    def get_nevents(self) -> int:
+        return self.__nevents
+
+    def has_closingmarker(self) -> bool:
+        return self.__closingmarker
+
+    def get_lasteventend(self) -> int:
+        return self.__lasteventend
+
+    def get_weights(self) -> list:
+        return self.__weights
+
+    def get_offsets(self) -> array:
+        if self.__offsets is None:
+            self.__offsets = self.__read_offsets(0, self.__nevents)
+        return self.__offsets
+
+    def get_event_offset(self, index: int) -> int:
+        if index < 0 or index >= self.__nevents:
+            raise IndexError(f"Event {index} out of range (file has {self.__nevents} events)")
+        if self.__offsets is not None:
+            return self.__offsets[index]
+        return self.__read_offsets(index, 1)[0]
+
+    def get_event_range(self, index: int) -> tuple:
+        # Byte range [start, end) of event index, end is the start of the next event
+        # or, for the last event, the position behind its closing </event> tag
+        start = self.get_event_offset(index)
+        end = self.get_event_offset(index + 1) if index + 1 < self.__nevents else self.__lasteventend
+        return (start, end)
+
+    def is_valid(self) -> bool:
+        if self.__filesize < 0 or not os.path.exists(self.__pwgfile):
+            return False
+        stat = os.stat(self.__pwgfile)
+        return stat.st_size == self.__filesize and stat.st_mtime_ns == self.__mtime
+
+    def read(self) -> bool:
+        if not os.path.exists(self.__indexfile):
+            return False
+        try:
+            with open(self.__indexfile, "rb") as indexreader:
+                summary = json.loads(indexreader.readline().decode("utf-8"))
+                self.__tableoffset = indexreader.tell()
+        except (OSError, ValueError) as e:
+            logging.warning("Failed reading event index %s: %s", self.__indexfile, e)
+            return False
+        if summary.get("version") != INDEX_VERSION:
+            logging.debug("Event index %s has different version, ignoring", self.__indexfile)
+            return False
+        self.__filesize = summary["size"]
+        self.__mtime = summary["mtime"]
+        self.__nevents = summary["nevents"]
+        self.__closingmarker = summary["closingmarker"]
+        self.__lasteventend = summary["lasteventend"]
+        self.__weights = [tuple(x) for x in summary["weights"]]
+        self.__offsets = None
+        return True
+
+    def write(self) -> bool:
+        summary = {
+            "version": INDEX_VERSION,
+            "size": self.__filesize,
+            "mtime": self.__mtime,
+            "nevents": self.__nevents,
+            "closingmarker": self.__closingmarker,
+            "lasteventend": self.__lasteventend,
+            "weights": self.__weights
+        }
+        offsets = self.__offsets if self.__offsets is not None else array("Q")
+        if sys.byteorder != "little":
+            offsets = array("Q", offsets)
+            offsets.byteswap()
+        tmpfile = f"{self.__indexfile}.tmp"
+        try:
+            with open(tmpfile, "wb") as indexwriter:
+                indexwriter.write(json.dumps(summary).encode("utf-8"))
+                indexwriter.write(b"\n")
+                offsets.tofile(indexwriter)
+            os.replace(tmpfile, self.__indexfile)
+        except OSError as e:
+            logging.warning("Failed writing event index %s: %s", self.__indexfile, e)
+            if os.path.exists(tmpfile):
+                os.remove(tmpfile)
+            return False
+        return True
+
+    def remove(self):
+        if os.path.exists(self.__indexfile):
+            os.remove(self.__indexfile)
+
+    def __read_offsets(self, first: int, count: int) -> array:
+        result = array("Q")
+        with open(self.__indexfile, "rb") as indexreader:
+            indexreader.seek(self.__tableoffset + first * result.itemsize)
+            result.fromfile(indexreader, count)
+        if sys.byteorder != "little":
+            result.byteswap()
+        return result
+
+def load_index(pwgfile: str) -> pwgeventsindex:
+    # Returns the index of the event file if existing and up to date, None otherwise
+    index = pwgeventsindex(pwgfile)
+    if not index.read():
+        return None
+    if not index.is_valid():
+        logging.debug("Event index for %s outdated", pwgfile)
+        return None
+    return index
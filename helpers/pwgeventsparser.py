@@ -1,10 +1,42 @@
 #! /usr/bin/env python3
 
+import io
 import logging
 import os
+from array import array
+
+from helpers.lhecompression import is_compressed_lhe, open_lhe
+from helpers.pwgeventsindex import pwgeventsindex, load_index
+
+SCAN_BLOCKSIZE = 16 * 1024 * 1024
+TAG_HEADER_START = b"<header>"
+TAG_HEADER_END = b"</header>"
+TAG_EVENT_START = b"<event>"
+TAG_EVENT_END = b"</event>"
+TAG_FILE_END = b"</LesHouchesEvents>"
+SCAN_OVERLAP = len(TAG_FILE_END) - 1
+TAIL_BLOCKSIZE = 64 * 1024
+HEADER_BLOCKSIZE = 256 * 1024
+
+def find_last_event_end(pwgreader, filesize: int, minpos: int = 0) -> int:
+    # Search backwards from the end of the file for the last closing event tag.
+    # Returns the offset directly behind the tag, -1 if no complete event is found.
+    end = filesize
+    while end > minpos:
+        start = max(minpos, end - TAIL_BLOCKSIZE)
+        pwgreader.seek(start)
+        # Overlap with the previous window in case the tag is split at the boundary
+        data = pwgreader.read(end - start + len(TAG_EVENT_END) - 1)
+        pos = data.rfind(TAG_EVENT_END)
+        if pos > -1:
+            return start + pos + len(TAG_EVENT_END)
+        end = start
+    return -1
 
 class weight_entry:
 
+    __slots__ = ("__id", "__description")
+
     def __init__(self, id: str ="", description: str = ""):
         self.__id = id
         self.__description = description
@@ -36,9 +68,12 @@ class weight_entry:
 
 class weight_group:
 
+    __slots__ = ("__name", "__weights", "__weightsbyid")
+
     def __init__(self, name: str):
         self.__name = name
         self.__weights = []
+        self.__weightsbyid = {}
 
     def __lt__(self, other):
         if isinstance(other, weight_group):
@@ -51,13 +86,18 @@ class weight_group:
         return False
 
     def set_name(self, name: str):
-        self.__name == name
+        self.__name = name
 
-    def add_weight(self, weight: weight_entry):
+    def add_weight(self, weight, description: str = "") -> weight_entry:
+        # Accepts either a weight_entry or weight ID and description,
+        # weights with an ID already present in the group are ignored
+        if not isinstance(weight, weight_entry):
+            weight = weight_entry(weight, description)
+        if weight.id in self.__weightsbyid:
+            return self.__weightsbyid[weight.id]
         self.__weights.append(weight)
-
-    def add_weight(self, id: str, description: str):
-        self.__weights.append(weight_entry(id, description))
+        self.__weightsbyid[weight.id] = weight
+        return weight
     
     def add_weights(self, weights: list):
         for entry in weights:
@@ -70,37 +110,46 @@ class weight_group:
         return self.__weights
 
     def has_weight(self, id: str) -> bool:
-        return self.find_weight(id) != None
+        return id in self.__weightsbyid
 
     def find_weight(self, id: str) -> weight_entry:
-        found = [x for x in self.__weights if x.id  == id ]
-        if not len(found) or len(found) > 1:
-            return None
-        return found[0]
+        return self.__weightsbyid.get(id)
 
     name = property(fget=get_name, fset=set_name)
 
 class pwgevents_info:
 
+    __slots__ = ("__nevents", "__weights", "__weightgroups", "__groupsbyname", "__nongroupedbyid", "__weightsbyid",
+                 "__sortedweights", "__closingmarker", "__exists", "__nonempty", "__lasteventend", "__eventcounter")
+
     def __init__(self):
-        self.__nevents = 0
-        self.__weights = []
-        self.__weightgroups = []
-        self.__closingmarker = False
-        self.__exists = False
-        self.__nonempty = False
+        self.reset()
 
     def reset(self):
         self.__nevents = 0
         self.__weights = []
         self.__weightgroups = []
+        self.__groupsbyname = {}
+        self.__nongroupedbyid = {}
+        self.__weightsbyid = {}
+        self.__sortedweights = None
         self.__closingmarker = False
         self.__exists = False
         self.__nonempty = False 
+        self.__lasteventend = -1
+        self.__eventcounter = None
 
     def set_nevents(self, nevents: str):
         self.__nevents = nevents
 
+    def set_eventcounter(self, counter):
+        # Defer the event count: counter is only called when the number of events is requested
+        self.__nevents = None
+        self.__eventcounter = counter
+
+    def set_lasteventend(self, offset: int):
+        self.__lasteventend = offset
+
     def set_closingmarker(self, doSet: bool):
         self.__closingmarker = doSet
 
@@ -114,8 +163,22 @@ class pwgevents_info:
         self.__nevents += 1
 
     def get_nevents(self) -> int:
+        if self.__nevents is None:
+            self.__nevents = self.__eventcounter() if self.__eventcounter else 0
+            self.__eventcounter = None
         return self.__nevents
 
+    def is_nevents_evaluated(self) -> bool:
+        return self.__nevents is not None
+
+    def get_lasteventend(self) -> int:
+        return self.__lasteventend
+
+    def has_complete_event(self) -> bool:
+        if self.__lasteventend > -1:
+            return True
+        return self.is_nevents_evaluated() and self.__nevents > 0
+
     def has_closingmarker(self) -> bool:
         return self.__closingmarker
 
@@ -126,17 +189,23 @@ class pwgevents_info:
         return self.__nonempty
 
     def add_weight_non_grouped(self, id: str, description: str):
-        if not self.find_weight(id):
-            self.__weights.append(weight_entry(id, description))
+        if not id in self.__weightsbyid:
+            entry = weight_entry(id, description)
+            self.__weights.append(entry)
+            self.__nongroupedbyid[id] = entry
+            self.__weightsbyid[id] = entry
+            self.__sortedweights = None
 
     def add_weight_in_group(self, weightgroup: str, id: str, description: str):
-        foundgroup = self.find_weightgroup(weightgroup)
-        if foundgroup != None:
-            foundgroup.add_weight(id, description)
-        else:
-            nextgroup = weight_group(weightgroup)
-            nextgroup.add_weight(id, description)
-            self.__weightgroups.append(nextgroup)
+        foundgroup = self.__groupsbyname.get(weightgroup)
+        if foundgroup is None:
+            foundgroup = weight_group(weightgroup)
+            self.__weightgroups.append(foundgroup)
+            self.__groupsbyname[weightgroup] = foundgroup
+        entry = foundgroup.add_weight(id, description)
+        # First occurrence of an ID wins in the lookup over all weights
+        self.__weightsbyid.setdefault(id, entry)
+        self.__sortedweights = None
 
     def get_weightgroups(self) -> list:
         return self.__weightgroups
@@ -145,50 +214,30 @@ class pwgevents_info:
         return self.__weights
 
     def get_all_weights(self) -> list:
-        result = []
-        for weight in self.__weights:
-            result.append(weight)
-        for grp in self.__weightgroups:
-            for weight in grp.get_list_of_weights():
-                result.append(weight)
-        return sorted(result)
+        if self.__sortedweights is None:
+            result = list(self.__weights)
+            for grp in self.__weightgroups:
+                result += grp.get_list_of_weights()
+            self.__sortedweights = sorted(result)
+        return list(self.__sortedweights)
 
     def has_weightgroup(self, name) -> bool:
-        return self.find_weightgroup(name) != None
+        return name in self.__groupsbyname
 
     def has_weight(self, id: str) -> bool:
-        return self.find_weight(id) != None
+        return id in self.__weightsbyid
     
     def has_weight_non_grouped(self, id: str):
-        return self.find_weight_non_grouped(id) == None
+        return id in self.__nongroupedbyid
 
     def find_weightgroup(self, name) -> weight_group:
-        found = [x for x in self.__weightgroups if x.name == name]
-        if not len(found) or len(found) > 1:
-            return None
-        return found[0]
+        return self.__groupsbyname.get(name)
     
     def find_weight_non_grouped(self, id: str) -> weight_entry:
-        found = [x for x in self.__weights if x.name == id]
-        if not len(found) or len(found) > 1:
-            return None
-        return found[0]
+        return self.__nongroupedbyid.get(id)
 
     def find_weight(self, id: str) -> weight_entry:
-        result = None
-        found = [x for x in self.__weights if x.id == id]
-        if len(found) == 1:
-            # weight is non-grouped
-            result = found[0]
-        else:
-            # check whether weight is grouped
-            groupresult = None
-            for grp in self.__weightgroups:
-                groupresult = grp.find_weight(id)
-                if groupresult:
-                    result = groupresult
-                    break
-        return result
+        return self.__weightsbyid.get(id)
 
     nevents = property(fget=get_nevents, fset=set_nevents)
     closingmarker = property(fget=has_closingmarker, fset=set_closingmarker)
@@ -262,22 +311,235 @@ class pwgeventsparser(object):
             description=next[:delim_end].lstrip().rstrip()
             return (id, description)
 
-    def __init__(self, filename: str):
+    def __init__(self, filename: str, fastscan: bool = True, useindex: bool = True):
         self.__filename = filename
         self.__headerparser = self.__HeaderParser()
         self.__eventinfos = pwgevents_info()
+        self.__fastscan = fastscan
+        self.__useindex = useindex
+        self.__index: pwgeventsindex = None
+
+    def set_fastscan(self, doSet: bool):
+        self.__fastscan = doSet
+
+    def set_useindex(self, doSet: bool):
+        self.__useindex = doSet
+
+    def is_fastscan(self) -> bool:
+        return self.__fastscan
+
+    def is_useindex(self) -> bool:
+        return self.__useindex
 
     def get_eventinfos(self) -> pwgevents_info:
         return self.__eventinfos
 
+    def get_index(self) -> pwgeventsindex:
+        return self.__index
+
     def parse(self):
         self.__eventinfos.reset()
+        self.__headerparser.clear()
+        self.__index = None
+        if not os.path.exists(self.__filename):
+            logging.error("Event file %s not existing", self.__filename)
+            return
+        self.__eventinfos.set_fileexists(True)
+        if self.__fastscan:
+            if self.__useindex and self.__load_index():
+                return
+            self.__scan_blocks()
+        else:
+            self.__parse_lines()
+
+    def quickcheck(self):
+        # Fast completeness check: decodes only the header and inspects the
+        # tail of the file for the closing marker and the last complete event.
+        # The number of events is evaluated lazily on first request.
+        self.__eventinfos.reset()
+        self.__headerparser.clear()
+        self.__index = None
+        if not os.path.exists(self.__filename):
+            logging.error("Event file %s not existing", self.__filename)
+            return
+        self.__eventinfos.set_fileexists(True)
+        if self.__useindex and self.__load_index():
+            return
+        if is_compressed_lhe(self.__filename):
+            # no random access to the tail of compressed files, the stream is scanned instead
+            self.__scan_blocks()
+            return
+        filesize = os.path.getsize(self.__filename)
+        if not filesize:
+            return
+        self.__eventinfos.set_nonempty(True)
+        with open(self.__filename, "rb") as pwgreader:
+            data = self.__read_header(pwgreader)
+            header_end = data.find(TAG_HEADER_END)
+            minpos = header_end + len(TAG_HEADER_END) if header_end > -1 else 0
+            lasteventend = find_last_event_end(pwgreader, filesize, minpos)
+            self.__eventinfos.set_lasteventend(lasteventend)
+            # Closing marker can only follow the last complete event
+            pwgreader.seek(lasteventend if lasteventend > -1 else minpos)
+            self.__eventinfos.set_closingmarker(pwgreader.read().find(TAG_FILE_END) > -1)
+        self.__eventinfos.set_eventcounter(self.__count_events)
+
+    def parse_header(self):
+        # Decode only the header (i.e. the weights), the number of events is evaluated lazily
+        self.__eventinfos.reset()
+        self.__headerparser.clear()
+        self.__index = None
+        if not os.path.exists(self.__filename):
+            logging.error("Event file %s not existing", self.__filename)
+            return
+        self.__eventinfos.set_fileexists(True)
+        if self.__useindex and self.__load_index():
+            return
+        with open_lhe(self.__filename) as pwgreader:
+            data = self.__read_header(pwgreader)
+        if not len(data):
+            return
+        self.__eventinfos.set_nonempty(True)
+        self.__eventinfos.set_eventcounter(self.__count_events)
+
+    def read_event(self, index: int) -> str:
+        # Random access to a single event (including <event> tags) via the event index
+        if not self.__index:
+            self.__index = load_index(self.__filename)
+        if not self.__index:
+            self.__index = self.build_index()
+        if not self.__index:
+            raise IndexError(f"No event index available for {self.__filename}")
+        start, end = self.__index.get_event_range(index)
+        with open_lhe(self.__filename) as pwgreader:
+            # offsets refer to the decompressed content for compressed files
+            pwgreader.seek(start)
+            eventdata = pwgreader.read(end - start)
+        return eventdata[:eventdata.rfind(TAG_EVENT_END) + len(TAG_EVENT_END)].decode("utf-8")
+
+    def build_index(self) -> pwgeventsindex:
+        # Scan the file and write the sidecar index, independent of the completeness of the file
+        self.__eventinfos.reset()
+        self.__headerparser.clear()
+        self.__eventinfos.set_fileexists(os.path.exists(self.__filename))
+        self.__scan_blocks(True)
+        return self.__index
+
+    def __load_index(self) -> bool:
+        index = load_index(self.__filename)
+        if not index:
+            return False
+        logging.debug("Using event index %s", index.get_indexfile())
+        self.__index = index
+        self.__eventinfos.set_nonempty(os.path.getsize(self.__filename) > 0)
+        self.__eventinfos.set_nevents(index.get_nevents())
+        self.__eventinfos.set_closingmarker(index.has_closingmarker())
+        self.__eventinfos.set_lasteventend(index.get_lasteventend())
+        for weightgroup, id, description in index.get_weights():
+            if weightgroup is None:
+                self.__eventinfos.add_weight_non_grouped(id, description)
+            else:
+                self.__eventinfos.add_weight_in_group(weightgroup, id, description)
+        return True
+
+    def __write_index(self, stat: os.stat_result, offsets: array, lasteventend: int):
+        index = pwgeventsindex(self.__filename)
+        index.set_source_stat(stat)
+        index.set_nevents(self.__eventinfos.get_nevents())
+        index.set_closingmarker(self.__eventinfos.has_closingmarker())
+        index.set_lasteventend(lasteventend)
+        weights = [(None, x.id, x.description) for x in self.__eventinfos.get_weights_non_grouped()]
+        for grp in self.__eventinfos.get_weightgroups():
+            weights += [(grp.name, x.id, x.description) for x in grp.get_list_of_weights()]
+        index.set_weights(weights)
+        index.set_offsets(offsets)
+        if index.write():
+            logging.debug("Written event index %s", index.get_indexfile())
+            self.__index = index
+
+    def __count_events(self) -> int:
+        with open_lhe(self.__filename) as pwgreader:
+            nevents, _, _ = self.__count_tags(pwgreader, b"")
+        return nevents
+
+    def __read_header(self, pwgreader) -> bytes:
+        data = pwgreader.read(HEADER_BLOCKSIZE)
+        # Make sure the full header is in the first chunk (header always precedes the events)
+        while data.find(TAG_HEADER_END) < 0 and data.find(TAG_EVENT_START) < 0:
+            block = pwgreader.read(HEADER_BLOCKSIZE)
+            if not block:
+                break
+            data += block
+        header_start = data.find(TAG_HEADER_START)
+        header_end = data.find(TAG_HEADER_END)
+        if header_start > -1 and header_end > header_start:
+            logging.debug("Start decoding header")
+            headertext = data[header_start + len(TAG_HEADER_START):header_end].decode("utf-8", errors="replace")
+            for line in headertext.splitlines():
+                self.__headerparser.add_line(line.lstrip().rstrip())
+            self.__headerparser.decode(self.__eventinfos)
+        return data
+
+    def __count_tags(self, pwgreader, data: bytes, offsets: array = None) -> tuple:
+        # Returns the number of complete events, whether the closing marker was found
+        # and the end of the last complete event. If offsets is provided, the byte
+        # offsets of all <event> tags are collected in addition (data starting at
+        # the beginning of the file).
+        nopen = 0
+        nclose = 0
+        nmarker = 0
+        lasteventend = -1
+        overlap = b""
+        dataoffset = 0
+        while True:
+            # Tags fully contained in the overlap were already counted with the previous block
+            nopen += data.count(TAG_EVENT_START) - overlap.count(TAG_EVENT_START)
+            nclose += data.count(TAG_EVENT_END) - overlap.count(TAG_EVENT_END)
+            nmarker += data.count(TAG_FILE_END) - overlap.count(TAG_FILE_END)
+            if offsets is not None:
+                pos = data.find(TAG_EVENT_START, max(0, len(overlap) - len(TAG_EVENT_START) + 1))
+                while pos > -1:
+                    offsets.append(dataoffset + pos)
+                    pos = data.find(TAG_EVENT_START, pos + len(TAG_EVENT_START))
+            pos = data.rfind(TAG_EVENT_END)
+            if pos > -1:
+                lasteventend = dataoffset + pos + len(TAG_EVENT_END)
+            overlap = data[-SCAN_OVERLAP:]
+            block = pwgreader.read(SCAN_BLOCKSIZE)
+            if not block:
+                break
+            dataoffset += len(data) - len(overlap)
+            data = overlap + block
+        if nopen != nclose:
+            logging.debug("Found %d opened and %d closed events", nopen, nclose)
+        return (min(nopen, nclose), nmarker > 0, lasteventend)
+
+    def __scan_blocks(self, forceindex: bool = False):
+        # Byte-level scan: only the header region is decoded as text, events
+        # and the closing marker are counted directly on binary blocks
+        if not os.path.exists(self.__filename):
+            return
+        stat = os.stat(self.__filename)
+        offsets = array("Q") if self.__useindex or forceindex else None
+        with open_lhe(self.__filename) as pwgreader:
+            data = self.__read_header(pwgreader)
+            if not len(data):
+                return
+            self.__eventinfos.set_nonempty(True)
+            nevents, closingmarker, lasteventend = self.__count_tags(pwgreader, data, offsets)
+            self.__eventinfos.set_nevents(nevents)
+            self.__eventinfos.set_closingmarker(closingmarker)
+            self.__eventinfos.set_lasteventend(lasteventend)
+        # Index only complete files, files still being written would invalidate it anyway
+        if offsets is not None and (closingmarker or forceindex):
+            del offsets[nevents:]
+            self.__write_index(stat, offsets, lasteventend)
+
+    def __parse_lines(self):
         header_open = False
         event_open = False 
-        if os.path.exists(self.__filename):
-            self.__eventinfos.set_fileexists(True)
         nlines = 0
-        with open(self.__filename, "r") as pwgreader:
+        with io.TextIOWrapper(open_lhe(self.__filename)) as pwgreader:
             for line in pwgreader:
                 nlines += 1
                 line_trunc = line.lstrip().rstrip()
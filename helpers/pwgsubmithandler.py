@@ -8,7 +8,7 @@ from helpers.cluster import get_default_partition
 from helpers.modules import get_OSVersion
 from helpers.powhegconfig import get_energy_from_config
 from helpers.simconfig import SimConfig
-from helpers.slurm import submit_range, SlurmConfig
+from helpers.slurm import submit_range, ARRAYOFFSET_TAG, SlurmArrayCollector, SlurmConfig
 
 class UninitException(Exception):
 
@@ -39,6 +39,17 @@ class PowhegSubmitHandler(object):
         self.__singleslot = singleslot
     
     def submit(self) ->int:
+        runcmd, jobname, logfile, partition = self.__prepare(False)
+        return submit_range(runcmd, self.__batchconfig.cluster, jobname, logfile, partition, {"first": 0, "last": self.__batchconfig.njobs-1}, "{}:00:00".format(self.__batchconfig.hours), "{}G".format(self.__batchconfig.memory))
+
+    def collect(self, collector: SlurmArrayCollector):
+        # Add the slot (minslot) as index to the array collector, slots with
+        # the same configuration are submitted as a single array job, the slot
+        # is the array task ID plus the slot offset set by the collector
+        runcmd, jobname, logfile, partition = self.__prepare(True)
+        collector.add(self.__simconfig.minslot, runcmd, self.__batchconfig.cluster, jobname, logfile, partition, "{}:00:00".format(self.__batchconfig.hours), "{}G".format(self.__batchconfig.memory))
+
+    def __prepare(self, collect: bool) -> tuple:
         if not len(self.__repo):
             raise UninitException("Repository")
         if not self.__simconfig:
@@ -54,26 +65,26 @@ class PowhegSubmitHandler(object):
         if not os.path.exists(logdir):
             os.makedirs(logdir, 0o755)
         logfile = ""
-        if self.__singleslot:
+        if self.__singleslot and not collect:
             logfile = os.path.join(logdir, f"joboutput{self.__simconfig.minslot}.log")
         else:
             logfile = os.path.join(logdir, "joboutput%a.log")
         energytag = "%.1fT" %(get_energy_from_config(self.__simconfig.powheginput)/1000) if self.__simconfig.powheginput else "None"
         logging.info("Running simulation for energy %s", energytag)
-        runcmd =  "%s %s" %(self.__configure_env(), self.__make_powhegrunner())
+        runcmd =  "%s %s" %(self.__configure_env(), self.__make_powhegrunner(collect))
         #executable = os.path.join(repo, "run_powheg_singularity.sh")
         #f"{executable} {batchconfig.cluster} {repo} {workdir} {simconfig.process} {simconfig.powhegversion} {simconfig.powheginput} {simconfig.minslot} {simconfig.gridrepository} {simconfig.nevents}"
         jobname = f"pp_{self.__simconfig.process}_{energytag}"
         if self.__batchconfig.cluster == "CADES" or self.__batchconfig.cluster == "PERLMUTTER":
             runcmd = "%s %s" %(create_containerwrapper(workdir, self.__batchconfig.cluster, get_OSVersion(self.__batchconfig.cluster, self.__simconfig.powhegversion)), runcmd)
-        elif self.__batchconfig.cluster == "B587" and "VO_ALICE" in self.___simconfig.powhegversion:
+        elif self.__batchconfig.cluster == "B587" and "VO_ALICE" in self.__simconfig.powhegversion:
             # needs container also on the 587 cluster for POWHEG versions from cvmfs
             # will use the container from ALICE, so the OS version does not really matter
             runcmd = "%s %s" %(create_containerwrapper(workdir, self.__batchconfig.cluster, "CentOS8"), runcmd)
         logging.debug("Running on hosts: %s", runcmd)
-        return submit_range(runcmd, self.__batchconfig.cluster, jobname, logfile, get_default_partition(self.__batchconfig.cluster) if self.__batchconfig.partition == "default" else self.__batchconfig.partition, {"first": 0, "last": self.__batchconfig.njobs-1}, "{}:00:00".format(self.__batchconfig.hours), "{}G".format(self.__batchconfig.memory))
+        return (runcmd, jobname, logfile, get_default_partition(self.__batchconfig.cluster) if self.__batchconfig.partition == "default" else self.__batchconfig.partition)
 
-    def __make_powhegrunner(self) -> str:
+    def __make_powhegrunner(self, collect: bool = False) -> str:
         executable = f"{self.__repo}/powheg_runner.py"
         workdir = os.path.join(self.__simconfig.workdir, f"POWHEG_{self.__simconfig.powhegversion}")
         cmd = f"{executable} {workdir} -t {self.__simconfig.process}"
@@ -81,7 +92,9 @@ class PowhegSubmitHandler(object):
             cmd += f" -i {self.__simconfig.powheginput}"
             if self.__simconfig.nevents > 0:
                 cmd += f" -e {self.__simconfig.nevents}"
-        if self.__simconfig.minslot > 0:
+        if collect:
+            cmd += f" --slotoffset {ARRAYOFFSET_TAG}"
+        elif self.__simconfig.minslot > 0:
             cmd += f" --slotoffset {self.__simconfig.minslot}"
         if len(self.__simconfig.gridrepository) and self.__simconfig.gridrepository != "NONE":
             cmd += f" -g {self.__simconfig.gridrepository}"
@@ -89,6 +102,12 @@ class PowhegSubmitHandler(object):
             cmd += " -s --minid 0"
         if self.__simconfig.is_pdfreweight():
             cmd += f" --minpdf {self.__simconfig.minpdf} --maxpdf {self.__simconfig.maxpdf} --minid {self.__simconfig.minID}"
+        if self.__simconfig.linkgrids and len(self.__simconfig.gridrepository) and self.__simconfig.gridrepository != "NONE":
+            cmd += " --linkgrids"
+        if self.__simconfig.gridcache and len(self.__simconfig.gridrepository) and self.__simconfig.gridrepository != "NONE":
+            cmd += " --gridcache"
+        if self.__simconfig.scratch:
+            cmd += " --scratch"
         logging.debug("Running POWHEG command: %s", cmd)
         return cmd
 
@@ -102,4 +121,11 @@ def submit_simulation(repo: str, simconfig: SimConfig, batchconfig: SlurmConfig,
     executor.set_simconfig(simconfig)
     executor.set_batchconfig(batchconfig)
     executor.set_singleslot(singleslot)
-    return executor.submit()
\ No newline at end of file
+    return executor.submit()
+
+def collect_simulation(repo: str, simconfig: SimConfig, batchconfig: SlurmConfig, collector: SlurmArrayCollector):
+    executor = PowhegSubmitHandler()
+    executor.set_repo(repo)
+    executor.set_simconfig(simconfig)
+    executor.set_batchconfig(batchconfig)
+    executor.collect(collector)
\ No newline at end of file
@@ -3,6 +3,7 @@
 import logging
 import os
 
+from helpers.checkdb import CheckDatabase, get_expected_weights, get_missing_weights, is_incomplete, is_weightcheck_failed
 from helpers.slurm import submit
 
 class SlotIndexException(Exception):
@@ -68,6 +69,7 @@ class CheckResults(object):
     def __init__(self):
         self.__expectweights = []
         self.__corrupted = []
+        self.__badweights = []
 
     def add_expectweight(self, weightID: str):
         self.__expectweights.append(weightID)
@@ -78,9 +80,16 @@ class CheckResults(object):
     def add_corruptedfile(self, filename: str, missingweights: list):
         self.__corrupted.append(Corruptedfile(filename, missingweights))
 
+    def add_badweightfile(self, filename: str):
+        self.__badweights.append(filename)
+
     def get_corruptedfiles(self) -> list:
         return self.__corrupted
 
+    def get_badweightfiles(self) -> list:
+        # Files failing the weight validation of the check
+        return self.__badweights
+
 def get_failed_slots(checkfile: str) -> CheckResults:
     result = CheckResults()
     markerstart = "pwgevents.lhe files with missing weights:"
@@ -140,6 +149,31 @@ def get_incomplete_slots(checkfile: str) -> list:
         checkreader.close()
     return sorted(failedslots)
 
+def get_failed_slots_db(workdir: str) -> CheckResults:
+    result = CheckResults()
+    records = CheckDatabase(workdir).get_records_sorted()
+    expectweights = get_expected_weights(records)
+    result.set_expectweights(expectweights)
+    for record in records:
+        if not record["nonempty"]:
+            continue
+        missingweights = get_missing_weights(record, expectweights)
+        if is_weightcheck_failed(record):
+            # weights in the header but missing or broken in events cannot be repaired by
+            # reweighting (existing weight IDs are skipped), the slot needs to be regenerated
+            result.add_badweightfile(record["eventfile"])
+        if len(missingweights):
+            result.add_corruptedfile(record["eventfile"], missingweights)
+    return result
+
+def get_incomplete_slots_db(workdir: str) -> list:
+    failedslots = []
+    for record in CheckDatabase(workdir).get_records_sorted():
+        if is_incomplete(record):
+            logging.info("Found slot: %s", record["slot"])
+            failedslots.append(int(record["slot"]))
+    return sorted(failedslots)
+
 def next_iteration_resubmit(repo: str, cluster: str, workdir: str, partition: str, version: str, process: str, mem: int, hours: int, scalereweight: bool, minID: int, minpdf: int, dependency: int = None) -> int:
     executable = os.path.join(repo, "resubmit_failed_reweight.py")
     resubmit_cmd = f"{executable} {workdir} -p {partition} -v {version} --process {process} --mem {mem} --hours {hours}"
@@ -0,0 +1,97 @@
+#! /usr/bin/env python3
+
+import logging
+import os
+import time
+
+from helpers.checkdb import CheckDatabase, get_filestat, get_slotdir_workdir, make_checkrecord, write_checksummary
+from helpers.lhecompression import is_compressed_lhe
+from helpers.pwgeventsindex import get_index_name
+from helpers.pwgeventsparser import TAG_FILE_END, find_last_event_end, pwgeventsparser
+from helpers.pwsemaphore import has_semaphore
+
+DEFAULT_MINAGE = 10
+
+def truncate_eventfile(eventfile: str) -> bool:
+    # Cuts the event file behind the last complete event and closes it with the
+    # end marker. Returns False if the file is compressed or has no complete event.
+    if is_compressed_lhe(eventfile):
+        logging.error("Cannot truncate compressed event file %s", eventfile)
+        return False
+    with open(eventfile, "r+b") as pwgfile:
+        filesize = os.path.getsize(eventfile)
+        lasteventend = find_last_event_end(pwgfile, filesize)
+        if lasteventend < 0:
+            logging.error("No complete event found in %s", eventfile)
+            return False
+        pwgfile.seek(lasteventend)
+        if pwgfile.read().find(TAG_FILE_END) > -1:
+            logging.info("%s already complete", eventfile)
+            return True
+        logging.info("Truncating %s at %d bytes (dropping %d bytes of incomplete event)", eventfile, lasteventend, filesize - lasteventend)
+        pwgfile.truncate(lasteventend)
+        pwgfile.seek(lasteventend)
+        pwgfile.write(b"\n" + TAG_FILE_END + b"\n")
+        pwgfile.flush()
+        os.fsync(pwgfile.fileno())
+    # offsets of the index refer to the incomplete file
+    indexfile = get_index_name(eventfile)
+    if os.path.exists(indexfile):
+        os.remove(indexfile)
+    return True
+
+def salvage_eventfile(eventfile: str) -> int:
+    # Number of events kept in the salvaged file, -1 if the file cannot be salvaged
+    if not truncate_eventfile(eventfile):
+        return -1
+    decoder = pwgeventsparser(eventfile)
+    decoder.build_index()
+    nevents = decoder.get_eventinfos().get_nevents()
+    logging.info("Salvaged %d events in %s", nevents, eventfile)
+    return nevents
+
+def salvage_slot(slotdir: str, minage: int = DEFAULT_MINAGE) -> int:
+    # Truncates pwgevents.lhe of the slot to the last complete event and records the
+    # salvaged events in the check results. Files modified less than minage minutes
+    # ago are not touched (POWHEG possibly still running). Returns the number of
+    # salvaged events, -1 if the slot cannot be salvaged.
+    eventfile = os.path.join(slotdir, "pwgevents.lhe")
+    if not os.path.exists(eventfile):
+        logging.error("No plain pwgevents.lhe in %s, cannot salvage", slotdir)
+        return -1
+    age = (time.time() - os.path.getmtime(eventfile)) / 60.
+    if age < minage:
+        logging.error("pwgevents.lhe in %s modified %.1f minutes ago, POWHEG still running?", slotdir, age)
+        return -1
+    nevents = salvage_eventfile(eventfile)
+    if nevents < 0:
+        return -1
+    # left by the job killed at the time limit, the slot is complete now
+    semaphore = has_semaphore(slotdir)
+    if semaphore:
+        semaphore.remove()
+    filestat = get_filestat(eventfile)
+    decoder = pwgeventsparser(eventfile)
+    decoder.parse()
+    decoded = decoder.get_eventinfos()
+    write_checksummary(os.path.join(slotdir, "check_pwgevents.txt"), decoded, salvaged=nevents)
+    workdir, slot = get_slotdir_workdir(slotdir)
+    if len(slot):
+        record = make_checkrecord(slot, os.path.abspath(eventfile), decoded.is_file_existing(), decoded.is_file_nonempty(),
+                                  decoded.get_nevents(), decoded.closingmarker, [x.id for x in decoded.get_all_weights()],
+                                  filestat, salvaged=nevents)
+        CheckDatabase(workdir).add_record(record)
+    return nevents
+
+def salvage_incomplete(slotdir: str, minage: int = DEFAULT_MINAGE) -> bool:
+    # Slots without event file or with complete event file are skipped
+    eventfile = os.path.join(slotdir, "pwgevents.lhe")
+    if not os.path.exists(eventfile):
+        logging.debug("No plain pwgevents.lhe in %s", slotdir)
+        return True
+    decoder = pwgeventsparser(eventfile)
+    decoder.quickcheck()
+    if decoder.get_eventinfos().has_closingmarker():
+        logging.debug("pwgevents.lhe in %s complete", slotdir)
+        return True
+    return salvage_slot(slotdir, minage) >= 0
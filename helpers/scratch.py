@@ -0,0 +1,182 @@
+#! /usr/bin/env python3
+
+import logging
+import os
+import shutil
+import tempfile
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+
+COPY_BLOCKSIZE = 4 * 1024 * 1024
+# Interval in seconds for copying the growing event file to the slot directory
+SYNC_INTERVAL = 600
+
+def get_scratch_basedir() -> str:
+    # TMPDIR is job-specific and node-local on most Slurm clusters
+    return os.getenv("TMPDIR", tempfile.gettempdir())
+
+def get_file_signature(filename: str) -> tuple:
+    stat = os.stat(filename)
+    return (stat.st_size, stat.st_mtime_ns)
+
+def calculate_crc(filename: str) -> int:
+    crc = 0
+    with open(filename, "rb") as reader:
+        while True:
+            block = reader.read(COPY_BLOCKSIZE)
+            if not block:
+                break
+            crc = zlib.crc32(block, crc)
+    return crc
+
+def copy_verified(source: str, target: str):
+    # Copies into a temporary file next to the target, the target is only
+    # replaced if size and CRC of the copy match the source
+    tmpfile = f"{target}.stageout"
+    crc = 0
+    size = 0
+    try:
+        with open(source, "rb") as reader:
+            with open(tmpfile, "wb") as writer:
+                while True:
+                    block = reader.read(COPY_BLOCKSIZE)
+                    if not block:
+                        break
+                    crc = zlib.crc32(block, crc)
+                    size += len(block)
+                    writer.write(block)
+                writer.flush()
+                os.fsync(writer.fileno())
+        if os.path.getsize(tmpfile) != size or calculate_crc(tmpfile) != crc:
+            raise OSError(f"Verification of {target} failed")
+        os.replace(tmpfile, target)
+    except:
+        if os.path.exists(tmpfile):
+            os.remove(tmpfile)
+        raise
+
+class ScratchDir(object):
+    # Node-local copy of a slot directory. Files are staged out to the slot
+    # directory in a background thread while POWHEG continues in the scratch
+    # directory. Staged files are snapshotted via hardlinks, so later changes
+    # in the scratch directory do not affect running stage-outs.
+
+    def __init__(self, slotdir: str, basedir: str = ""):
+        self.__slotdir = slotdir
+        self.__scratchdir = tempfile.mkdtemp(prefix=f"powhegvar_{os.path.basename(slotdir)}_", dir=basedir if len(basedir) else get_scratch_basedir())
+        # outside the scratch directory, which is the working directory of POWHEG
+        self.__snapshotdir = f"{self.__scratchdir}.stageout"
+        os.mkdir(self.__snapshotdir)
+        self.__executor = ThreadPoolExecutor(max_workers=1)
+        self.__pending = []
+        self.__nsnapshots = 0
+        # signatures of the files in the scratch directory when they were staged in or out
+        self.__staged = {}
+        self.__stagedin = []
+        # bytes of growing files already copied to the slot directory
+        self.__synced = {}
+
+    def get_scratchdir(self) -> str:
+        return self.__scratchdir
+
+    def get_slotdir(self) -> str:
+        return self.__slotdir
+
+    def stage_in(self):
+        for filename in sorted(os.listdir(self.__slotdir)):
+            source = os.path.join(self.__slotdir, filename)
+            if not os.path.isfile(source):
+                continue
+            target = os.path.join(self.__scratchdir, filename)
+            shutil.copyfile(source, target)
+            self.__staged[filename] = get_file_signature(target)
+            self.__stagedin.append(filename)
+        logging.info("Staged %d files from %s to scratch directory %s", len(self.__stagedin), self.__slotdir, self.__scratchdir)
+
+    def stage_out(self, filename: str):
+        # Asynchronous, skipped for files unchanged since the last stage-in or stage-out
+        source = os.path.join(self.__scratchdir, filename)
+        if not os.path.isfile(source) or os.path.islink(source):
+            return
+        signature = get_file_signature(source)
+        if self.__staged.get(filename) == signature:
+            logging.debug("%s unchanged, not staging out", filename)
+            return
+        self.__nsnapshots += 1
+        snapshot = os.path.join(self.__snapshotdir, f"{self.__nsnapshots}_{filename}")
+        os.link(source, snapshot)
+        self.__staged[filename] = signature
+        logging.info("Staging out %s to %s", filename, self.__slotdir)
+        self.__pending.append((filename, self.__executor.submit(self.__copy, snapshot, filename)))
+
+    def sync_growing(self, filename: str):
+        # Appends the part of a file written by the running POWHEG (pwgevents.lhe) not yet
+        # copied to the slot directory, so a job killed at the time limit leaves the events
+        # generated so far in the slot directory (to be salvaged). Replaced by the verified
+        # copy at the final stage-out.
+        source = os.path.join(self.__scratchdir, filename)
+        if not os.path.isfile(source):
+            return
+        offset = self.__synced.get(filename, 0)
+        target = os.path.join(self.__slotdir, filename)
+        with open(source, "rb") as reader:
+            with open(target, "r+b" if offset > 0 and os.path.exists(target) else "wb") as writer:
+                reader.seek(offset)
+                writer.seek(offset)
+                writer.truncate()
+                while True:
+                    block = reader.read(COPY_BLOCKSIZE)
+                    if not block:
+                        break
+                    writer.write(block)
+                    offset += len(block)
+                writer.flush()
+                os.fsync(writer.fileno())
+        logging.debug("Synced %d bytes of %s to %s", offset, filename, self.__slotdir)
+        self.__synced[filename] = offset
+
+    def wait(self) -> list:
+        # Waits for all pending stage-outs, returns the files which failed
+        failed = []
+        for filename, future in self.__pending:
+            try:
+                future.result()
+            except OSError as e:
+                logging.error("Failed staging out %s: %s", filename, e)
+                failed.append(filename)
+                self.__staged.pop(filename, None)
+        self.__pending = []
+        return failed
+
+    def finish(self) -> bool:
+        # Stages out all files of the scratch directory and removes files from the slot
+        # directory which were removed in the scratch directory (e.g. packed into
+        # archives or compressed). The scratch directory is only removed if all files were staged out.
+        # Files which failed during the run are retried.
+        self.wait()
+        for filename in sorted(os.listdir(self.__scratchdir)):
+            self.stage_out(filename)
+        failed = self.wait()
+        self.__executor.shutdown()
+        if len(failed):
+            logging.error("Stage-out to %s incomplete, keeping scratch directory %s", self.__slotdir, self.__scratchdir)
+            return False
+        for filename in list(self.__staged.keys()):
+            if not os.path.exists(os.path.join(self.__scratchdir, filename)):
+                slotfile = os.path.join(self.__slotdir, filename)
+                if os.path.exists(slotfile):
+                    os.remove(slotfile)
+        self.remove()
+        logging.info("Stage-out to %s complete, removed scratch directory", self.__slotdir)
+        return True
+
+    def remove(self):
+        self.__executor.shutdown()
+        shutil.rmtree(self.__scratchdir)
+        shutil.rmtree(self.__snapshotdir)
+
+    def __copy(self, snapshot: str, filename: str):
+        try:
+            copy_verified(snapshot, os.path.join(self.__slotdir, filename))
+        finally:
+            os.remove(snapshot)
@@ -13,6 +13,9 @@ class SimConfig:
         self.__minID = 0
         self.__minslot = -1
         self.__gridrepository = ""
+        self.__linkgrids = False
+        self.__gridcache = False
+        self.__scratch = False
         self.__process = ""
     
     def set_workdir(self, workdir: str):
@@ -49,6 +52,15 @@ class SimConfig:
     def set_gridrepository(self, gridrepository: str):
         self.__gridrepository = gridrepository
 
+    def set_linkgrids(self, linkgrids: bool):
+        self.__linkgrids = linkgrids
+
+    def set_gridcache(self, gridcache: bool):
+        self.__gridcache = gridcache
+
+    def set_scratch(self, scratch: bool):
+        self.__scratch = scratch
+
     def set_process(self, procname: str):
         self.__process = procname
 
@@ -82,6 +94,15 @@ class SimConfig:
     def get_gridrepository(self) -> str:
         return self.__gridrepository
 
+    def is_linkgrids(self) -> bool:
+        return self.__linkgrids
+
+    def is_gridcache(self) -> bool:
+        return self.__gridcache
+
+    def is_scratch(self) -> bool:
+        return self.__scratch
+
     def get_process(self) -> str:
         return self.__process
     
@@ -101,6 +122,9 @@ class SimConfig:
     minID = property(fget=get_minID, fset=set_minID)
     minslot = property(fget=get_minslot, fset=set_minslot)
     gridrepository = property(fget=get_gridrepository, fset=set_gridrepository)
+    linkgrids = property(fget=is_linkgrids, fset=set_linkgrids)
+    gridcache = property(fget=is_gridcache, fset=set_gridcache)
+    scratch = property(fget=is_scratch, fset=set_scratch)
     process = property(fget=get_process, fset=set_process)
 
     def print(self):
@@ -110,6 +134,9 @@ class SimConfig:
         print(f"Number of events:    {self.__nevents}")
         print(f"Process:             {self.__process}")
         print(f"Grid repository:     {self.__gridrepository}")
+        print("Link grids:          %s" %("Yes" if self.__linkgrids else "No"))
+        print("Grid cache:          %s" %("Yes" if self.__gridcache else "No"))
+        print("Scratch mode:        %s" %("Yes" if self.__scratch else "No"))
         print(f"Min. ID:             {self.__minID}")
         print(f"Min. Slot:           {self.__minslot}")
         print(f"Min. PDF:            {self.__minpdf}")
@@ -1,8 +1,54 @@
 #! /usr/bin/env python3
 
 import logging
+import os
+import re
 import subprocess
 
+class SlurmSubmitException(Exception):
+
+    def __init__(self, message: str):
+        self.__message = message
+
+    def __str__(self):
+        return f"Job submission failed: {self.__message}"
+
+def get_sbatch() -> str:
+    # sbatch executable, can be replaced by a stand-in (i.e. tests/fake_sbatch.py) for testing
+    return os.getenv("POWHEGVAR_SBATCH", "sbatch")
+
+def parse_jobid(output: str) -> int:
+    # Handles --parsable output ("jobid" or "jobid;cluster") and the standard
+    # "Submitted batch job <jobid>" message
+    sout = output.strip()
+    if len(sout):
+        lastline = sout.splitlines()[-1].strip()
+        parsable = lastline.split(";")[0]
+        if parsable.isdigit():
+            return int(parsable)
+        match = re.search(r"Submitted batch job (\d+)", sout)
+        if match:
+            return int(match.group(1))
+    raise SlurmSubmitException(f"cannot determine job ID from sbatch output \"{sout}\"")
+
+def run_sbatch(submitcmd: str) -> int:
+    logging.debug(submitcmd)
+    submitResult = subprocess.run(submitcmd, shell=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    sout = submitResult.stdout.decode("utf-8")
+    if submitResult.returncode != 0:
+        raise SlurmSubmitException(submitResult.stderr.decode("utf-8").strip())
+    return parse_jobid(sout)
+
+def make_arraystring(indices: list) -> str:
+    # Explicit index list, consecutive indices are merged into ranges (i.e. 1-3,7,9-10)
+    ranges = []
+    for index in sorted(set(indices)):
+        if len(ranges) and ranges[-1][1] == index - 1:
+            ranges[-1][1] = index
+        else:
+            ranges.append([index, index])
+    return ",".join([f"{first}" if first == last else f"{first}-{last}" for first, last in ranges])
+
 class SlurmConfig:
 
     def __init__(self):
@@ -116,7 +162,7 @@ class SlurmJob:
 
     def __configure_slurm(self) -> str:
         logging.info("Using logfile: %s", self.__batchconfig.logfile)
-        submitcmd = "sbatch "
+        submitcmd = f"{get_sbatch()} --parsable"
         if self.__batchconfig.cluster == "CADES":
             submitcmd += " -A birthright" 
         submitcmd += " -N 1 -n 1 -c {}".format(self.__batchconfig.cpus)
@@ -149,18 +195,14 @@ class SlurmJob:
     def submit(self):
         submitcmd = self.__configure_slurm()
         submitcmd += " {}".format(self.__runcmd)
-        logging.debug(submitcmd)
-        submitResult = subprocess.run(submitcmd, shell=True, stdout=subprocess.PIPE)
-        sout = submitResult.stdout.decode("utf-8")
-        toks = sout.split(" ")
-        self.__jobid = int(toks[len(toks)-1])
+        self.__jobid = run_sbatch(submitcmd)
 
     runcmd = property(fget=get_runcmd, fset=set_runcmd)
     config = property(fget=get_config, fset=set_config)
 
-def ncorejob(cluster: str, cpus: int, jobname: str, logfile: str, partition: str, timelimit: str = "10:00:00", memory: str = "4G", dependency: list = [], environment: str = "") -> str:
+def ncorejob(cluster: str, cpus: int, jobname: str, logfile: str, partition: str, timelimit: str = "10:00:00", memory: str = "4G", dependency: list = [], environment: str = "", dependencytype: str = "afterany") -> str:
     logging.info("Using logfile: %s", logfile)
-    submitcmd = "sbatch "
+    submitcmd = f"{get_sbatch()} --parsable"
     if cluster == "CADES":
         submitcmd += " -A birthright" 
     submitcmd += " -N 1 -n 1 -c {}".format(cpus)
@@ -179,7 +221,7 @@ def ncorejob(cluster: str, cpus: int, jobname: str, logfile: str, partition: str
             if len(dependencystring):
                 dependencystring += ':'
             dependencystring += f"{dep}"
-        submitcmd += f" --dependency=afterany:{dependencystring}"
+        submitcmd += f" --dependency={dependencytype}:{dependencystring}"
     if len(environment):
         submitcmd += "export={}".format(environment)
     if cluster == "PERLMUTTER":
@@ -188,25 +230,91 @@ def ncorejob(cluster: str, cpus: int, jobname: str, logfile: str, partition: str
         submitcmd += " --image=docker:mfasel/cc8-alice:latest"
     return submitcmd
 
-def submit(command: str, cluster: str, jobname: str, logfile: str, partition: str, arraysize: int = 0, timelimit: str = "10:00:00", memory: str = "4G", dependency: list = [], envrionment: str = "") -> int:
-    submitcmd = ncorejob(cluster, 1, jobname, logfile, partition, timelimit, memory, dependency,envrionment)
+def submit(command: str, cluster: str, jobname: str, logfile: str, partition: str, arraysize: int = 0, timelimit: str = "10:00:00", memory: str = "4G", dependency: list = [], envrionment: str = "", cpus: int = 1) -> int:
+    submitcmd = ncorejob(cluster, cpus, jobname, logfile, partition, timelimit, memory, dependency,envrionment)
     if arraysize > 0:
         submitcmd += " --array=0-{}".format(arraysize-1)
     submitcmd += " {}".format(command)
-    logging.debug(submitcmd)
-    submitResult = subprocess.run(submitcmd, shell=True, stdout=subprocess.PIPE)
-    sout = submitResult.stdout.decode("utf-8")
-    toks = sout.split(" ")
-    jobid = int(toks[len(toks)-1])
-    return jobid
+    return run_sbatch(submitcmd)
 
 def submit_range(command: str, cluster: str, jobname: str, logfile: str, partition: str, arrayrange: dict, timelimit: str = "10:00:00", memory: str = "4G", dependency: list = [], environment: str = "") -> int:
     submitcmd = ncorejob(cluster, 1, jobname, logfile, partition, timelimit, memory, dependency, environment)
     submitcmd += " --array={}-{}".format(arrayrange["first"], arrayrange["last"])
     submitcmd += " {}".format(command)
-    logging.debug(submitcmd)
-    submitResult = subprocess.run(submitcmd, shell=True, stdout=subprocess.PIPE)
-    sout = submitResult.stdout.decode("utf-8")
-    toks = sout.split(" ")
-    jobid = int(toks[len(toks)-1])
-    return jobid
+    return run_sbatch(submitcmd)
+
+
+ARRAYOFFSET_TAG = "@ARRAYOFFSET@"
+DEFAULT_MAXARRAYSIZE = 1001
+
+def get_maxarraysize() -> int:
+    # MaxArraySize of the Slurm configuration (highest array index is MaxArraySize - 1),
+    # can be adapted to the cluster via the POWHEGVAR_MAXARRAYSIZE environment variable
+    return int(os.getenv("POWHEGVAR_MAXARRAYSIZE", DEFAULT_MAXARRAYSIZE))
+
+def split_arrayindices(indices: list, maxarraysize: int) -> list:
+    # Splits the indices into (offset, array indices) chunks with array indices below
+    # maxarraysize. The offset only depends on the index itself, so the same index gets
+    # the same array task ID in every array (needed for aftercorr dependencies).
+    chunks = {}
+    for index in sorted(set(indices)):
+        offset = index - index % maxarraysize
+        chunks.setdefault(offset, []).append(index - offset)
+    return sorted(chunks.items())
+
+def get_array_logtag(index: int, maxarraysize: int = 0) -> str:
+    # Replacement of %a in the log file name of the array task for the index
+    # (see SlurmArrayCollector.submit)
+    offset = index - index % (maxarraysize if maxarraysize > 0 else get_maxarraysize())
+    return f"{offset}+{index - offset}" if offset > 0 else f"{index}"
+
+class SlurmArrayCollector(object):
+    # Collects single-index submissions and submits one array job with an explicit
+    # index list (--array=3,17,42) per distinct job configuration. Indices beyond
+    # MaxArraySize are split into several array jobs, each with an offset: the
+    # array task ID is the index minus the offset. Commands get the offset via
+    # ARRAYOFFSET_TAG (replaced at submission), log files should use %a.
+
+    def __init__(self, dependencytype: str = "afterany", maxarraysize: int = 0):
+        self.__dependencytype = dependencytype
+        self.__maxarraysize = maxarraysize if maxarraysize > 0 else get_maxarraysize()
+        self.__groups = {}
+        self.__jobids = {}
+
+    def add(self, index: int, command: str, cluster: str, jobname: str, logfile: str, partition: str, timelimit: str = "10:00:00", memory: str = "4G", dependency: list = [], environment: str = "", cpus: int = 1):
+        key = (command, cluster, jobname, logfile, partition, timelimit, memory, tuple(sorted(dependency)), environment, cpus)
+        if not key in self.__groups:
+            self.__groups[key] = []
+        if not index in self.__groups[key]:
+            self.__groups[key].append(index)
+
+    def get_number_of_arrays(self) -> int:
+        return len(self.__groups)
+
+    def submit(self) -> dict:
+        # Returns the job ID for each index submitted in this call
+        self.__jobids = {}
+        for key, indices in self.__groups.items():
+            command, cluster, jobname, logfile, partition, timelimit, memory, dependency, environment, cpus = key
+            for offset, arrayindices in split_arrayindices(indices, self.__maxarraysize):
+                # log files keep the index: joboutput%a.log -> joboutput<offset>+%a.log (get_array_logtag)
+                chunklogfile = logfile.replace("%a", f"{offset}+%a") if offset > 0 else logfile
+                submitcmd = ncorejob(cluster, cpus, jobname, chunklogfile, partition, timelimit, memory, list(dependency), environment, self.__dependencytype)
+                submitcmd += " --array={}".format(make_arraystring(arrayindices))
+                submitcmd += " {}".format(command.replace(ARRAYOFFSET_TAG, f"{offset}"))
+                jobid = run_sbatch(submitcmd)
+                logging.info("Submitted %d tasks under job ID %d (index offset %d)", len(arrayindices), jobid, offset)
+                for arrayindex in arrayindices:
+                    self.__jobids[offset + arrayindex] = jobid
+        self.__groups = {}
+        return self.__jobids
+
+    def get_offset(self, index: int) -> int:
+        # Offset of the array job of the index, the array task ID is index - offset
+        return index - index % self.__maxarraysize
+
+    def get_jobid(self, index: int) -> int:
+        return self.__jobids.get(index, -1)
+
+    def get_jobids(self) -> list:
+        return sorted(set(self.__jobids.values()))
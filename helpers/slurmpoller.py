@@ -0,0 +1,168 @@
+#! /usr/bin/env python3
+
+import asyncio
+import logging
+import os
+import shlex
+
+# Slurm job states after which a job (array task) will not change anymore
+STATES_SUCCESS = ["COMPLETED"]
+STATES_FAILED = ["FAILED", "TIMEOUT", "PREEMPTED", "NODE_FAIL", "OUT_OF_MEMORY", "CANCELLED", "BOOT_FAIL", "DEADLINE", "REVOKED"]
+# Job vanished from the queue without accounting information (squeue fallback)
+STATE_UNKNOWN = "UNKNOWN"
+
+def is_terminal_state(state: str) -> bool:
+    return state in STATES_SUCCESS or state in STATES_FAILED or state == STATE_UNKNOWN
+
+def is_failed_state(state: str) -> bool:
+    return state in STATES_FAILED
+
+def get_sacct() -> str:
+    return os.getenv("POWHEGVAR_SACCT", "sacct")
+
+def get_squeue() -> str:
+    return os.getenv("POWHEGVAR_SQUEUE", "squeue")
+
+def expand_tasks(taskstring: str) -> list:
+    # Array task specification as shown for pending tasks, i.e. [1-3,7%4]
+    taskstring = taskstring.lstrip("[").rstrip("]").split("%")[0]
+    tasks = []
+    for token in taskstring.split(","):
+        if "-" in token:
+            first, last = token.split("-")
+            tasks.extend(range(int(first), int(last)+1))
+        elif len(token):
+            tasks.append(int(token))
+    return tasks
+
+def parse_slurm_jobid(jobidstring: str) -> tuple:
+    # Returns (jobid, [tasks]), tasks is [None] for non-array jobs
+    jobidstring = jobidstring.strip().split(".")[0].split("+")[0]
+    if not "_" in jobidstring:
+        return (int(jobidstring), [None])
+    jobid, taskstring = jobidstring.split("_", 1)
+    return (int(jobid), expand_tasks(taskstring))
+
+def parse_states(output: str) -> dict:
+    # Lines "<jobid>|<state>" as provided by both sacct -P and squeue -o "%i|%T"
+    states = {}
+    for line in output.splitlines():
+        if not "|" in line:
+            continue
+        jobidstring, state = line.split("|", 1)
+        try:
+            jobid, tasks = parse_slurm_jobid(jobidstring)
+        except ValueError:
+            logging.debug("Cannot parse job ID %s", jobidstring)
+            continue
+        # "CANCELLED by <uid>"
+        state = state.strip().split(" ")[0].rstrip("+")
+        for task in tasks:
+            states[(jobid, task)] = state
+    return states
+
+class SlurmBackend(object):
+    # Queries the states of all tracked jobs with a single sacct call,
+    # falls back to squeue in case accounting is not available
+
+    async def query(self, tracked: dict) -> dict:
+        jobids = ",".join(["{}".format(x) for x in sorted(tracked.keys())])
+        returncode, output = await self.__run(f"{get_sacct()} -n -P -X -o JobID,State -j {jobids}")
+        if returncode == 0:
+            return parse_states(output)
+        logging.debug("sacct failed, falling back to squeue")
+        returncode, output = await self.__run(f"{get_squeue()} -h -o %i|%T -j {jobids}")
+        states = parse_states(output) if returncode == 0 else {}
+        # Jobs no longer in the queue are finished, the outcome is not known
+        for jobid, tasks in tracked.items():
+            for task in tasks:
+                if not (jobid, task) in states:
+                    states[(jobid, task)] = STATE_UNKNOWN
+        return states
+
+    async def __run(self, command: str) -> tuple:
+        logging.debug(command)
+        try:
+            process = await asyncio.create_subprocess_exec(*shlex.split(command), stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.PIPE)
+        except OSError as e:
+            logging.debug("Failed running %s: %s", command, e)
+            return (-1, "")
+        stdout, _ = await process.communicate()
+        return (process.returncode, stdout.decode("utf-8"))
+
+class MockSlurmBackend(object):
+    # Slurm stand-in for testing: each job (array task) walks through the
+    # state sequence, one state per query, unless a final state is set explicitly
+
+    def __init__(self, sequence: list = ["PENDING", "RUNNING", "COMPLETED"]):
+        self.__sequence = sequence
+        self.__queries = {}
+        self.__states = {}
+        self.__nqueries = 0
+
+    def set_state(self, jobid: int, task: int, state: str):
+        self.__states[(jobid, task)] = state
+
+    def get_number_of_queries(self) -> int:
+        return self.__nqueries
+
+    async def query(self, tracked: dict) -> dict:
+        self.__nqueries += 1
+        states = {}
+        for jobid, tasks in tracked.items():
+            for task in tasks:
+                key = (jobid, task)
+                nqueries = self.__queries.get(key, 0)
+                self.__queries[key] = nqueries + 1
+                state = self.__sequence[min(nqueries, len(self.__sequence)-1)]
+                if key in self.__states and is_terminal_state(state):
+                    state = self.__states[key]
+                states[key] = state
+        return states
+
+class JobStatePoller(object):
+    # Tracks array tasks of several jobs and polls their states in bulk. Tasks
+    # reaching a terminal state are handed to the handler together with the
+    # payload provided when tracking the job, the handler can track new jobs.
+
+    def __init__(self, backend = None, interval: int = 60):
+        self.__backend = backend if backend is not None else SlurmBackend()
+        self.__interval = interval
+        self.__tracked = {}
+        self.__payloads = {}
+
+    def track(self, jobid: int, tasks: list, payload = None):
+        if not jobid in self.__tracked:
+            self.__tracked[jobid] = set()
+        self.__tracked[jobid].update(tasks)
+        self.__payloads[jobid] = payload
+
+    def get_number_of_tracked(self) -> int:
+        return sum([len(x) for x in self.__tracked.values()])
+
+    async def poll(self) -> list:
+        # Returns (jobid, task, state, payload) for all tasks finished since the last poll
+        if not len(self.__tracked):
+            return []
+        states = await self.__backend.query(self.__tracked)
+        finished = []
+        for jobid in list(self.__tracked.keys()):
+            tasks = self.__tracked[jobid]
+            for task in sorted(tasks, key=lambda x: -1 if x is None else x):
+                state = states.get((jobid, task))
+                if state is not None and is_terminal_state(state):
+                    finished.append((jobid, task, state, self.__payloads[jobid]))
+                    tasks.discard(task)
+            if not len(tasks):
+                del self.__tracked[jobid]
+                del self.__payloads[jobid]
+        return finished
+
+    async def run(self, handler):
+        # handler: coroutine function called with the list of finished tasks
+        while len(self.__tracked):
+            finished = await self.poll()
+            if len(finished):
+                await handler(finished)
+            if len(self.__tracked):
+                await asyncio.sleep(self.__interval)
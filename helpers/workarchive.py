@@ -2,8 +2,13 @@
 
 import logging
 import os
+import zlib
 from zipfile import ZipFile
 
+from helpers.zipwriter import DEFAULT_CODEC, ParallelZipWriter
+
+CRC_BLOCKSIZE = 1024 * 1024
+
 class FileNotFoundException(Exception):
 
     def __init__(self, filename: str):
@@ -17,35 +22,101 @@ class FileNotFoundException(Exception):
 
 class WorkArchive(object):
 
-    def __init__(self, archivename: str):
-        self.__archivename = archivename
+    def __init__(self, archivename: str, codec: str = DEFAULT_CODEC, nthreads: int = 0, basedir: str = ""):
+        # Archive and files are relative to basedir (default: current directory)
+        self.__basedir = basedir
+        self.__archivename = os.path.join(basedir, archivename)
+        self.__codec = codec
+        self.__nthreads = nthreads
         self.__files = []
 
     def add(self, filename: str):
-        if not os.path.exists(filename):
+        if not os.path.exists(os.path.join(self.__basedir, filename)):
             raise FileNotFoundException(filename)
         self.__files.append(filename)
 
     def update(self):
-        writemode = None
-        if os.path.exists(self.__archivename):
-            writemode = "a"
-        else:
-            writemode = "w"
-        writer = ZipFile(self.__archivename, writemode)
+        # Members are indexed by name, size and CRC: unchanged files are skipped, new
+        # files appended. Changed files cannot be replaced inside a zip, in this case
+        # the archive is rewritten, copying the unchanged members without recompression.
+        # Appending a changed file under the same name is not an option: unzip and readers
+        # not using the last entry would extract the stale member. Archives with duplicated
+        # names (older versions) are rewritten without the duplicates.
+        if not os.path.exists(self.__archivename):
+            self.__write(self.__archivename, "w", [], sorted(self.__files))
+            return
+        existing, nduplicates = index_archive(self.__archivename)
+        newfiles = []
+        changedfiles = []
         for workfile in sorted(self.__files):
-            writer.write(workfile)
-        writer.printdir()
-        writer.close()
+            if not workfile in existing:
+                newfiles.append(workfile)
+            elif not is_file_unchanged(os.path.join(self.__basedir, workfile), existing[workfile]):
+                changedfiles.append(workfile)
+            else:
+                logging.debug("%s unchanged in archive %s, skipping", workfile, self.__archivename)
+        if not len(changedfiles) and not nduplicates:
+            if not len(newfiles):
+                logging.info("Archive %s up to date", self.__archivename)
+                return
+            self.__write(self.__archivename, "a", [], newfiles)
+            return
+        logging.info("Rewriting archive %s (%d changed members, %d duplicated members)", self.__archivename, len(changedfiles), nduplicates)
+        keep = [x for x in existing.keys() if not x in changedfiles]
+        tmparchive = f"{self.__archivename}.tmp"
+        try:
+            self.__write(tmparchive, "w", keep, changedfiles + newfiles)
+        except:
+            if os.path.exists(tmparchive):
+                os.remove(tmparchive)
+            raise
+        os.replace(tmparchive, self.__archivename)
 
     def clean(self):
         for workfile in self.__files:
-            if os.path.exists(workfile):
-                os.remove(workfile)
+            fullpath = os.path.join(self.__basedir, workfile)
+            if os.path.exists(fullpath):
+                os.remove(fullpath)
+
+    def __write(self, archivename: str, writemode: str, copymembers: list, workfiles: list):
+        writer = ParallelZipWriter(archivename, writemode, self.__codec, nthreads=self.__nthreads)
+        for member in copymembers:
+            writer.copy(self.__archivename, member)
+        for workfile in workfiles:
+            writer.write(os.path.join(self.__basedir, workfile), workfile)
+        writer.close(printdir=True)
 
-def build_archive(name: str, files: list, clean: bool):
+def index_archive(archivename: str) -> tuple:
+    # Returns ({name: (size, CRC)}, number of duplicated members), for
+    # duplicated names the last member is the one which is extracted
+    index = {}
+    nduplicates = 0
+    with ZipFile(archivename, "r") as reader:
+        for member in reader.infolist():
+            if member.filename in index:
+                nduplicates += 1
+                del index[member.filename]
+            index[member.filename] = (member.file_size, member.CRC)
+        reader.close()
+    return (index, nduplicates)
+
+def is_file_unchanged(filename: str, entry: tuple) -> bool:
+    # CRC only calculated for files with the same size as the member
+    size, crc = entry
+    if os.path.getsize(filename) != size:
+        return False
+    filecrc = 0
+    with open(filename, "rb") as reader:
+        while True:
+            block = reader.read(CRC_BLOCKSIZE)
+            if not block:
+                break
+            filecrc = zlib.crc32(block, filecrc)
+    return filecrc == crc
+
+def build_archive(name: str, files: list, clean: bool, codec: str = DEFAULT_CODEC, nthreads: int = 0, basedir: str = ""):
     if len(files):
-        archivehandler = WorkArchive(name)
+        archivehandler = WorkArchive(name, codec, nthreads, basedir)
         for workfile in files:
             logging.info("Adding %s to archive %s", workfile, name)
             archivehandler.add(workfile)
@@ -54,12 +125,8 @@ def build_archive(name: str, files: list, clean: bool):
             archivehandler.clean()
 
 
-def pack_workarchives(workdir: str, clean: bool = True):
-    basedir = os.getcwd()
-    os.chdir(workdir)
-    allfiles = [x for x in os.listdir(os.getcwd())]
-
-    build_archive("logs.zip", [x for x in allfiles if x.endswith(".log")], clean)
-    build_archive("inputs.zip", [x for x in allfiles if x.endswith(".input") and not "powheg_base" in x], clean)
+def pack_workarchives(workdir: str, clean: bool = True, codec: str = DEFAULT_CODEC, nthreads: int = 0):
+    allfiles = [x for x in os.listdir(workdir)]
 
-    os.chdir(basedir)
\ No newline at end of file
+    build_archive("logs.zip", [x for x in allfiles if x.endswith(".log")], clean, codec, nthreads, workdir)
+    build_archive("inputs.zip", [x for x in allfiles if x.endswith(".input") and not "powheg_base" in x], clean, codec, nthreads, workdir)
\ No newline at end of file
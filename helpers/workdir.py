@@ -2,6 +2,8 @@
 
 import os
 
+from helpers.lhecompression import find_lhe
+
 def range_jobdirs(workdir: str) -> tuple:
     jobdirs = sorted([x for x in os.listdir(workdir) if os.path.isdir(os.path.join(workdir, x)) and x.isdigit()])
     if not len(jobdirs):
@@ -9,7 +11,7 @@ def range_jobdirs(workdir: str) -> tuple:
     return (int(jobdirs[0]), int(jobdirs[len(jobdirs) -1]))
 
 def find_index_of_input_file_range(workdir: str) -> int:
-    pwgdirs = sorted([int(x) for x in os.listdir(workdir) if os.path.isfile(os.path.join(workdir, x, "pwgevents.lhe"))])
+    pwgdirs = sorted([int(x) for x in os.listdir(workdir) if len(find_lhe(os.path.join(workdir, x, "pwgevents.lhe")))])
     if not len(pwgdirs):
         return (-1, -1)
     return (pwgdirs[0], pwgdirs[len(pwgdirs)-1]) 
\ No newline at end of file
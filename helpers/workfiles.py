@@ -0,0 +1,84 @@
+#! /usr/bin/env python3
+
+import io
+import os
+from contextlib import contextmanager
+from fnmatch import fnmatch
+from zipfile import ZipFile
+
+# Files packed by pack_workarchives are addressed as <directory>/<archive>.zip:<member>
+WORKARCHIVES = ["logs.zip", "inputs.zip"]
+
+def split_workfile(filename: str) -> tuple:
+    # Returns (archive, member) for archived files, (filename, "") for plain files
+    index = filename.find(".zip:")
+    if index < 0:
+        return (filename, "")
+    return (filename[:index + 4], filename[index + 5:])
+
+def make_workfile(archive: str, member: str) -> str:
+    return f"{archive}:{member}"
+
+def get_workfile_name(filename: str) -> str:
+    # Name of the file without directory or archive
+    archive, member = split_workfile(filename)
+    return os.path.basename(member if len(member) else archive)
+
+def is_archived(filename: str) -> bool:
+    return len(split_workfile(filename)[1]) > 0
+
+def workfile_exists(filename: str) -> bool:
+    archive, member = split_workfile(filename)
+    if not len(member):
+        return os.path.exists(filename)
+    if not os.path.exists(archive):
+        return False
+    with ZipFile(archive, "r") as reader:
+        found = member in reader.NameToInfo
+        reader.close()
+    return found
+
+@contextmanager
+def open_workfile(filename: str):
+    # Text stream of a plain file or of an archive member, members are decompressed
+    # while reading instead of being extracted
+    archive, member = split_workfile(filename)
+    if not len(member):
+        with open(filename, "r") as reader:
+            yield reader
+        return
+    with ZipFile(archive, "r") as archivereader:
+        with archivereader.open(member, "r") as memberreader:
+            yield io.TextIOWrapper(memberreader, errors="replace")
+
+def list_workfiles(directory: str, pattern: str = "*", archives: list = WORKARCHIVES) -> list:
+    # Plain files and archived files in directory with names matching the pattern,
+    # for files existing in both variants the plain file is used
+    found = {}
+    for archivename in archives:
+        archive = os.path.join(directory, archivename)
+        if not os.path.exists(archive):
+            continue
+        with ZipFile(archive, "r") as reader:
+            for member in reader.namelist():
+                if fnmatch(member, pattern):
+                    found[member] = make_workfile(archive, member)
+            reader.close()
+    for filename in os.listdir(directory):
+        if filename in archives or not fnmatch(filename, pattern):
+            continue
+        fullpath = os.path.join(directory, filename)
+        if os.path.isfile(fullpath):
+            found[filename] = fullpath
+    return [found[x] for x in sorted(found.keys())]
+
+def find_workfile(directory: str, name: str, archives: list = WORKARCHIVES) -> str:
+    # Plain file or archived file in directory, empty string if not found
+    plainfile = os.path.join(directory, name)
+    if os.path.exists(plainfile):
+        return plainfile
+    for archivename in archives:
+        archivedfile = make_workfile(os.path.join(directory, archivename), name)
+        if workfile_exists(archivedfile):
+            return archivedfile
+    return ""
@@ -0,0 +1,189 @@
+#! /usr/bin/env python3
+
+import io
+import logging
+import os
+import sys
+import zipfile
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+
+from helpers.processpool import get_number_of_cpus
+
+DEFAULT_CODEC = "deflate"
+# Members above this size are streamed by the writer itself instead of being
+# compressed in memory by a worker thread
+PARALLEL_MAXSIZE = 64 * 1024 * 1024
+# Upper limit for the summed size of the members compressed in memory at the same time
+INFLIGHT_MAXBYTES = 256 * 1024 * 1024
+# Default number of threads is limited as well, slot jobs pack with the default
+DEFAULT_MAXTHREADS = 4
+# Raw members are appended using the internal state of zipfile.ZipFile (fp, start_dir,
+# filelist, NameToInfo, _didModify), which is only used for the python versions listed here
+RAWAPPEND_VERSIONS = ((3, 8), (3, 14))
+
+def get_codecs() -> dict:
+    codecs = {
+        "stored": zipfile.ZIP_STORED,
+        "deflate": zipfile.ZIP_DEFLATED,
+        "bzip2": zipfile.ZIP_BZIP2,
+        "lzma": zipfile.ZIP_LZMA
+    }
+    if hasattr(zipfile, "ZIP_ZSTANDARD"):
+        # zstd members in zip files are only supported by the standard library from python 3.14
+        codecs["zstd"] = zipfile.ZIP_ZSTANDARD
+    return codecs
+
+def get_compression(codec: str) -> int:
+    codecs = get_codecs()
+    if not codec in codecs:
+        raise ValueError(f"Compression codec {codec} not supported (available: {', '.join(sorted(codecs.keys()))})")
+    return codecs[codec]
+
+def compress_member(filename: str, arcname: str, compression: int, compresslevel: int = None) -> tuple:
+    # Compresses the file into a single-member in-memory zip, returns the ZipInfo
+    # and the raw compressed data of the member
+    zinfo = zipfile.ZipInfo.from_file(filename, arcname)
+    zinfo.compress_type = compression
+    with open(filename, "rb") as reader:
+        data = reader.read()
+    buffer = io.BytesIO()
+    with zipfile.ZipFile(buffer, "w", compression, compresslevel=compresslevel) as memberwriter:
+        memberwriter.writestr(zinfo, data, compression, compresslevel)
+    content = buffer.getbuffer()
+    zinfo = memberwriter.infolist()[0]
+    # local file header: 30 bytes + file name + extra field
+    datastart = 30 + int.from_bytes(content[26:28], "little") + int.from_bytes(content[28:30], "little")
+    return (zinfo, bytes(content[datastart:datastart + zinfo.compress_size]))
+
+def get_default_nthreads() -> int:
+    # CPUs the process may run on (affinity), limited to DEFAULT_MAXTHREADS
+    return max(1, min(get_number_of_cpus(), DEFAULT_MAXTHREADS))
+
+def append_raw_member(writer: zipfile.ZipFile, zinfo: zipfile.ZipInfo, rawdata: bytes):
+    # Appends already compressed data as member to an archive open for writing
+    writer.fp.seek(writer.start_dir)
+    zinfo.header_offset = writer.fp.tell()
+    writer.fp.write(zinfo.FileHeader())
+    writer.fp.write(rawdata)
+    writer.filelist.append(zinfo)
+    writer.NameToInfo[zinfo.filename] = zinfo
+    writer.start_dir = writer.fp.tell()
+    writer._didModify = True
+
+@lru_cache(maxsize=None)
+def is_rawappend_supported() -> bool:
+    # Raw append only for the python versions it was verified with, and only if an in-memory
+    # test archive written that way reads back correctly with the running zipfile version
+    if sys.version_info[:2] < RAWAPPEND_VERSIONS[0] or sys.version_info[:2] > RAWAPPEND_VERSIONS[1]:
+        logging.debug("Raw append not supported for python %d.%d", sys.version_info[0], sys.version_info[1])
+        return False
+    try:
+        payload = b"powhegvar raw append test\n" * 64
+        source = io.BytesIO()
+        with zipfile.ZipFile(source, "w", zipfile.ZIP_DEFLATED) as sourcewriter:
+            sourcewriter.writestr("test.txt", payload)
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(source, "r") as sourcereader:
+            with zipfile.ZipFile(buffer, "w", zipfile.ZIP_DEFLATED) as writer:
+                zinfo, rawdata = read_raw_member(sourcereader, "test.txt")
+                append_raw_member(writer, zinfo, rawdata)
+                writer.writestr("second.txt", payload)
+        with zipfile.ZipFile(buffer, "r") as reader:
+            return reader.testzip() is None and reader.namelist() == ["test.txt", "second.txt"] and reader.read("test.txt") == payload
+    except Exception as e:
+        logging.debug("Raw append not supported by zipfile: %s", e)
+        return False
+
+def read_raw_member(reader: zipfile.ZipFile, arcname: str) -> tuple:
+    # Returns the ZipInfo and the raw compressed data of a member of an open archive
+    zinfo = reader.getinfo(arcname)
+    reader.fp.seek(zinfo.header_offset)
+    header = reader.fp.read(30)
+    reader.fp.seek(zinfo.header_offset + 30 + int.from_bytes(header[26:28], "little") + int.from_bytes(header[28:30], "little"))
+    rawdata = reader.fp.read(zinfo.compress_size)
+    copyinfo = zipfile.ZipInfo(zinfo.filename, zinfo.date_time)
+    for attribute in ["compress_type", "comment", "create_system", "create_version", "extract_version", "external_attr", "internal_attr", "CRC", "compress_size", "file_size"]:
+        setattr(copyinfo, attribute, getattr(zinfo, attribute))
+    # no data descriptor is copied, sizes and CRC go into the local header
+    copyinfo.flag_bits = zinfo.flag_bits & ~0x08
+    return (copyinfo, rawdata)
+
+class ParallelZipWriter(object):
+    # Zip writer compressing the members in worker threads, the compressed
+    # members are appended to the archive in the order they were added.
+
+    def __init__(self, archivename: str, mode: str = "w", codec: str = DEFAULT_CODEC, compresslevel: int = None, nthreads: int = 0):
+        self.__archivename = archivename
+        self.__mode = mode
+        self.__compression = get_compression(codec)
+        self.__compresslevel = compresslevel
+        self.__nthreads = nthreads if nthreads > 0 else get_default_nthreads()
+        self.__members = []
+
+    def write(self, filename: str, arcname: str = None):
+        self.__members.append((filename, arcname if arcname is not None else filename, None))
+
+    def copy(self, sourcearchive: str, arcname: str):
+        # Member copied from another archive without recompression
+        self.__members.append((None, arcname, sourcearchive))
+
+    def close(self, printdir: bool = False):
+        writer = zipfile.ZipFile(self.__archivename, self.__mode, self.__compression, compresslevel=self.__compresslevel)
+        # open source archives of copied members
+        sources = {}
+        try:
+            rawappend = is_rawappend_supported()
+            inparallel = self.__nthreads > 1 and rawappend
+            members = []
+            for filename, arcname, source in self.__members:
+                size = os.path.getsize(filename) if filename is not None else 0
+                members.append((filename, arcname, source, size, inparallel and filename is not None and size <= PARALLEL_MAXSIZE))
+            parallel = [(filename, arcname, size) for filename, arcname, _, size, isparallel in members if isparallel]
+            nextparallel = 0
+            # members in flight are limited in number and summed size to bound the memory usage
+            pending = deque()
+            inflight = 0
+            with ThreadPoolExecutor(max_workers=self.__nthreads) as executor:
+                for filename, arcname, source, size, isparallel in members:
+                    if source is not None:
+                        self.__copy(writer, sources, source, arcname, rawappend)
+                        continue
+                    if not isparallel:
+                        writer.write(filename, arcname)
+                        continue
+                    while nextparallel < len(parallel) and len(pending) < 2 * self.__nthreads:
+                        nextfile, nextarcname, nextsize = parallel[nextparallel]
+                        if len(pending) and inflight + nextsize > INFLIGHT_MAXBYTES:
+                            break
+                        pending.append((nextsize, executor.submit(compress_member, nextfile, nextarcname, self.__compression, self.__compresslevel)))
+                        inflight += nextsize
+                        nextparallel += 1
+                    donesize, future = pending.popleft()
+                    zinfo, rawdata = future.result()
+                    inflight -= donesize
+                    self.__append_raw(writer, zinfo, rawdata)
+            if printdir:
+                writer.printdir()
+        finally:
+            writer.close()
+            for reader in sources.values():
+                reader.close()
+        self.__members = []
+
+    def __copy(self, writer: zipfile.ZipFile, sources: dict, sourcearchive: str, arcname: str, rawappend: bool):
+        if not sourcearchive in sources:
+            sources[sourcearchive] = zipfile.ZipFile(sourcearchive, "r")
+        reader = sources[sourcearchive]
+        if rawappend:
+            zinfo, rawdata = read_raw_member(reader, arcname)
+            self.__append_raw(writer, zinfo, rawdata)
+        else:
+            zinfo = reader.getinfo(arcname)
+            writer.writestr(zinfo, reader.read(zinfo), zinfo.compress_type)
+
+    def __append_raw(self, writer: zipfile.ZipFile, zinfo: zipfile.ZipInfo, rawdata: bytes):
+        if zinfo.filename in writer.NameToInfo:
+            logging.warning("Duplicate name %s in archive %s", zinfo.filename, self.__archivename)
+        append_raw_member(writer, zinfo, rawdata)
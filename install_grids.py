@@ -3,28 +3,36 @@
 import argparse
 import logging
 import os
+import sys
 
 from helpers.setup_logging import setup_logging
 from helpers.gridarchive import gridarchive
+from helpers.gridverify import log_result, verify_archive
 
 if __name__ == "__main__":
     cwd = os.path.abspath(os.getcwd())
     parser = argparse.ArgumentParser()
     parser.add_argument("gridarchive", metavar="GRDIARCHIVE", type=str, help="Archive file with grids")
     parser.add_argument("-o", "--outputdir", metavar="OUTPUTDIR", type=str, default=cwd, help="Directory where grids should be installed (default: current directory)")
+    parser.add_argument("-s", "--select", metavar="PATTERN", type=str, action="append", default=None, help="Install only grid files matching the pattern (can be given multiple times)")
+    parser.add_argument("-j", "--jobs", metavar="JOBS", type=int, default=0, help="Number of extraction threads (default: 0:=number of CPUs)")
+    parser.add_argument("-v", "--verify", action="store_true", help="Verify CRCs and completeness of the grid archive before installing")
     parser.add_argument("-d", "--debug", action="store_true", help="Debug mode")
     args = parser.parse_args()
     setup_logging(args.debug)
 
+    if args.verify:
+        result = verify_archive(os.path.abspath(args.gridarchive))
+        log_result(1, 1, result)
+        if not result["ok"]:
+            logging.error("Grid archive %s failed verification, not installing", args.gridarchive)
+            sys.exit(1)
     archive = gridarchive()
-    if args.outputdir != cwd:
-        if not os.path.exists(args.outputdir):
-            os.makedirs(args.outputdir, 0o755)
-        os.chdir(args.outputdir)
-    archive.extract(args.gridarchive)
+    if not os.path.exists(args.outputdir):
+        os.makedirs(args.outputdir, 0o755)
+    archive.extract(os.path.abspath(args.gridarchive), os.path.abspath(args.outputdir), args.select, args.jobs)
     if not archive.check():
         logging.error("Grid archive %s incomplete", args.gridarchive)
     else:
         logging.info("Grid archive consistent")
-    archive.list()
-    os.chdir(cwd)
\ No newline at end of file
+    archive.list()
\ No newline at end of file
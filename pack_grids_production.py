@@ -3,9 +3,13 @@
 import argparse
 import logging
 import os
+import sys
 
-from helpers.gridarchive import build_archive
+from helpers.gridarchive import build_archive, build_store
+from helpers.gridstore import GridStore, MANIFEST_NAME, STORE_NAME
+from helpers.processpool import process_slotdirs
 from helpers.setup_logging import setup_logging
+from helpers.zipwriter import DEFAULT_CODEC, get_codecs
 
 def find_unpacked_chunks(basedir: str, gridarchive: str) -> list:
     unpacked = []
@@ -21,15 +25,30 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser("pack_grids_production.py")
     parser.add_argument("workdir", metavar="WORKDIR", type=str, help="Working directory")
     parser.add_argument("-g", "--gridarchive", metavar="FILE", type=str, default="grids.zip", help="Name of the grid archive file")
+    parser.add_argument("--codec", metavar="CODEC", type=str, default=DEFAULT_CODEC, choices=sorted(get_codecs().keys()), help=f"Compression codec (default: {DEFAULT_CODEC})")
+    parser.add_argument("--threads", metavar="THREADS", type=int, default=0, help="Number of compression threads per directory (default: 0:=available CPUs up to 4, 1 with --jobs)")
+    parser.add_argument("-j", "--jobs", metavar="JOBS", type=int, default=1, help="Number of slot directories packed in parallel (default: 1, 0:=all available CPUs)")
+    parser.add_argument("-s", "--store", action="store_true", help="Add grids to the deduplicated grid store of the production (WORKDIR/gridstore) and keep only a manifest per slot")
     parser.add_argument("-d", "--debug", action="store_true", help="Debug mode")
     parser.add_argument("-t", "--test", action="store_true", help="Test mode (only displays which directories to pack)")
     args = parser.parse_args()
 
     setup_logging(args.debug)
     wordkdir = os.path.abspath(args.workdir)
-    nonpacked = find_unpacked_chunks(wordkdir, args.gridarchive)
-    for dir in nonpacked:
-        fullpath = os.path.join(wordkdir, dir)
-        logging.info("Building grid archive in directory: %s", fullpath)
-        if not args.test:
-            build_archive(fullpath, force_overwrite=False, clean=True)
+    nonpacked = find_unpacked_chunks(wordkdir, MANIFEST_NAME if args.store else args.gridarchive)
+    storedir = os.path.join(wordkdir, STORE_NAME)
+    slotdirs = [os.path.join(wordkdir, x) for x in nonpacked]
+    if args.test:
+        for fullpath in slotdirs:
+            logging.info("%s in directory: %s", "Adding grids to grid store" if args.store else "Building grid archive", fullpath)
+        sys.exit(0)
+    # the directories are the unit of parallelism in pool mode, no additional compression threads
+    nthreads = args.threads if args.threads > 0 or args.jobs == 1 else 1
+    if args.store:
+        nfailed = process_slotdirs(build_store, slotdirs, args.jobs, (storedir, True), "Added grids to grid store for")
+    else:
+        nfailed = process_slotdirs(build_archive, slotdirs, args.jobs, (False, True, args.codec, nthreads), "Built grid archive in")
+    if nfailed:
+        logging.error("Packing failed for %d directories", nfailed)
+    if args.store and not args.test and os.path.exists(storedir):
+        logging.info("Size of grid store %s: %.1f MB", storedir, GridStore(storedir).get_size() / (1024 * 1024))
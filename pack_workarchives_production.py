@@ -4,22 +4,32 @@ import argparse
 import logging
 import os
 
+from helpers.processpool import process_slotdirs
 from helpers.setup_logging import setup_logging
 from helpers.workarchive import pack_workarchives 
+from helpers.zipwriter import DEFAULT_CODEC, get_codecs
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser("pack_workarchives_production.py")
     parser.add_argument("workdir", metavar="WORKDIR", type=str, help="Working directory")
     parser.add_argument("-d", "--debug", action="store_true", help="Debug mode")
     parser.add_argument("-t", "--test", action="store_true", help="Test mode (only displays which directories to pack)")
+    parser.add_argument("--codec", metavar="CODEC", type=str, default=DEFAULT_CODEC, choices=sorted(get_codecs().keys()), help=f"Compression codec (default: {DEFAULT_CODEC})")
+    parser.add_argument("--threads", metavar="THREADS", type=int, default=0, help="Number of compression threads per directory (default: 0:=available CPUs up to 4, 1 with --jobs)")
+    parser.add_argument("-j", "--jobs", metavar="JOBS", type=int, default=1, help="Number of slot directories packed in parallel (default: 1, 0:=all available CPUs)")
     parser.add_argument("-c", "--clean", action="store_true", help="Clean workdir")
     args = parser.parse_args()
 
     setup_logging(args.debug)
     wordkdir = os.path.abspath(args.workdir)
     chunks = sorted([x for x in os.listdir(wordkdir) if x.isdigit()])
-    for dir in chunks:
-        fullpath = os.path.join(wordkdir, dir)
-        logging.info("Building grid archive in directory: %s", fullpath)
-        if not args.test:
-            pack_workarchives(fullpath, clean=args.clean)
+    slotdirs = [os.path.join(wordkdir, x) for x in chunks]
+    if args.test:
+        for fullpath in slotdirs:
+            logging.info("Building work archives in directory: %s", fullpath)
+    else:
+        # the directories are the unit of parallelism in pool mode, no additional compression threads
+        nthreads = args.threads if args.threads > 0 or args.jobs == 1 else 1
+        nfailed = process_slotdirs(pack_workarchives, slotdirs, args.jobs, (args.clean, args.codec, nthreads), "Built work archives in")
+        if nfailed:
+            logging.error("Packing failed for %d directories", nfailed)
@@ -4,10 +4,11 @@ import argparse
 import os
 from zipfile import ZipFile
 
+from helpers.processpool import process_slotdirs
+from helpers.setup_logging import setup_logging
 
 def process_directory(workdir: str):
     print("Processing %s" %workdir)
-    os.chdir(workdir)
     logfiles = []
     pwginputs = []
     monfiles = []
@@ -22,33 +23,34 @@ def process_directory(workdir: str):
             monfiles.append(fl)
         if fl.startswith("realequivregions"):
             monfiles.append(fl)
-    logarchive = ZipFile("log_archive.zip", mode="w")
+    logarchive = ZipFile(os.path.join(workdir, "log_archive.zip"), mode="w")
     for fl in logfiles:
-        logarchive.write(fl)
+        logarchive.write(os.path.join(workdir, fl), fl)
     logarchive.close()
-    inputarchive = ZipFile("input_archive.zip", mode="w")
+    inputarchive = ZipFile(os.path.join(workdir, "input_archive.zip"), mode="w")
     for fl in pwginputs:
-        inputarchive.write(fl)
+        inputarchive.write(os.path.join(workdir, fl), fl)
     inputarchive.close()
-    monarchive = ZipFile("mon_archive.zip", mode="w")
+    monarchive = ZipFile(os.path.join(workdir, "mon_archive.zip"), mode="w")
     for fl in monfiles:
-        monarchive.write(fl)
+        monarchive.write(os.path.join(workdir, fl), fl)
     monarchive.close()
     for fl in logfiles:
-        os.remove(fl)
+        os.remove(os.path.join(workdir, fl))
     for fl in pwginputs:
-        os.remove(fl)
+        os.remove(os.path.join(workdir, fl))
     for fl in monfiles:
-        os.remove(fl)
+        os.remove(os.path.join(workdir, fl))
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser("pack_workdir.py")
     parser.add_argument("-w", "--workdir", metavar="WORKDIR", type=str, default="", help="Working directory")
     parser.add_argument("-b", "--basedir", metavar="BASEDIR", type=str, default="", help="Base directory")
+    parser.add_argument("-j", "--jobs", metavar="JOBS", type=int, default=1, help="Number of directories packed in parallel in base directory mode (default: 1, 0:=all available CPUs)")
     args = parser.parse_args()
+    setup_logging()
     if len(args.workdir):
         process_directory(os.path.abspath(args.workdir))
     elif len(args.basedir):
-        for dr in os.listdir(args.basedir):
-            if dr.isdigit():
-                process_directory(os.path.join(os.path.abspath(args.basedir), dr))
\ No newline at end of file
+        basedir = os.path.abspath(args.basedir)
+        process_slotdirs(process_directory, [os.path.join(basedir, dr) for dr in sorted(os.listdir(basedir)) if dr.isdigit()], args.jobs, action="Packed")
\ No newline at end of file
@@ -10,12 +10,16 @@ import sys
 import time
 
 from helpers.events import create_config_nevens
-from helpers.gridarchive import gridarchive, init_archive
+from helpers.gridarchive import gridarchive, init_archive, is_archive_uptodate
+from helpers.gridcache import stage_grids_cached
+from helpers.gridstore import MANIFEST_NAME, find_repository_manifest, link_or_copy, load_manifest
+from helpers.lhecompression import compress_lhe, decompress_lhe, find_lhe, get_lhe_codec
 from helpers.powheg import is_valid_process
 from helpers.powhegconfig import replace_value 
 from helpers.pwgeventsparser import pwgeventsparser, pwgevents_info
 from helpers.pwsemaphore import pwsemaphore, has_semaphore
 from helpers.reweighting import create_config_pdfreweight, create_config_scalereweight, build_weightID_scalereweight, build_weightID_pdfreweight 
+from helpers.scratch import SYNC_INTERVAL, ScratchDir
 from helpers.setup_logging import setup_logging
 from helpers.timehelpers import log_elapsed_time
 from helpers.workarchive import pack_workarchives
@@ -28,6 +32,13 @@ class POWHEG_runner:
         self.__reweightscale = False
         self.__reweightpdf = False
         self.__gridrepository = ""
+        self.__usegridcache = False
+        self.__linkgrids = False
+        self.__gridsignatures = {}
+        self.__usescratch = False
+        self.__scratchbase = ""
+        self.__scratch: ScratchDir = None
+        self.__lhecodec = ""
         self.__gridarchive: gridarchive = None
         self.__minpdf = -1
         self.__maxpdf = -1
@@ -69,6 +80,21 @@ class POWHEG_runner:
     def set_gridrepository(self, gridrepository: str):
         self.__gridrepository = gridrepository
 
+    def set_usegridcache(self, usegridcache: bool):
+        self.__usegridcache = usegridcache
+
+    def set_linkgrids(self, linkgrids: bool):
+        self.__linkgrids = linkgrids
+
+    def set_lhecompression(self, codec: str):
+        # Compress pwgevents.lhe at the end of the job (empty: no compression)
+        self.__lhecodec = codec
+
+    def set_usescratch(self, usescratch: bool, scratchbase: str = ""):
+        # Run in a node-local scratch directory (default location: $TMPDIR)
+        self.__usescratch = usescratch
+        self.__scratchbase = scratchbase
+
     def set_powhegtype(self, pwhgtype):
         if not is_valid_process(pwhgtype):
             logging.error("Selected POWHEG type %s invalid", pwhgtype)
@@ -132,7 +158,12 @@ class POWHEG_runner:
     events = property(fget=get_events, fset=set_events)
 
     def init(self) -> bool:
+        if self.__usescratch and not self.is_parallelstage():
+            if not self.__init_scratch():
+                return False
         self.__prepare_workdir()
+        if self.__scratch and not self.__workdirInitialized:
+            self.__abort_scratch()
         return self.__workdirInitialized
 
     def run(self) -> bool:
@@ -145,12 +176,15 @@ class POWHEG_runner:
         if not self.is_reweight() and not self.is_parallelstage():
             if self.__workdir_has_pwgevents():
                 found_semaphore = has_semaphore(self.workdir)
-                if found_semaphore:
+                if found_semaphore or not self.__is_pwgfile_complete(os.path.join(self.workdir, "pwgevents.lhe")):
                     logging.warning("Existing pwgevents.lhe in directory %s incomplete - reprocessing ...", self.workdir)
-                    found_semaphore.remove()
-                    os.remove()
+                    if found_semaphore:
+                        found_semaphore.remove()
+                    os.remove(os.path.join(self.workdir, "pwgevents.lhe"))
                 else:
                     logging.error("pwgevents.lhe (complete) already found in working directory %s for non-reweight jon - cannot run ...", self.workdir)
+                    if self.__scratch:
+                        self.__abort_scratch()
                     return False
             logging.info("Running standard powheg job")
             self.__run_powhegjob("pwhg.log")
@@ -159,14 +193,68 @@ class POWHEG_runner:
         else:
             if self.is_scalereweight():
                 self.__run_scalereweight()
-            elif self.__run_pdfreweight():
+            elif self.is_pdfreweight():
                 self.__run_pdfreweight()
         self.__pack_grids()
+        if len(self.__lhecodec) and not self.is_parallelstage():
+            self.__compress_pwgevents()
         if not self.is_parallelstage():
             # Pack archives, but not in parallelstage, as in parallelstage the inputs are needed consecutively
             pack_workarchives(self.__workdir, True)
+        if self.__scratch:
+            return self.__finish_scratch()
+        return True
+
+    def __compress_pwgevents(self):
+        pwgevents = os.path.join(self.__workdir, "pwgevents.lhe")
+        if not os.path.exists(pwgevents):
+            return
+        if not self.__is_pwgfile_complete(pwgevents):
+            logging.warning("pwgevents.lhe incomplete, not compressing")
+            return
+        compress_lhe(pwgevents, self.__lhecodec)
+
+    def __init_scratch(self) -> bool:
+        # Slot directory content is copied to the scratch directory, which
+        # becomes the working directory of the job
+        slotdir = self.__workdir
+        if not os.path.exists(slotdir):
+            if self.is_reweight():
+                logging.error("running in reweight mode, but workdir not existing, cannot run ...")
+                return False
+            os.mkdir(slotdir, 0o755)
+        self.__scratch = ScratchDir(slotdir, self.__scratchbase)
+        self.__scratch.stage_in()
+        # marks the slot as running, the slot directory is only updated at stage-out
+        pwsemaphore(slotdir).create()
+        self.__workdir = self.__scratch.get_scratchdir()
+        logging.info("Running in scratch directory %s", self.__workdir)
         return True
 
+    def __finish_scratch(self) -> bool:
+        slotdir = self.__scratch.get_slotdir()
+        success = self.__scratch.finish()
+        os.chdir(slotdir)
+        self.__workdir = slotdir
+        if success:
+            pwsemaphore(slotdir).remove()
+        return success
+
+    def __abort_scratch(self):
+        # Nothing to stage out, slot directory left unchanged
+        slotdir = self.__scratch.get_slotdir()
+        os.chdir(slotdir)
+        self.__scratch.remove()
+        self.__scratch = None
+        self.__workdir = slotdir
+        pwsemaphore(slotdir).remove()
+
+    def __stage_out(self, files: list):
+        # Results of a variation are copied to the slot directory while the next variation is running
+        if self.__scratch:
+            for filename in files:
+                self.__scratch.stage_out(filename)
+
     def __run_scalereweight(self):
         powheginput_base = self.__get_base_powheginput_for_reweight()
         if not len(powheginput_base):
@@ -174,7 +262,8 @@ class POWHEG_runner:
             return
         os.chdir(self.__workdir)
         currentid = self.__minid
-        currentpwgevents = pwgevents_info()
+        # Event file is decoded once, afterwards only the header of the new file is read after each variation
+        currentpwgevents = self.__read_known_weights()
         variations = [0.5, 1., 2.]
         for indexMuR in range(0, 3):
             variationMuR = variations[indexMuR]
@@ -182,13 +271,11 @@ class POWHEG_runner:
                 variationMuF = variations[indexMuF]
                 self.__list_workdir()
                 if self.__workdir_has_reweightevents():
-                    logging.error("pwgevents-reweight.lhe found in workdir %s in weighting mode, removing ...", self.__workdir)
-                    os.remove(os.path.join(self.workdir, "pwgevents-reweight.lhe"))
+                    logging.error("pwgevents-rwgt.lhe found in workdir %s in weighting mode, removing ...", self.__workdir)
+                    os.remove(os.path.join(self.workdir, "pwgevents-rwgt.lhe"))
                 if indexMuR == 1 and indexMuF == 1:
                     logging.info("Skipping default variation muf = mur = 1")
                     continue
-                if self.__workdir_has_pwgevents():
-                    currentpwgevents = self.__decode_pwgfile(os.path.join(self.workdir, "pwgevents.lhe"))
                 foundweight = currentpwgevents.find_weight("{}".format(currentid))
                 if foundweight:
                     logging.info("Scale variation  mur = %f, muf = %f with weight ID %d already existing, not running again ...", variationMuR, variationMuF, currentid)
@@ -204,8 +291,10 @@ class POWHEG_runner:
                 self.__run_powhegjob(f"pwhg_{vartag}.log")
                 if self.__workdir_has_reweightevents():
                     self.__stage_reweight()
+                    currentpwgevents = self.__read_known_weights()
                 if self.__workdir_has_powheginput():
                     self.__stage_powheginput(vartag)
+                self.__stage_out(["pwgevents.lhe", f"powheg_{vartag}.input", f"pwhg_{vartag}.log"])
                 currentid += 1
 
     def __run_pdfreweight(self):
@@ -216,14 +305,13 @@ class POWHEG_runner:
         os.chdir(self.__workdir)
         currentid = self.__minid
         currentpdf = self.__minpdf
-        currentpwgevents = pwgevents_info()
+        # Event file is decoded once, afterwards only the header of the new file is read after each variation
+        currentpwgevents = self.__read_known_weights()
         while currentpdf <= self.__maxpdf:
             self.__list_workdir()
             if self.__workdir_has_reweightevents():
                 logging.error("pwgevents-rwgt.lhe found in workdir %s in weighting mode, removing ...", self.__workdir)
                 os.remove(os.path.join(self.workdir, "pwgevents-rwgt.lhe"))
-            if self.__workdir_has_pwgevents():
-                currentpwgevents = self.__decode_pwgfile(os.path.join(self.workdir, "pwgevents.lhe"))
             foundweight = currentpwgevents.find_weight("{}".format(currentid))
             if foundweight:
                 logging.info("PDF variation %d with weight ID %d already existing, not running again ...", currentpdf, currentid)
@@ -240,8 +328,10 @@ class POWHEG_runner:
             self.__run_powhegjob(f"pwgh_PDF{currentpdf}.log")
             if self.__workdir_has_reweightevents():
                 self.__stage_reweight()
+                currentpwgevents = self.__read_known_weights()
             if self.__workdir_has_powheginput():
                 self.__stage_powheginput(f"PDF{currentpdf}")
+            self.__stage_out(["pwgevents.lhe", f"powheg_PDF{currentpdf}.input", f"pwgh_PDF{currentpdf}.log"])
             currentpdf += 1
             currentid += 1
 
@@ -253,7 +343,14 @@ class POWHEG_runner:
         logging.debug("Running: %s", command)
         semaphore = pwsemaphore(self.__workdir)
         semaphore.create()
-        subprocess.call(command, shell=True)
+        process = subprocess.Popen(command, shell=True)
+        while True:
+            try:
+                process.wait(timeout=SYNC_INTERVAL if self.__scratch else None)
+                break
+            except subprocess.TimeoutExpired:
+                # events generated so far must survive a kill at the time limit
+                self.__scratch.sync_growing("pwgevents.lhe")
         semaphore.remove()
 
     def __run_stage_job(self):
@@ -281,11 +378,21 @@ class POWHEG_runner:
             contentstring += f" {entry}"
         logging.info("Content of workdir: %s", contentstring)
 
-    def __decode_pwgfile(self, pwgfile: str) -> pwgevents_info:
+    def __decode_pwgheader(self, pwgfile: str) -> pwgevents_info:
         decoder = pwgeventsparser(pwgfile)
-        decoder.parse()
+        decoder.parse_header()
         return decoder.get_eventinfos()
 
+    def __read_known_weights(self) -> pwgevents_info:
+        if not self.__workdir_has_pwgevents():
+            return pwgevents_info()
+        return self.__decode_pwgheader(os.path.join(self.workdir, "pwgevents.lhe"))
+
+    def __is_pwgfile_complete(self, pwgfile: str) -> bool:
+        decoder = pwgeventsparser(pwgfile)
+        decoder.quickcheck()
+        return decoder.get_eventinfos().has_closingmarker()
+
     def __get_base_powheginput_for_reweight(self) -> str:
         powheginput_base = self.__workdir_find_powgheginput("base")
         if not len(powheginput_base):
@@ -356,16 +463,59 @@ class POWHEG_runner:
 
     def __pack_grids(self):
         if self.__gridarchive:
-            if not self.__workdir_has_file("grids.zip"):
-                self.__gridarchive.build("grids.zip")
+            manifest = self.__gridarchive.get_manifest()
+            unchanged = self.__is_gridrepository_unchanged()
+            if manifest and unchanged:
+                # grids are in the grid store, only the manifest needs to be kept
+                if not self.__workdir_has_file(MANIFEST_NAME):
+                    manifest.write(os.path.join(self.__workdir, MANIFEST_NAME))
+            elif not self.__workdir_has_file("grids.zip"):
+                reusable = self.__find_reusable_gridarchive() if unchanged else ""
+                if len(reusable):
+                    # grids only read, no need to repack them
+                    logging.info("Grids unchanged, using grid archive %s instead of repacking", reusable)
+                    link_or_copy(reusable, os.path.join(self.__workdir, "grids.zip"))
+                else:
+                    if manifest:
+                        # grids rewritten by POWHEG, the manifest does not describe them any more
+                        logging.warning("Grids from the grid store modified, packing them into grids.zip")
+                        if self.__workdir_has_file(MANIFEST_NAME):
+                            os.remove(os.path.join(self.__workdir, MANIFEST_NAME))
+                    self.__gridarchive.build("grids.zip", basedir=self.__workdir)
             self.__gridarchive.clean_gridfiles(self.__workdir)
 
+    def __is_gridrepository_unchanged(self) -> bool:
+        # Grids in the working directory still the ones staged from the repository
+        # (same inode, size and mtime), valid for all repository types
+        if not len(self.__gridsignatures):
+            return False
+        return self.__gridarchive.get_signatures(self.__workdir) == self.__gridsignatures
+
+    def __find_reusable_gridarchive(self) -> str:
+        # Existing archive with the staged grids: the repository itself for zip archives,
+        # grids.zip of the grid directory if it is up to date with the grid files
+        if self.__gridrepository.endswith(".zip"):
+            return self.__gridrepository
+        if os.path.isdir(self.__gridrepository):
+            archivefile = os.path.join(self.__gridrepository, "grids.zip")
+            if is_archive_uptodate(archivefile, self.__gridrepository, self.__gridarchive.get_gridfiles()):
+                return archivefile
+        return ""
+
+    def __stage_griddir(self):
+        self.__gridarchive = init_archive(self.__gridrepository)
+        if self.__linkgrids:
+            try:
+                self.__gridarchive.stage(self.__gridrepository, self.__workdir, True)
+                logging.info("Linked grid files from %s", self.__gridrepository)
+                return
+            except OSError as e:
+                logging.warning("Cannot link grid files from %s, copying them: %s", self.__gridrepository, e)
+        self.__gridarchive.stage(self.__gridrepository, self.__workdir)
+
     def __extractgrids(self, gridarchivefile: str):
         if self.__gridarchive:
-            wd = os.getcwd()
-            os.chdir(self.__workdir)
-            self.__gridarchive.extract(gridarchivefile)
-            os.chdir(wd)
+            self.__gridarchive.extract(gridarchivefile, self.__workdir)
 
     def __prepare_workdir(self):
         if self.is_parallelstage():
@@ -386,6 +536,12 @@ class POWHEG_runner:
                 logging.info("Creating new working directory %s", self.__workdir)
                 os.mkdir(self.__workdir, 0o755)
         if self.is_reweight():
+            compressedevents = find_lhe(os.path.join(self.__workdir, "pwgevents.lhe"))
+            if not self.__workdir_has_pwgevents() and len(compressedevents):
+                # POWHEG reweights plain event files, compressed again at the end of the job
+                if not len(self.__lhecodec):
+                    self.__lhecodec = get_lhe_codec(compressedevents)
+                decompress_lhe(compressedevents)
             if not self.__workdir_has_pwgevents():
                 logging.error("Require existing pwgevents.lhe in workdir for reweight mode")
                 return
@@ -402,9 +558,19 @@ class POWHEG_runner:
                 # Use existing configuration with the default number of events
                 self.__copy_to_workdir(self.__pwginput, "powheg.input")
         if self.is_useexistinggrids():
-            if not self.__gridrepository.endswith(".zip"):
-                self.__gridarchive = init_archive(self.__gridrepository)
-                self.__gridarchive.stage(self.__gridrepository, self.__workdir)
+            isgriddir = not self.__gridrepository.endswith(".zip") and not self.__gridrepository.endswith(".json")
+            # linked grid directories are read directly from the repository
+            cachedgrids = stage_grids_cached(self.__gridrepository, self.__workdir) if self.__usegridcache and not (self.__linkgrids and isgriddir) else None
+            if cachedgrids is not None:
+                # grids linked from the node-local cache
+                self.__gridarchive = gridarchive()
+                manifestfile = find_repository_manifest(self.__gridrepository)
+                if len(manifestfile):
+                    self.__gridarchive.set_manifest(load_manifest(manifestfile))
+                else:
+                    self.__gridarchive.add_files(cachedgrids)
+            elif isgriddir:
+                self.__stage_griddir()
             else:
                 self.__gridarchive = gridarchive()
                 self.__extractgrids(self.__gridrepository)
@@ -412,15 +578,19 @@ class POWHEG_runner:
                 logging.error("Request running with existing grids, but not all expected files found, cannot run ...")
                 return
             logging.info("Found %d grid files in %s (%s mode)", self.__gridarchive.number_allgrids(), self.__gridrepository, "parallel" if self.__gridarchive.is_parallel_mode() else "sequential") 
+            self.__gridsignatures = self.__gridarchive.get_signatures(self.__workdir)
         else:
             localgrids = os.path.join(self.__workdir, "grids.zip")
+            if self.__workdir_has_file(MANIFEST_NAME):
+                localgrids = os.path.join(self.__workdir, MANIFEST_NAME)
             if os.path.exists(localgrids):
                 self.__gridarchive = gridarchive()
                 self.__extractgrids(localgrids)
                 if not self.__gridarchive.check():
                     logging.error("Request running with existing grids, but not all expected files found, cannot run ...")
                     return
-                logging.info("Found %d grid files in grids.zip in working directory (%s mode)", self.__gridarchive.number_allgrids(), "parallel" if self.__gridarchive.is_parallel_mode() else "sequential") 
+                logging.info("Found %d grid files in %s in working directory (%s mode)", self.__gridarchive.number_allgrids(), os.path.basename(localgrids), "parallel" if self.__gridarchive.is_parallel_mode() else "sequential") 
+                self.__gridsignatures = self.__gridarchive.get_signatures(self.__workdir)
         self.__workdirInitialized = True
         
 if __name__ == "__main__":
@@ -438,6 +608,11 @@ if __name__ == "__main__":
     parser.add_argument("--stage", metavar="STAGE", type=int, default=0, help="Parallel stage")
     parser.add_argument("--xgriditer", metavar="XGRIDITER", type=int, default=1, help="xgrid iteration (parallel stage 1)")
     parser.add_argument("-s", "--scalereweight", action="store_true", help="Run scale reweighting mode")
+    parser.add_argument("--gridcache", action="store_true", help="Stage existing grids via the node-local grid cache shared by the slots on the same node (default location: /tmp, see POWHEGVAR_GRIDCACHE)")
+    parser.add_argument("--linkgrids", action="store_true", help="Symlink existing grids from a grid directory instead of copying them (read-only grid files only, otherwise copied)")
+    parser.add_argument("--compresslhe", metavar="CODEC", type=str, default="", choices=["", "gzip", "zstd"], help="Compress pwgevents.lhe at the end of the job (gzip or zstd)")
+    parser.add_argument("--scratch", action="store_true", help="Run in node-local scratch directory and stage results out to the working directory (pwgevents.lhe also synced every {} min during the run)".format(SYNC_INTERVAL // 60))
+    parser.add_argument("--scratchdir", metavar="SCRATCHDIR", type=str, default="", help="Base directory for scratch mode (default: $TMPDIR)")
     parser.add_argument("-d", "--debug", action="store_true", help="Run in debug mode")
     args = parser.parse_args()
     setup_logging(args.debug)
@@ -482,6 +657,12 @@ if __name__ == "__main__":
         processor.set_pdfreweight(args.minpdf, args.maxpdf, args.minid)
     if len(args.gridfiledir):
         processor.set_gridrepository(os.path.abspath(args.gridfiledir))
+        processor.set_usegridcache(args.gridcache)
+        processor.set_linkgrids(args.linkgrids)
+    if len(args.compresslhe):
+        processor.set_lhecompression(args.compresslhe)
+    if args.scratch:
+        processor.set_usescratch(True, args.scratchdir)
     if args.events > 0:
         processor.set_events(args.events)
     if args.stage > 0 and args.stage < 4:
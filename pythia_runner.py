@@ -63,9 +63,9 @@ class PythiaRunner(object):
 
     def __is_powheg_events_OK(self, powheginput: str) -> bool:
         parser = pwgeventsparser(powheginput)
-        parser.parse()
+        parser.quickcheck()
         events = parser.get_eventinfos()
-        if not events.get_nevents():
+        if not events.has_complete_event():
             logging.error("POWHEG event file %s does not contain any event", powheginput)
             return False
         if not events.has_closingmarker():
@@ -3,10 +3,11 @@
 REPO=$1
 WORKDIR=$2
 GRIDFILE=$3
+NJOBS=${4:-1}
 
 export PYTHONPATH=$PYTHONPATH:$REPO
 
-cmd=$(printf "%s/pack_grids_production.py %s" $REPO $WORKDIR)
+cmd=$(printf "%s/pack_grids_production.py %s -j %d" $REPO $WORKDIR $NJOBS)
 echo "Executing: $cmd"
 eval $cmd
 echo "Done ..."
\ No newline at end of file
@@ -2,11 +2,11 @@
 
 REPO=$1
 WORKDIR=$2
-GRIDFILE=$3
+NJOBS=${3:-1}
 
 export PYTHONPATH=$PYTHONPATH:$REPO
 
-cmd=$(printf "%s/pack_workarchives_production.py %s -c" $REPO $WORKDIR)
+cmd=$(printf "%s/pack_workarchives_production.py %s -c -j %d" $REPO $WORKDIR $NJOBS)
 echo "Executing: $cmd"
 eval $cmd
 echo "Done ..."
\ No newline at end of file
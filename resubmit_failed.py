@@ -6,27 +6,34 @@ import os
 import shutil
 import sys
 
-from helpers.checkjob import submit_checks, submit_check_slot
+from helpers.checkdb import CheckDatabase
+from helpers.checkjob import submit_checks, collect_check_slot
 from helpers.cluster import get_cluster, get_default_partition
-from helpers.pwgsubmithandler import submit_simulation, UninitException
-from helpers.resubmithandler import get_incomplete_slots
+from helpers.events import get_config_nevents
+from helpers.pwgsubmithandler import collect_simulation, UninitException
+from helpers.resubmithandler import get_incomplete_slots, get_incomplete_slots_db
+from helpers.salvage import DEFAULT_MINAGE, salvage_slot
 from helpers.setup_logging import setup_logging
-from helpers.slurm import SlurmConfig
+from helpers.slurm import get_array_logtag, SlurmArrayCollector, SlurmConfig, SlurmSubmitException
 from helpers.simconfig import SimConfig
+from helpers.workfiles import find_workfile, open_workfile
 
 def clean_slotdir(slotdir: str):
     if os.path.exists(slotdir):
         shutil.rmtree(slotdir)
 
 def parse_powheg_config(workdir: str, slot: int) ->SimConfig:
-    logfile = os.path.join(workdir, "logs", f"joboutput{slot}.log")
-    if not os.path.exists(logfile):
-        logging.error("Logfile for slot %d does not exist, cannot create POWHEG config")
+    logfile = find_workfile(os.path.join(workdir, "logs"), f"joboutput{slot}.log")
+    if not len(logfile):
+        # slot resubmitted in an array chunk with slot offset
+        logfile = find_workfile(os.path.join(workdir, "logs"), f"joboutput{get_array_logtag(slot)}.log")
+    if not len(logfile):
+        logging.error("Logfile for slot %d does not exist, cannot create POWHEG config", slot)
         return None
     config = SimConfig()
     config.workdir = os.path.dirname(workdir)
     config.minslot = slot
-    with open(logfile, "r") as logreader:
+    with open_workfile(logfile) as logreader:
         for line in logreader:
             line = line.replace("\n", "")
             if "Request POWHEG version:" in line:
@@ -46,6 +53,16 @@ def parse_powheg_config(workdir: str, slot: int) ->SimConfig:
                         config.nevents = int(tokens[indextoken+1])
                     elif tokens[indextoken] == "-t":
                         config.process = tokens[indextoken+1]
+                    elif tokens[indextoken] in ["--linkgrids", "--gridcache", "--scratch"]:
+                        # flags without value
+                        if tokens[indextoken] == "--linkgrids":
+                            config.linkgrids = True
+                        elif tokens[indextoken] == "--gridcache":
+                            config.gridcache = True
+                        else:
+                            config.scratch = True
+                        indextoken += 1
+                        continue
 
                     if tokens[indextoken].startswith("-"):
                         indextoken += 2
@@ -53,10 +70,47 @@ def parse_powheg_config(workdir: str, slot: int) ->SimConfig:
                         indextoken += 1
     return config
 
-def submit_slot(repo: str, workdir: str, slot: int, simparams: SimConfig, slurparams: SlurmConfig):
+def submit_slot(repo: str, workdir: str, slot: int, simparams: SimConfig, slurparams: SlurmConfig, collector: SlurmArrayCollector):
     logging.info("Resubmitting slot: %d", slot)
     clean_slotdir(os.path.join(workdir, "%04d" %slot))
-    return submit_simulation(repo, simparams, slurparams, True)
+    collect_simulation(repo, simparams, slurparams, collector)
+
+def get_requested_events(slotdir: str, simparams: SimConfig) -> int:
+    # Number of events from the job configuration, or from powheg.input of the slot for jobs with the default number of events
+    if simparams.nevents > 0:
+        return simparams.nevents
+    configfile = find_workfile(slotdir, "powheg.input")
+    if not len(configfile):
+        return 0
+    return get_config_nevents(configfile)
+
+def submit_remainder(repo: str, workdir: str, slot: int, newslot: int, nsalvaged: int, simparams: SimConfig, slurparams: SlurmConfig, collector: SlurmArrayCollector) -> bool:
+    # Missing events of a salvaged slot are generated in a new slot (with a new random seed),
+    # the salvaged slot is kept
+    requested = get_requested_events(os.path.join(workdir, "%04d" %slot), simparams)
+    if not requested:
+        logging.error("Cannot determine the requested number of events for slot %d, not submitting remainder", slot)
+        return False
+    if nsalvaged >= requested:
+        logging.info("Slot %d salvaged with all %d requested events", slot, requested)
+        return False
+    simparams.minslot = newslot
+    simparams.nevents = requested - nsalvaged
+    logging.info("Submitting remainder of slot %d (%d of %d events) in slot %d", slot, simparams.nevents, requested, newslot)
+    simparams.print()
+    collect_simulation(repo, simparams, slurparams, collector)
+    return True
+
+def submit_collected(cluster: str, repo: str, workdir: str, partition: str, collector: SlurmArrayCollector) -> list:
+    # Slots with the same configuration are submitted as one array job, check
+    # jobs run as array with the same slot indices after the corresponding simulation task
+    slots = collector.submit()
+    checkcollector = SlurmArrayCollector("aftercorr")
+    for slot, pwhgjob in slots.items():
+        collect_check_slot(cluster, repo, workdir, slot, partition, checkcollector, pwhgjob)
+    checkcollector.submit()
+    logging.info("Submitted %d slots in %d simulation job(s)", len(slots), len(collector.get_jobids()))
+    return checkcollector.get_jobids()
 
 
 if __name__ == "__main__":
@@ -66,6 +120,9 @@ if __name__ == "__main__":
     parser.add_argument("-p", "--partition", metavar="PARTITION", type=str, default="default", help="Partition")
     parser.add_argument("--mem", metavar="MEMORY", type=int, default=4, help="Memory request in GB (default: 4 GB)" )
     parser.add_argument("--hours", metavar="HOURS", type=int, default=10, help="Max. numbers of hours for slot (default: 10)")
+    parser.add_argument("--salvage", action="store_true", help="Truncate incomplete pwgevents.lhe to the last complete event instead of regenerating the slot")
+    parser.add_argument("--remainder", action="store_true", help="Generate the events missing in salvaged slots in new slots (requires --salvage)")
+    parser.add_argument("--minage", metavar="MINAGE", type=int, default=DEFAULT_MINAGE, help=f"Min. time in minutes since the last modification of pwgevents.lhe for salvaging (default: {DEFAULT_MINAGE})")
     parser.add_argument("--debug", action="store_true", help="debug mode")
     parser.add_argument("--test", action="store_true", help="test mode")
 
@@ -76,6 +133,9 @@ if __name__ == "__main__":
     parser.add_argument("--process", metavar="PROCESS", type=str, default="default", help="Process (default: dijet)")
     args = parser.parse_args()
     setup_logging(args.debug)
+    if args.remainder and not args.salvage:
+        logging.error("--remainder requires --salvage")
+        sys.exit(1)
 
     cluster = get_cluster()
     if cluster == None:
@@ -85,12 +145,17 @@ if __name__ == "__main__":
     partition = args.partition if args.partition != "default" else get_default_partition(cluster)
 
     workdir = os.path.abspath(args.workdir)
+    checkdb = CheckDatabase(workdir)
     checkfile = os.path.join(workdir, "checksummary_pwgevents.log")
-    if not os.path.exists(checkfile):
-        logging.error("Working directory %s does not provide a checksummary_pwgevents.log", workdir)
+    if checkdb.exists():
+        checkfile = checkdb.get_filename()
+        slots = get_incomplete_slots_db(workdir)
+    elif os.path.exists(checkfile):
+        slots = get_incomplete_slots(checkfile)
+    else:
+        logging.error("Working directory %s does not provide a check database or checksummary_pwgevents.log", workdir)
         sys.exit(1)
 
-    slots = get_incomplete_slots(checkfile)
     if not len(slots):
         logging.error("No failed slot found in %s, no slots to be resubmitted", checkfile)
         sys.exit(1)
@@ -103,6 +168,9 @@ if __name__ == "__main__":
     batchconfig.hours = args.hours
 
     jobids_check = []
+    collector = SlurmArrayCollector()
+    # remainders of salvaged slots are generated in new slots behind the existing ones
+    nextslot = max([int(x) for x in os.listdir(workdir) if x.isdigit() and os.path.isdir(os.path.join(workdir, x))] + [-1]) + 1
     for slot in slots:
         simconfig = parse_powheg_config(workdir, slot)
         if not simconfig:
@@ -118,16 +186,33 @@ if __name__ == "__main__":
             simconfig.powheginput = args.input
         if args.version != "default":
             simconfig.powhegversion = args.version
+        if args.salvage and not args.test:
+            nsalvaged = salvage_slot(os.path.join(workdir, "%04d" %slot), args.minage)
+            if nsalvaged >= 0:
+                if args.remainder:
+                    try:
+                        if submit_remainder(repo, workdir, slot, nextslot, nsalvaged, simconfig, batchconfig, collector):
+                            nextslot += 1
+                    except UninitException as e:
+                        logging.error("Failed submitting remainder of slot %d: %s", slot, e)
+                else:
+                    logging.info("Slot %d salvaged with %d events, not resubmitting", slot, nsalvaged)
+                continue
+            logging.warning("Salvage failed for slot %d, regenerating", slot)
         simconfig.print()
         if not args.test:
             try:
-                pwhgjob = submit_slot(repo, workdir, slot, simconfig, batchconfig)
-                checkjob = submit_check_slot(cluster, repo, workdir, slot, partition, pwhgjob)
-                jobids_check.append(checkjob)
+                submit_slot(repo, workdir, slot, simconfig, batchconfig, collector)
             except UninitException as e:
                 logging.error("Failed submitting slot: %s", e)
         else:
             # test mode: try only parsing the simulation configuration
             simconfig = parse_powheg_config(workdir, slot)
+    if not args.test:
+        try:
+            jobids_check = submit_collected(cluster, repo, workdir, partition, collector)
+        except SlurmSubmitException as e:
+            logging.error(e)
+            sys.exit(1)
     if len(jobids_check):
         submit_checks(cluster, repo, workdir, partition, jobids_check, False, True)
@@ -6,12 +6,14 @@ import os
 import sys
 
 from helpers.setup_logging import setup_logging
-from helpers.checkjob import submit_checks, submit_check_slot
+from helpers.checkdb import CheckDatabase
+from helpers.checkjob import submit_checks
 from helpers.cluster import get_cluster, get_default_partition
-from helpers.pwgsubmithandler import submit_simulation, UninitException
-from helpers.resubmithandler import get_failed_slots, next_iteration_resubmit, SlotIndexException
+from helpers.pwgsubmithandler import collect_simulation, UninitException
+from helpers.resubmithandler import get_failed_slots, get_failed_slots_db, next_iteration_resubmit, SlotIndexException
 from helpers.simconfig import SimConfig
-from helpers.slurm import SlurmConfig
+from helpers.slurm import SlurmArrayCollector, SlurmConfig, SlurmSubmitException
+from resubmit_failed import submit_collected
 
 def clean_slortdir(slotdir: str):
     # remove existing reweight file and semaphore
@@ -49,10 +51,19 @@ if __name__ == "__main__":
 
     workdir = os.path.abspath(args.workdir)
     checkfile = os.path.join(workdir, "checksummary_pwgevents.log")
-    if not os.path.exists(checkfile):
-        logging.error("Working directory %s does not provide a checksummary_pwgevents.log")
+    if CheckDatabase(workdir).exists():
+        checkresults = get_failed_slots_db(workdir)
+        failedfiles = checkresults.get_corruptedfiles()
+        badweightfiles = checkresults.get_badweightfiles()
+        if len(badweightfiles):
+            logging.warning("Files failing the weight validation, not repairable by reweighting (slots need to be regenerated):")
+            for badweightfile in badweightfiles:
+                logging.warning("    %s", badweightfile)
+    elif os.path.exists(checkfile):
+        failedfiles = get_failed_slots(checkfile).get_corruptedfiles()
+    else:
+        logging.error("Working directory %s does not provide a check database or checksummary_pwgevents.log", workdir)
         sys.exit(1)
-    failedfiles = get_failed_slots(checkfile).get_corruptedfiles()
     
     batchconfig = SlurmConfig()
     batchconfig.cluster = cluster
@@ -68,6 +79,7 @@ if __name__ == "__main__":
     simconf.workdir = os.path.dirname(workdir)
 
     jobids_check = []
+    collector = SlurmArrayCollector()
     for failed in failedfiles:
         try:
             slotID = failed.get_slotID()
@@ -93,13 +105,17 @@ if __name__ == "__main__":
             logging.info("Submitting slot: %d", simconf.minslot)
             if not args.test:
                 clean_slortdir(os.path.join(workdir, "%04d" %slotID))
-                pwhgjob = submit_simulation(repo, simconf, batchconfig, True)
-                checkjob = submit_check_slot(cluster, repo, workdir, slotID, partition, pwhgjob)
-                jobids_check.append(checkjob)
+                collect_simulation(repo, simconf, batchconfig, collector)
         except SlotIndexException as e:
             logging.error(e)   
         except UninitException as e:
             logging.error(e)
+    if not args.test:
+        try:
+            jobids_check = submit_collected(cluster, repo, workdir, partition, collector)
+        except SlurmSubmitException as e:
+            logging.error(e)
+            sys.exit(1)
     if len(jobids_check):
         jobids_check_final = submit_checks(cluster, repo, workdir, partition, jobids_check, False, True)
         logging.info("Submitting final check job under job ID %d", jobids_check_final["final"][0])
@@ -0,0 +1,11 @@
+#! /bin/bash
+
+SOURCEDIR=$1
+WORKDIR=$2
+NJOBS=$3
+
+export PYTHONPATH=$PYTHONPATH:$SOURCEDIR
+
+echo "Checking all slot directories in working directory $WORKDIR with $NJOBS processes"
+cmd=$(printf "%s/checkPwgevents.py -w %s -j %d" $SOURCEDIR $WORKDIR $NJOBS)
+eval $cmd
\ No newline at end of file
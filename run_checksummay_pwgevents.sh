@@ -2,6 +2,12 @@
 
 SOURCEDIR=$1
 WORKDIR=$2
+MODE=$3
 
-cmd=$(printf "%s/scan_check_pwgevents.py %s &> %s/checksummary_pwgevents.log" $SOURCEDIR $WORKDIR $WORKDIR)
+OPTIONS=""
+if [ "x$MODE" == "xincremental" ]; then
+    OPTIONS="--incremental"
+fi
+
+cmd=$(printf "%s/scan_check_pwgevents.py %s %s &> %s/checksummary_pwgevents.log" $SOURCEDIR $WORKDIR "$OPTIONS" $WORKDIR)
 eval $cmd
\ No newline at end of file
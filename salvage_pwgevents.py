@@ -0,0 +1,30 @@
+#! /usr/bin/env python3
+
+import argparse
+import logging
+import os
+import sys
+
+from helpers.processpool import process_slotdirs
+from helpers.salvage import DEFAULT_MINAGE, salvage_incomplete
+from helpers.setup_logging import setup_logging
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("salvage_pwgevents.py", description="Truncate incomplete pwgevents.lhe files (e.g. from jobs killed at the time limit) to the last complete event")
+    parser.add_argument("workdir", metavar="WORKDIR", type=str, help="Working directory (POWHEG_<version>)")
+    parser.add_argument("-s", "--slot", metavar="SLOT", type=int, default=-1, help="Salvage only the given slot (default: all slots with incomplete pwgevents.lhe)")
+    parser.add_argument("-m", "--minage", metavar="MINAGE", type=int, default=DEFAULT_MINAGE, help=f"Min. time in minutes since the last modification of pwgevents.lhe (default: {DEFAULT_MINAGE})")
+    parser.add_argument("-j", "--jobs", metavar="JOBS", type=int, default=1, help="Number of slot directories processed in parallel (default: 1, 0:=number of CPUs)")
+    parser.add_argument("-d", "--debug", action="store_true", help="Debug mode")
+    args = parser.parse_args()
+    setup_logging(args.debug)
+
+    workdir = os.path.abspath(args.workdir)
+    if args.slot > -1:
+        slotdirs = [os.path.join(workdir, "%04d" %args.slot)]
+    else:
+        slotdirs = [os.path.join(workdir, x) for x in sorted(os.listdir(workdir)) if x.isdigit() and os.path.isdir(os.path.join(workdir, x))]
+    nfailed = process_slotdirs(salvage_incomplete, slotdirs, args.jobs, (args.minage,), "Processed")
+    if nfailed:
+        logging.error("Salvage failed for %d slot directories", nfailed)
+        sys.exit(1)
\ No newline at end of file
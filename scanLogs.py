@@ -4,10 +4,13 @@ import argparse
 import logging
 import os
 
+from helpers.processpool import map_slotdirs
+from helpers.workfiles import list_workfiles, open_workfile
+
 def scan_file(filename: str) -> tuple:
     good = True
     host = ""
-    with open(filename, "r") as reader:
+    with open_workfile(filename) as reader:
         for line in reader:
             if "slurmstepd" in line:
                 good = False
@@ -17,11 +20,13 @@ def scan_file(filename: str) -> tuple:
         reader.close()
     return (good, host)
 
-def scan_logdir(logdir: str):
+def scan_directory(directory: str, pattern: str = "*") -> list:
+    # Plain log files and log files packed in logs.zip, returns (file, good, host) for each file
+    return [(logfile,) + scan_file(logfile) for logfile in list_workfiles(directory, pattern)]
+
+def report_bad_hosts(results: list):
     bad_hosts = []
-    for logfile in os.listdir(logdir):
-        fulllogfile = os.path.join(logdir, logfile)
-        status, host = scan_file(fulllogfile)
+    for _, status, host in results:
         if not status:
             if not host in bad_hosts:
                 bad_hosts.append(host)
@@ -33,9 +38,30 @@ def scan_logdir(logdir: str):
     else:
         logging.info("No bad host found")
 
+def scan_logdir(logdir: str):
+    report_bad_hosts(scan_directory(logdir))
+
+def scan_workdir(workdir: str, pattern: str, njobs: int = 1):
+    # Slot directories scanned in parallel
+    slotdirs = [os.path.join(workdir, x) for x in sorted(os.listdir(workdir)) if x.isdigit() and os.path.isdir(os.path.join(workdir, x))]
+    logging.info("Scanning %d slot directories", len(slotdirs))
+    results = []
+    for slotresults in map_slotdirs(scan_directory, slotdirs, njobs, (pattern,)):
+        results += slotresults
+    logging.info("Scanned %d log files", len(results))
+    report_bad_hosts(results)
+
 if __name__ == "__main__":
     parser = argparse.ArgumentParser()
-    parser.add_argument("-l", "--logdir", metavar="LOGDIR", type=str, required=True, help="Directory with logfiles")
+    parser.add_argument("-l", "--logdir", metavar="LOGDIR", type=str, default="", help="Directory with logfiles")
+    parser.add_argument("-w", "--workdir", metavar="WORKDIR", type=str, default="", help="Working directory, scan logs in all slot directories (including logs.zip)")
+    parser.add_argument("-p", "--pattern", metavar="PATTERN", type=str, default="*.log", help="Pattern of log files in slot directories (default: *.log)")
+    parser.add_argument("-j", "--jobs", metavar="JOBS", type=int, default=1, help="Number of slot directories scanned in parallel (default: 1, 0:=number of CPUs)")
     args = parser.parse_args()
     logging.basicConfig(format="[%(levelname)s] %(message)s", level=logging.INFO)
-    scan_logdir(args.logdir)
\ No newline at end of file
+    if len(args.workdir):
+        scan_workdir(args.workdir, args.pattern, args.jobs)
+    elif len(args.logdir):
+        scan_logdir(args.logdir)
+    else:
+        parser.error("Either logdir or workdir must be specified")
\ No newline at end of file
@@ -4,6 +4,9 @@ import argparse
 import logging
 import os
 from helpers import setup_logging
+from checkPwgevents import analyse_eventfiles
+from helpers.checkdb import CheckDatabase, is_record_uptodate, make_checkrecord, read_weightcheck
+from helpers.lhecompression import find_lhe
 
 class checkinfo:
 
@@ -14,6 +17,9 @@ class checkinfo:
         self.__complete = False
         self.__events = 0
         self.__weights = []
+        self.__weightcheck = None
+        self.__weightproblems = ""
+        self.__salvaged = None
 
     def set_filename(self, filename: str):
         self.__filename = filename
@@ -30,6 +36,17 @@ class checkinfo:
     def set_events(self, events: int):
         self.__events = events
 
+    def set_weightcheck(self, weightcheck: bool):
+        # None if the weights were not validated
+        self.__weightcheck = weightcheck
+
+    def set_weightproblems(self, problems: str):
+        self.__weightproblems = problems
+
+    def set_salvaged(self, salvaged: int):
+        # Number of events kept when truncating the incomplete file, None if not salvaged
+        self.__salvaged = salvaged
+
     def get_filename(self) -> str:
         return self.__filename
 
@@ -45,6 +62,15 @@ class checkinfo:
     def get_events(self) -> int:
         return self.__events
 
+    def get_weightcheck(self) -> bool:
+        return self.__weightcheck
+
+    def get_weightproblems(self) -> str:
+        return self.__weightproblems
+
+    def get_salvaged(self) -> int:
+        return self.__salvaged
+
     def add_weight(self, weight: str):
         self.__weights.append(weight)
 
@@ -76,6 +102,8 @@ class checkinfo:
     nonempty = property(fget=is_nonempty, fset=set_nonempty)
     complete = property(fget=is_complete, fset=set_complete)
     events = property(fget=get_events, fset=set_events)
+    weightcheck = property(fget=get_weightcheck, fset=set_weightcheck)
+    salvaged = property(fget=get_salvaged, fset=set_salvaged)
 
 
 def parse_checkfile(checkfile: str) -> checkinfo:
@@ -94,6 +122,12 @@ def parse_checkfile(checkfile: str) -> checkinfo:
                 result.complete = True if value == "yes" else False
             elif key == "events":
                 result.events = int(value)
+            elif key == "salvaged":
+                result.salvaged = int(value)
+            elif key == "weightcheck":
+                result.weightcheck = True if value == "ok" else False
+            elif key in ["missingweights", "nonfiniteweights", "extremeweights", "badcentralweights"] and len(value) and value != "0":
+                result.set_weightproblems("{}{}{}: {}".format(result.get_weightproblems(), "; " if len(result.get_weightproblems()) else "", key.replace("weights", ""), value))
             elif key == "weights":
                 weights = value.split(",")
                 for weight in weights:
@@ -111,7 +145,73 @@ def find_checkfiles(workdir: str) -> list:
                 result.append(os.path.join(root, fl))
     return sorted(result)
 
-def build_checkinfos(workdir: str) -> list:
+def find_slotdirs(workdir: str) -> list:
+    return sorted([x for x in os.listdir(workdir) if x.isdigit() and os.path.isdir(os.path.join(workdir, x))])
+
+def make_checkinfo(record: dict) -> checkinfo:
+    result = checkinfo(os.path.join(os.path.dirname(record["eventfile"]), "check_pwgevents.txt"))
+    result.exists = record["exists"]
+    result.nonempty = record["nonempty"]
+    result.complete = record["complete"]
+    if record["events"] is not None:
+        result.events = record["events"]
+    for weight in record["weights"]:
+        result.add_weight(weight)
+    result.salvaged = record.get("salvaged")
+    weightcheck = record.get("weightcheck")
+    if weightcheck:
+        result.weightcheck = weightcheck["ok"]
+        problems = []
+        for key in ["missing", "nonfinite", "extreme"]:
+            if len(weightcheck[key]):
+                problems.append("{}: {}".format(key, ", ".join(["{}={}".format(weight, count) for weight, count in weightcheck[key].items()])))
+        if weightcheck["badcentral"]:
+            problems.append("badcentral: {}".format(weightcheck["badcentral"]))
+        result.set_weightproblems("; ".join(problems))
+    return result
+
+def build_checkinfos_from_db(workdir: str) -> list:
+    checkdb = CheckDatabase(workdir)
+    records = checkdb.get_records()
+    # Slots not yet in the database (i.e. checked by older versions) are imported from their check files
+    imported = []
+    slotdirs = find_slotdirs(workdir)
+    for slot in slotdirs:
+        if slot in records:
+            continue
+        checkfile = os.path.join(workdir, slot, "check_pwgevents.txt")
+        if not os.path.exists(checkfile):
+            continue
+        info = parse_checkfile(checkfile)
+        record = make_checkrecord(slot, make_eventfile(checkfile), info.exists, info.nonempty, info.events, info.complete, info.get_list_of_weights(),
+                                  weightcheck=read_weightcheck(checkfile, info.events), salvaged=info.salvaged)
+        records[slot] = record
+        imported.append(record)
+    if len(imported):
+        logging.debug("Importing %d check files into check database %s", len(imported), checkdb.get_filename())
+        checkdb.add_records(imported)
+    # Records of removed slot directories are ignored, as in the scan of the check files
+    return [make_checkinfo(records[x]) for x in slotdirs if x in records]
+
+def update_checks(workdir: str, njobs: int = 0):
+    # Re-check only slots whose pwgevents.lhe changed (size, mtime, inode) since the last recorded check
+    workdir = os.path.abspath(workdir)
+    records = CheckDatabase(workdir).get_records()
+    changed = []
+    for slot in find_slotdirs(workdir):
+        eventfile = os.path.join(workdir, slot, "pwgevents.lhe")
+        eventfile = find_lhe(eventfile) or eventfile
+        if slot in records and is_record_uptodate(records[slot], eventfile):
+            continue
+        changed.append(eventfile)
+    logging.info("Number of slots to be re-checked:   %d", len(changed))
+    if len(changed):
+        analyse_eventfiles(workdir, changed, "check_pwgevents.txt", njobs)
+
+def build_checkinfos(workdir: str, usedb: bool = True) -> list:
+    workdir = os.path.abspath(workdir)
+    if usedb and CheckDatabase(workdir).exists():
+        return build_checkinfos_from_db(workdir)
     return [parse_checkfile(x) for x in find_checkfiles(workdir)]
 
 def get_total_events(infos: list) -> int:
@@ -155,6 +255,15 @@ def get_number_allweights(infos: list, weighttypes: list) -> int:
 def filter_not_allweights(infos: list, weighttypes: list) -> list:
     return [x for x in infos if x.nonempty and not x.has_all_weights(weighttypes)]
 
+def get_number_weightchecked(infos: list) -> int:
+    return len([x for x in infos if x.weightcheck is not None])
+
+def filter_failed_weightcheck(infos: list) -> list:
+    return [x for x in infos if x.weightcheck is False]
+
+def filter_salvaged(infos: list) -> list:
+    return [x for x in infos if x.salvaged is not None]
+
 def get_weightypestring(weighttypes: list) -> str:
     result = ""
     first = True
@@ -167,22 +276,28 @@ def get_weightypestring(weighttypes: list) -> str:
     return result
 
 def make_eventfile(checkfile: str):
-    return checkfile.replace("check_pwgevents.txt", "pwgevents.lhe")
+    eventfile = checkfile.replace("check_pwgevents.txt", "pwgevents.lhe")
+    return find_lhe(eventfile) or eventfile
 
-def analyse(workdir: str):
-    infos = build_checkinfos(workdir)
+def analyse(workdir: str, usedb: bool = True, incremental: bool = False, njobs: int = 0):
+    if incremental:
+        update_checks(workdir, njobs)
+    infos = build_checkinfos(workdir, usedb or incremental)
     logging.info("Number of checkinfos:               %d", get_number_checkinfos(infos))
     logging.info("Number of existing files:           %d", get_number_existing(infos))
     logging.info("Number of nonempty files:           %d", get_number_nonempty(infos))
     logging.info("Number of complete files:           %d", get_number_complete(infos))
     allweights = get_weighttypes(infos)
     logging.info("Number of files with all weights:   %d", get_number_allweights(infos, allweights))
+    logging.info("Number of weight-validated files:   %d", get_number_weightchecked(infos))
     logging.info("Number of events:                   %d", get_total_events(infos))
     logging.info("Found weight IDs:                   %s", get_weightypestring(allweights))
     files_nonexisting = filter_nonexisting(infos)
     files_empty = filter_empty(infos)
     files_incomplete = filter_incomplete(infos)
     files_notallweights = filter_not_allweights(infos, allweights)
+    files_badweights = filter_failed_weightcheck(infos)
+    files_salvaged = filter_salvaged(infos)
     if len(files_nonexisting):
         logging.info("Non-existing pwgevents.lhe files:")
         for fl in files_nonexisting:
@@ -203,12 +318,25 @@ def analyse(workdir: str):
         for fl in files_notallweights:
             logging.info("%s (missing: %s)", make_eventfile(fl.filename), get_weightypestring(fl.get_missing_weights(allweights)))
         logging.info("----------------------------------------")
+    if len(files_salvaged):
+        logging.info("Salvaged pwgevents.lhe files (truncated to the last complete event):")
+        for fl in files_salvaged:
+            logging.info("%s (%d events)", make_eventfile(fl.filename), fl.salvaged)
+        logging.info("----------------------------------------")
+    if len(files_badweights):
+        logging.info("pwgevents.lhe files failing the weight validation:")
+        for fl in files_badweights:
+            logging.info("%s (%s)", make_eventfile(fl.filename), fl.get_weightproblems())
+        logging.info("----------------------------------------")
 
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser("scan_check_pwgevents.py")
     parser.add_argument("workdir", metavar="WORKDIR", type=str, help="Working directory")
+    parser.add_argument("-w", "--walk", action="store_true", help="Ignore check database and scan all check_pwgevents.txt files")
+    parser.add_argument("-i", "--incremental", action="store_true", help="Re-check slots with changed pwgevents.lhe before building the summary")
+    parser.add_argument("-j", "--jobs", metavar="JOBS", type=int, default=0, help="Number of parallel processes for re-checking (default: 0:=all available CPUs)")
     parser.add_argument("-d", "--debug", action="store_true", help="Debug mode")
     args = parser.parse_args()
     setup_logging.setup_logging(args.debug)
-    analyse(args.workdir)
\ No newline at end of file
+    analyse(args.workdir, not args.walk, args.incremental, args.jobs)
\ No newline at end of file
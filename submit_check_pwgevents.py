@@ -14,6 +14,7 @@ if __name__ == "__main__":
     parser.add_argument("-p", "--partition", metavar="PARTITION", type=str, default="default", help="Partition")
     parser.add_argument("-s", "--single", action="store_true", help="Submit single check job")
     parser.add_argument("-f", "--final", action="store_true", help="Only submit final summary job")
+    parser.add_argument("-j", "--jobs", metavar="JOBS", type=int, default=0, help="Check all slots in a single job with JOBS processes (default: 0:=one array task per slot)")
     parser.add_argument("--slot", metavar="SLOT", type=int, default=-1, help="Specific slot (if requested)")
     parser.add_argument("--mem", metavar="MEMORY", type=int, default=4, help="Memory request in GB (default: 4 GB)" )
     parser.add_argument("--hours", metavar="HOURS", type=int, default=10, help="Max. numbers of hours for slot (default: 10)")
@@ -32,4 +33,4 @@ if __name__ == "__main__":
     if args.slot > -1:
         submit_check_slot(cluster, repo, args.workdir, args.slot, partition, [])
     else:
-        submit_checks(cluster, repo, args.workdir, partition, [], False if args.single else True, args.final)
+        submit_checks(cluster, repo, os.path.abspath(args.workdir), partition, [], False if args.single else True, args.final, args.jobs)
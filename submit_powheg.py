@@ -2,6 +2,7 @@
 
 import os
 import argparse
+import asyncio
 import logging
 import sys
 from helpers.checkjob import submit_checks
@@ -15,6 +16,7 @@ from helpers.setup_logging import setup_logging
 from helpers.simconfig import SimConfig
 from helpers.slurm import SlurmConfig
 from helpers.workdir import find_index_of_input_file_range
+from watch_production import watch_production
 
 repo = os.path.dirname(os.path.abspath(sys.argv[0]))
 
@@ -38,6 +40,9 @@ if __name__ == "__main__":
     parser.add_argument("-v", "--version", metavar="VERSION", type=str, default="all", help="POWEHG version")
     parser.add_argument("-p", "--partition", metavar="PARTITION", type=str, default="default", help="Partition")
     parser.add_argument("-g", "--grids", metavar="GRIDS", type=str, default="NONE", help="Old grids (default: NONE")
+    parser.add_argument("--linkgrids", action="store_true", help="Symlink old grids into the slot directories instead of copying them (grid directories with read-only grid files only)")
+    parser.add_argument("--gridcache", action="store_true", help="Stage old grids via a node-local grid cache shared by the slots on the same node")
+    parser.add_argument("--scratch", action="store_true", help="Run slots in node-local scratch directories, results are staged out to the slot directories")
     parser.add_argument("--process", metavar="PROCESS", type=str, default="dijet", help="Process (default: dijet)")
     parser.add_argument("--scalereweight", action="store_true", help="Run scale reweight")
     parser.add_argument("--minpdf", metavar="MINPDF", type=int, default=-1, help="PDF reweight min. PDF")
@@ -45,6 +50,7 @@ if __name__ == "__main__":
     parser.add_argument("--minweightid", metavar="MINWEIGHTID", type=int, default=0, help="PDF reweight min weight ID")
     parser.add_argument("--mem", metavar="MEMORY", type=int, default=4, help="Memory request in GB (default: 4 GB)" )
     parser.add_argument("--hours", metavar="HOURS", type=int, default=10, help="Max. numbers of hours for slot (default: 10)")
+    parser.add_argument("--watch", action="store_true", help="Monitor production and check/resubmit slots as soon as they finish instead of submitting dependent check jobs")
     parser.add_argument("-d", "--debug", action="store_true", help="Debug mode")
     args = parser.parse_args()
     setup_logging(args.debug)
@@ -69,6 +75,9 @@ if __name__ == "__main__":
     simconfig = SimConfig()
     simconfig.workdir = args.workdir
     simconfig.gridrepository = args.grids
+    simconfig.linkgrids = args.linkgrids
+    simconfig.gridcache = args.gridcache
+    simconfig.scratch = args.scratch
     simconfig.nevents = args.events
     simconfig.powheginput = args.input
     simconfig.process = args.process
@@ -98,6 +107,9 @@ if __name__ == "__main__":
             sys.exit(1)
 
     simconfig.minslot = minslot
+    if args.watch and (simconfig.is_scalereweight() or simconfig.is_pdfreweight()):
+        logging.error("Watch mode only supported for event generation")
+        sys.exit(1)
 
     batchconfig = SlurmConfig()
     batchconfig.cluster = cluster
@@ -124,10 +136,15 @@ if __name__ == "__main__":
             sys.exit(1)
         releases.append(args.version)
         print("Simulating with POWHEG: {}".format(releases))
+    watchers = []
     for pwhg in releases:
         simconfig.powhegversion = pwhg
         pwhgjob = submit_simulation(repo, simconfig, batchconfig)
         logging.info("Job ID for POWHEG %s: %d", pwhg, pwhgjob)
+        if args.watch:
+            slots = [x for x in range(minslot, minslot + njobs)]
+            watchers.append(watch_production(repo, os.path.abspath(build_workdir_for_pwhg(args.workdir, pwhg)), batchconfig, pwhgjob, slots, minslot))
+            continue
 
         # submit checking job
         # must run as extra job, not guarenteed that the production job finished
@@ -136,3 +153,8 @@ if __name__ == "__main__":
             # launch automatic resubmission of failed jobs
             jobid_resubmit = next_iteration_resubmit(repo, cluster, os.path.join(args.workdir, "POWHEG_{}".format(args.version)), partition, args.version, args.process, args.mem, args.hours, args.scalereweight, args.minweightid, args.minpdf, jobids_check["final"][0])
 	
+    if len(watchers):
+        # all POWHEG releases are monitored concurrently
+        async def watch_all():
+            return await asyncio.gather(*watchers)
+        asyncio.run(watch_all())
\ No newline at end of file
@@ -14,6 +14,7 @@ if __name__ == "__main__":
     parser = argparse.ArgumentParser("submit_repack_grids.py")
     parser.add_argument("workdir", metavar="WORKDIR", type=str, help="Working directory")
     parser.add_argument("-g", "--gridarchive", metavar="GRIDARCHIVE", type=str, default="grids.zip", help="Name of the grid archive")
+    parser.add_argument("-j", "--jobs", metavar="JOBS", type=int, default=1, help="Number of slot directories packed in parallel, requested as CPUs of the pack job (default: 1)")
     parser.add_argument("-d", "--debug", action="store_true", help="Debug mode")
     parser.add_argument("-t", "--test", action="store_true", help="Test mode")
     args = parser.parse_args()
@@ -26,9 +27,9 @@ if __name__ == "__main__":
 
     workdir = os.path.abspath(args.workdir)
     executable = os.path.join(repo, "repack_grids_runner.sh")
-    cmd=f"{executable} {repo} {workdir} {args.gridarchive}"
+    cmd=f"{executable} {repo} {workdir} {args.gridarchive} {args.jobs}"
     logging.info("Launing: %s", cmd)
     if not args.test:
         logfile = os.path.join(workdir, "logs", "gridsrepack.log")
-        jobid = submit(cmd, cluster, "repack_grids", logfile, get_fast_partition(cluster))
+        jobid = submit(cmd, cluster, "repack_grids", logfile, get_fast_partition(cluster), cpus=args.jobs)
         logging.info("Submitted pack job under job ID %d", jobid)
\ No newline at end of file
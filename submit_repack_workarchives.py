@@ -13,6 +13,7 @@ if __name__ == "__main__":
     repo = os.path.dirname(os.path.abspath(sys.argv[0]))
     parser = argparse.ArgumentParser("submit_repack_workarchives.py")
     parser.add_argument("workdir", metavar="WORKDIR", type=str, help="Working directory")
+    parser.add_argument("-j", "--jobs", metavar="JOBS", type=int, default=1, help="Number of slot directories packed in parallel, requested as CPUs of the pack job (default: 1)")
     parser.add_argument("-d", "--debug", action="store_true", help="Debug mode")
     parser.add_argument("-t", "--test", action="store_true", help="Test mode")
     args = parser.parse_args()
@@ -25,9 +26,9 @@ if __name__ == "__main__":
 
     workdir = os.path.abspath(args.workdir)
     executable = os.path.join(repo, "repack_workarchives_runner.sh")
-    cmd=f"{executable} {repo} {workdir}"
+    cmd=f"{executable} {repo} {workdir} {args.jobs}"
     logging.info("Launing: %s", cmd)
     if not args.test:
         logfile = os.path.join(workdir, "logs", "workarchivesrepack.log")
-        jobid = submit(cmd, cluster, "repack_archives", logfile, get_fast_partition(cluster))
+        jobid = submit(cmd, cluster, "repack_archives", logfile, get_fast_partition(cluster), cpus=args.jobs)
         logging.info("Submitted pack job under job ID %d", jobid)
\ No newline at end of file
@@ -0,0 +1,30 @@
+#! /usr/bin/env python3
+
+# Stand-in for sbatch for testing submissions without Slurm, use via
+#   export POWHEGVAR_SBATCH=<repo>/tests/fake_sbatch.py
+# The command line of each submission is appended to $FAKE_SBATCH_LOG (if set),
+# job IDs are incremented from $FAKE_SBATCH_FIRSTID (default: 1000).
+
+import os
+import sys
+
+def next_jobid() -> int:
+    counterfile = os.getenv("FAKE_SBATCH_COUNTER", "/tmp/fake_sbatch_counter")
+    jobid = int(os.getenv("FAKE_SBATCH_FIRSTID", "1000"))
+    if os.path.exists(counterfile):
+        with open(counterfile, "r") as counterreader:
+            jobid = int(counterreader.read().strip()) + 1
+    with open(counterfile, "w") as counterwriter:
+        counterwriter.write(f"{jobid}\n")
+    return jobid
+
+if __name__ == "__main__":
+    jobid = next_jobid()
+    logfile = os.getenv("FAKE_SBATCH_LOG")
+    if logfile:
+        with open(logfile, "a") as logwriter:
+            logwriter.write("{}: {}\n".format(jobid, " ".join(sys.argv[1:])))
+    if "--parsable" in sys.argv:
+        print(jobid)
+    else:
+        print(f"Submitted batch job {jobid}")
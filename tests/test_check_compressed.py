@@ -0,0 +1,37 @@
+#! /usr/bin/env python3
+
+# Check of a slot with compressed event file through the single-file path
+# (checkPwgevents.py -i <slot>/pwgevents.lhe as used by the check jobs), run with
+#   python3 -m pytest tests/test_check_compressed.py
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from checkPwgevents import analyse_pwgevents
+from helpers.checkdb import CheckDatabase
+from helpers.lhecompression import compress_lhe
+
+HEADER = "<LesHouchesEvents version=\"3.0\">\n<header>\n<initrwgt>\n<weight id='11'> muR=1 </weight>\n</initrwgt>\n</header>\n<init>\n</init>\n"
+EVENT = "<event>\n 2 10001 1.0 10. 0.0078 0.12\n 1 -1 0 0 0 0 0 0 1 1 0 0 9\n 2 1 1 1 0 0 0 0 1 1 0 0 9\n<rwgt>\n<wgt id='11'> 1.0 </wgt>\n</rwgt>\n</event>\n"
+NEVENTS = 5
+
+def test_compressed_slot(tmp_path):
+    slotdir = tmp_path / "POWHEG_test" / "0001"
+    slotdir.mkdir(parents=True)
+    eventfile = str(slotdir / "pwgevents.lhe")
+    with open(eventfile, "w") as eventwriter:
+        eventwriter.write(HEADER + EVENT * NEVENTS + "</LesHouchesEvents>\n")
+    compressed = compress_lhe(eventfile, "gzip")
+    assert not os.path.exists(eventfile)
+
+    record = analyse_pwgevents(eventfile, "check_pwgevents.txt")
+    assert record["exists"] and record["complete"]
+    assert record["events"] == NEVENTS
+    assert record["eventfile"] == os.path.abspath(compressed)
+    with open(slotdir / "check_pwgevents.txt", "r") as summaryreader:
+        summary = summaryreader.read()
+    assert "exists: yes" in summary
+    assert f"events: {NEVENTS}" in summary
+    assert CheckDatabase(str(tmp_path / "POWHEG_test")).get_records()["0001"]["exists"]
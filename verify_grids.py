@@ -0,0 +1,44 @@
+#! /usr/bin/env python3
+
+import argparse
+import logging
+import os
+import sys
+
+from helpers.gridverify import find_grid_archives, verify_archives, write_report
+from helpers.setup_logging import setup_logging
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser("verify_grids.py", description="Verify CRCs and completeness of grid archives and grid manifests")
+    parser.add_argument("inputs", metavar="INPUT", type=str, nargs="+", help="Grid archives, grid manifests or production directories (searched for grids.zip and gridmanifest.json)")
+    parser.add_argument("-j", "--jobs", metavar="JOBS", type=int, default=0, help="Number of archives verified in parallel (default: 0:=number of CPUs)")
+    parser.add_argument("-o", "--output", metavar="REPORT", type=str, default="", help="JSON report file")
+    parser.add_argument("--deep", action="store_true", help="Recalculate SHA-256 of grid store objects for manifests")
+    parser.add_argument("-d", "--debug", action="store_true", help="Debug mode")
+    args = parser.parse_args()
+    setup_logging(args.debug)
+
+    archives = []
+    for inputpath in args.inputs:
+        inputpath = os.path.abspath(inputpath)
+        if os.path.isdir(inputpath):
+            archives += find_grid_archives(inputpath)
+        elif os.path.exists(inputpath):
+            archives.append(inputpath)
+        else:
+            logging.error("Input %s not existing", inputpath)
+    if not len(archives):
+        logging.error("No grid archives found")
+        sys.exit(1)
+    logging.info("Verifying %d grid archives", len(archives))
+    results = verify_archives(archives, args.jobs, args.deep)
+    failed = [x["archive"] for x in results if not x["ok"]]
+    if len(args.output):
+        write_report(results, args.output)
+        logging.info("Report written to %s", args.output)
+    logging.info("%d of %d grid archives OK", len(results) - len(failed), len(results))
+    if len(failed):
+        logging.error("Bad grid archives:")
+        for archive in failed:
+            logging.error("    %s", archive)
+        sys.exit(1)
\ No newline at end of file
@@ -0,0 +1,171 @@
+#! /usr/bin/env python3
+
+import argparse
+import asyncio
+import logging
+import os
+import sys
+
+from helpers.checkdb import CheckDatabase
+from helpers.checkjob import collect_check_job_slot, submit_check_summary
+from helpers.cluster import get_cluster, get_default_partition
+from helpers.pwgsubmithandler import UninitException
+from helpers.setup_logging import setup_logging
+from helpers.slurm import SlurmArrayCollector, SlurmConfig, SlurmSubmitException
+from helpers.slurmpoller import JobStatePoller, MockSlurmBackend, is_failed_state
+from resubmit_failed import parse_powheg_config, submit_slot
+
+class ProductionController(object):
+    # Replaces the afterany chain (check array -> check summary -> resubmission)
+    # of a production: finished simulation tasks are checked right away, failed
+    # tasks and slots failing the check are resubmitted without waiting for the
+    # rest of the array. Submissions of one poll cycle are batched into arrays.
+
+    def __init__(self, repo: str, workdir: str, batchconfig: SlurmConfig, maxretries: int = 3):
+        self.__repo = repo
+        self.__workdir = workdir
+        self.__batchconfig = batchconfig
+        self.__maxretries = maxretries
+        self.__retries = {}
+        self.__done = []
+        self.__failed = []
+        self.__poller = None
+
+    def get_done(self) -> list:
+        return sorted(self.__done)
+
+    def get_failed(self) -> list:
+        return sorted(self.__failed)
+
+    def add_simulation(self, jobid: int, slots: list, minslot: int = 0):
+        # Array tasks of the simulation job, task index is the slot minus minslot
+        self.__poller.track(jobid, [x - minslot for x in slots], ("simulation", minslot))
+
+    def set_poller(self, poller: JobStatePoller):
+        self.__poller = poller
+
+    async def handle(self, finished: list):
+        tocheck = []
+        toresubmit = []
+        records = None
+        for jobid, task, state, payload in finished:
+            jobtype, minslot = payload
+            slot = task + minslot if task is not None else minslot
+            logging.info("%s job %d for slot %d finished with state %s", jobtype, jobid, slot, state)
+            if jobtype == "simulation":
+                if is_failed_state(state):
+                    toresubmit.append(slot)
+                else:
+                    tocheck.append(slot)
+            else:
+                if is_failed_state(state):
+                    # check job itself failed, check again
+                    if self.__count_retry(slot):
+                        tocheck.append(slot)
+                    continue
+                if records is None:
+                    records = CheckDatabase(self.__workdir).get_records()
+                record = records.get("%04d" %slot)
+                if record and record["exists"] and record["nonempty"] and record["complete"]:
+                    self.__done.append(slot)
+                else:
+                    toresubmit.append(slot)
+        toresubmit = [x for x in toresubmit if self.__count_retry(x)]
+        # sbatch calls are blocking, run them outside the event loop
+        if len(tocheck):
+            await asyncio.to_thread(self.__submit_checks, tocheck)
+        if len(toresubmit):
+            await asyncio.to_thread(self.__resubmit, toresubmit)
+
+    async def run(self):
+        await self.__poller.run(self.handle)
+        logging.info("Production in %s finished: %d slots done, %d slots failed", self.__workdir, len(self.__done), len(self.__failed))
+        if len(self.__failed):
+            logging.error("Slots failed after %d retries: %s", self.__maxretries, ", ".join(["{}".format(x) for x in self.get_failed()]))
+
+    def __count_retry(self, slot: int) -> bool:
+        nretries = self.__retries.get(slot, 0)
+        if nretries >= self.__maxretries:
+            logging.error("Slot %d exceeded max. number of retries", slot)
+            self.__failed.append(slot)
+            return False
+        self.__retries[slot] = nretries + 1
+        return True
+
+    def __submit_checks(self, slots: list):
+        collector = SlurmArrayCollector()
+        for slot in slots:
+            collect_check_job_slot(self.__batchconfig.cluster, self.__repo, self.__workdir, slot, self.__batchconfig.partition, collector)
+        try:
+            for slot, jobid in collector.submit().items():
+                # array task ID is the slot minus the offset of its array job
+                offset = collector.get_offset(slot)
+                self.__poller.track(jobid, [slot - offset], ("check", offset))
+        except SlurmSubmitException as e:
+            logging.error(e)
+            self.__failed.extend(slots)
+
+    def __resubmit(self, slots: list):
+        collector = SlurmArrayCollector()
+        for slot in slots:
+            simconfig = parse_powheg_config(self.__workdir, slot)
+            if not simconfig:
+                logging.error("Failed to parse simulation params for slot: %d", slot)
+                self.__failed.append(slot)
+                continue
+            try:
+                submit_slot(self.__repo, self.__workdir, slot, simconfig, self.__batchconfig, collector)
+            except UninitException as e:
+                logging.error("Failed submitting slot: %s", e)
+                self.__failed.append(slot)
+        try:
+            for slot, jobid in collector.submit().items():
+                # array task ID is the slot minus the offset of its array job
+                offset = collector.get_offset(slot)
+                self.__poller.track(jobid, [slot - offset], ("simulation", offset))
+        except SlurmSubmitException as e:
+            logging.error(e)
+            self.__failed.extend(slots)
+
+async def watch_production(repo: str, workdir: str, batchconfig: SlurmConfig, jobid: int, slots: list, minslot: int = 0, interval: int = 60, maxretries: int = 3, backend = None) -> ProductionController:
+    controller = ProductionController(repo, workdir, batchconfig, maxretries)
+    controller.set_poller(JobStatePoller(backend, interval))
+    controller.add_simulation(jobid, slots, minslot)
+    await controller.run()
+    if len(controller.get_done()):
+        submit_check_summary(batchconfig.cluster, repo, workdir, batchconfig.partition, 2, 1, [], True)
+    return controller
+
+if __name__ == "__main__":
+    repo = os.path.dirname(os.path.abspath(sys.argv[0]))
+    parser = argparse.ArgumentParser("watch_production.py", description="Check and resubmit slots of a running production as soon as they finish")
+    parser.add_argument("workdir", metavar="WORKDIR", type=str, help="Working directory (POWHEG_<version>)")
+    parser.add_argument("-j", "--jobid", metavar="JOBID", type=int, required=True, help="Job ID of the simulation array")
+    parser.add_argument("-n", "--njobs", metavar="NJOBS", type=int, required=True, help="Number of slots in the simulation array")
+    parser.add_argument("-m", "--minslot", metavar="MINSLOT", type=int, default=0, help="Min. slot ID")
+    parser.add_argument("-p", "--partition", metavar="PARTITION", type=str, default="default", help="Partition")
+    parser.add_argument("--mem", metavar="MEMORY", type=int, default=4, help="Memory request in GB for resubmissions (default: 4 GB)" )
+    parser.add_argument("--hours", metavar="HOURS", type=int, default=10, help="Max. numbers of hours for resubmitted slots (default: 10)")
+    parser.add_argument("--interval", metavar="INTERVAL", type=int, default=60, help="Polling interval in seconds (default: 60)")
+    parser.add_argument("--retries", metavar="RETRIES", type=int, default=3, help="Max. number of resubmissions per slot (default: 3)")
+    parser.add_argument("--mock", action="store_true", help="Use mock Slurm backend (testing, combine with POWHEGVAR_SBATCH)")
+    parser.add_argument("-d", "--debug", action="store_true", help="Debug mode")
+    args = parser.parse_args()
+    setup_logging(args.debug)
+
+    cluster = get_cluster()
+    if cluster == None:
+        logging.error("Failed to detect computing cluster")
+        sys.exit(1)
+
+    batchconfig = SlurmConfig()
+    batchconfig.cluster = cluster
+    batchconfig.partition = args.partition if args.partition != "default" else get_default_partition(cluster)
+    batchconfig.njobs = 1
+    batchconfig.memory = args.mem
+    batchconfig.hours = args.hours
+
+    slots = [x for x in range(args.minslot, args.minslot + args.njobs)]
+    controller = asyncio.run(watch_production(repo, os.path.abspath(args.workdir), batchconfig, args.jobid, slots, args.minslot, args.interval, args.retries, MockSlurmBackend() if args.mock else None))
+    if len(controller.get_failed()):
+        sys.exit(1)